@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+AI Receptionist Webhook Server (ASGI)
+Asyncio version of the server.py routes: provider calls are awaited, so one
+process can hold hundreds of calls waiting on the LLM at the same time.
+
+With MEDIA_STREAM_URL set, incoming calls are answered with <Connect><Stream>
+and the conversation runs over the media stream websocket at MEDIA_STREAM_PATH
+(see media_stream.py) instead of one <Record> webhook per turn.
+
+Run with:
+    uvicorn asgi_server:app --host 0.0.0.0 --port $PORT
+    gunicorn asgi_server:app -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:$PORT
+
+Environment:
+    MEDIA_STREAM_URL    public wss:// URL of the media stream endpoint; enables streamed calls
+    MEDIA_STREAM_PATH   websocket path served here (default /media-stream)
+"""
+
+import asyncio
+import json
+import os
+import time
+import urllib.parse
+from datetime import datetime
+
+import call_store
+import http_client
+import intents
+import jobs
+import media_stream
+import metrics
+import prompt_audio
+import response_cache
+import router
+import semantic_cache
+import server
+import twiml
+
+MEDIA_STREAM_URL = os.getenv('MEDIA_STREAM_URL', '')
+MEDIA_STREAM_PATH = os.getenv('MEDIA_STREAM_PATH', '/media-stream')
+
+TWIML_HEADERS = [(b'content-type', b'text/xml; charset=utf-8')]
+JSON_HEADERS = [(b'content-type', b'application/json')]
+
+_in_flight = 0
+_max_in_flight = 0
+
+
+async def generate_claude_response(message, timeout=None):
+    """Generate response using Claude AI"""
+    url = f"{server.CLAUDE_BASE_URL}/v1/messages"
+    headers = {
+        "x-api-key": server.CLAUDE_API_KEY,
+        "Content-Type": "application/json",
+        "anthropic-version": "2023-06-01"
+    }
+    payload = server.claude_payload(message)
+    response = await http_client.apost(url, headers=headers, json=payload, timeout=timeout or router.BUDGETS['claude'])
+    response.raise_for_status()
+    return response.json()['content'][0]['text']
+
+
+async def generate_openai_response(message, timeout=None):
+    """Generate response using OpenAI"""
+    url = f"{server.OPENAI_BASE_URL}/v1/chat/completions"
+    headers = {
+        "Authorization": f"Bearer {server.OPENAI_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    payload = server.openai_payload(message)
+    response = await http_client.apost(url, headers=headers, json=payload, timeout=timeout or router.BUDGETS['openai'])
+    response.raise_for_status()
+    return response.json()['choices'][0]['message']['content']
+
+
+GENERATORS = {'openai': generate_openai_response, 'claude': generate_claude_response}
+ROUTER = router.Router(
+    [router.Provider(name, acall=lambda message, call_sid, timeout, name=name: GENERATORS[name](message, timeout))
+     for name in server.routed_providers()],
+    fallback=server.generate_fallback_response, primary=server.AI_PROVIDER)
+
+
+async def generate_ai_response(message, cacheable=False):
+    """Generate AI response using Claude or OpenAI, hedged and with a deadline (see router.py)
+
+    Fixed menu / instruction prompts pass cacheable=True to be answered from the response cache.
+    """
+    cache_key = server.prompt_cache_key(message) if cacheable else None
+    cached = response_cache.cache.lookup(cache_key)
+    if cached is not None:
+        return cached
+    with metrics.span('llm'):
+        text, provider = await ROUTER.acomplete(message)
+    if provider != 'fallback':
+        response_cache.cache.store(cache_key, text)
+    return text
+
+
+STREAM_GREETING = twiml.ALICE.prompt("¡Hola! Soy Jenni, tu recepcionista virtual. ¿En qué puedo ayudarte hoy?")
+STREAM_GOODBYE = "Perfecto, he tomado nota de todo. ¡Que tengas un buen día!"
+
+
+# call_store, semantic_cache and jobs are synchronous (sqlite / redis / file locks);
+# handlers run them on a worker thread so one slow store does not stall every call on the loop
+
+async def media_reply(call_sid, text, parameters):
+    """Answer one utterance heard on a media stream: (answer, ends_call)"""
+    if intents.is_end_of_conversation(text):
+        await asyncio.to_thread(call_store.end_call, call_sid)
+        await asyncio.to_thread(server.queue_call_summary, call_sid)
+        return STREAM_GOODBYE, True
+    answer = await asyncio.to_thread(semantic_cache.lookup, text) or await generate_ai_response(text)
+    await asyncio.to_thread(call_store.append_turn, call_sid, text, answer, caller=parameters.get('From', ''))
+    return answer, False
+
+
+async def handle_incoming_call(form):
+    """Handle incoming call from Twilio"""
+    print(f"📞 Incoming call: {form.get('CallSid')} from {form.get('From')} to {form.get('To')}")
+    await asyncio.to_thread(call_store.start_call, form.get('CallSid'), form.get('From'))
+    if MEDIA_STREAM_URL:
+        return twiml.document(STREAM_GREETING, twiml.connect_stream(MEDIA_STREAM_URL, From=form.get('From')),
+                              twiml.HANGUP)
+    return server.GREETING_TWIML
+
+
+async def handle_gather(form):
+    """Handle user input from Gather"""
+    digits = form.get('Digits')
+    print(f"📱 User pressed: {digits} for call {form.get('CallSid')}")
+
+    if digits == '1':
+        response_text = await generate_ai_response("El visitante pidió información. Proporciona información útil sobre la empresa.",
+                                                   cacheable=True)
+        return server.info_twiml(response_text)
+    if digits == '2':
+        return server.TRANSFER_TWIML
+    if digits == '3':
+        return server.LEAVE_MESSAGE_TWIML
+    return server.INVALID_OPTION_TWIML
+
+
+async def handle_recording(form):
+    """Handle recording from Twilio"""
+    recording_url = form.get('RecordingUrl')
+    recording_duration = form.get('RecordingDuration')
+    print(f"🎙️ Recording received: {recording_url} for call {form.get('CallSid')}, duration: {recording_duration}")
+
+    if form.get('CallStatus') in call_store.ENDED_STATUSES:
+        await asyncio.to_thread(server.queue_call_summary, form.get('CallSid'))
+    if recording_url and recording_duration and int(recording_duration) > 0:
+        await asyncio.to_thread(server.queue_recording, form)
+        if form.get('RecordingSid'):
+            return twiml.document(twiml.redirect(f"/webhook/continue?recording={form['RecordingSid']}"))
+        return await acknowledge_recording()
+    return server.NO_AUDIO_TWIML
+
+
+async def acknowledge_recording():
+    """Generic reply to a recording whose answer is not ready"""
+    ai_response = await generate_ai_response("Responde como Jenni, una recepcionista real. Usa expresiones como 'Perfecto', 'Entiendo', 'Claro que sí'. Sé empática y útil.",
+                                             cacheable=True)
+    return server.reply_twiml(ai_response)
+
+
+async def handle_continue(form):
+    """Speak the answer to a recording once the background job has stored it"""
+    recording_sid = form.get('recording')
+    deadline = time.monotonic() + server.RECORDING_REPLY_WAIT
+    answer = await asyncio.to_thread(server.recording_reply, form.get('CallSid'), recording_sid)
+    while answer is None and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+        answer = await asyncio.to_thread(server.recording_reply, form.get('CallSid'), recording_sid)
+    if answer is None:
+        return await acknowledge_recording()
+    return server.reply_twiml(answer) if answer else server.NO_AUDIO_TWIML
+
+
+async def handle_recording_status(form):
+    """Handle recording status updates"""
+    print(f"📊 Recording status: {form.get('RecordingStatus')} for call {form.get('CallSid')}, URL: {form.get('RecordingUrl')}")
+    if form.get('RecordingStatus') == 'completed':
+        await asyncio.to_thread(server.queue_recording, form)
+    return b"OK"
+
+
+# Fallback TwiML per route when a handler raises
+ROUTES = {
+    '/webhook/incoming': (handle_incoming_call, server.FALLBACK_GREETING_TWIML),
+    '/webhook/gather': (handle_gather, server.GATHER_ERROR_TWIML),
+    '/webhook/recording': (handle_recording, server.GOODBYE_TWIML),
+    '/webhook/recording-status': (handle_recording_status, b"OK"),
+    '/webhook/continue': (handle_continue, server.LISTEN_TWIML),
+}
+
+
+def health():
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "in_flight": _in_flight,
+        "max_in_flight": _max_in_flight,
+        "http_pool": http_client.pool_stats(),
+        "response_cache": response_cache.cache_stats(),
+        "jobs": jobs.job_stats(),
+        "router": ROUTER.stats(),
+        "media_streams": media_stream.media_stream_stats(),
+        "prompt_audio": prompt_audio.prompt_stats()
+    }
+
+
+def home():
+    return {
+        "message": "AI Receptionist Webhook Server",
+        "status": "running",
+        "provider": server.AI_PROVIDER,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+async def _read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def _send(send, status, body, headers):
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': headers + [(b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await http_client.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def _media_stream(receive, send):
+    """Twilio media stream websocket: every text message is one JSON event"""
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    await send({'type': 'websocket.accept'})
+
+    async def send_text(text):
+        await send({'type': 'websocket.send', 'text': text})
+
+    stream = media_stream.MediaStream(send_text, media_reply)
+    try:
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+            text = message.get('text') or (message.get('bytes') or b'').decode('utf-8')
+            if text and not await stream.handle(json.loads(text)):
+                await send({'type': 'websocket.close', 'code': 1000})
+                return
+    finally:
+        await stream.close()
+
+
+async def app(scope, receive, send):
+    """ASGI entry point"""
+    global _in_flight, _max_in_flight
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] == 'websocket':
+        if scope['path'] == MEDIA_STREAM_PATH:
+            return await _media_stream(receive, send)
+        return await send({'type': 'websocket.close', 'code': 1008})
+    if scope['type'] != 'http':
+        return
+
+    path, method = scope['path'], scope['method']
+    if method == 'GET' and path in ('/health', '/'):
+        payload = health() if path == '/health' else home()
+        return await _send(send, 200, json.dumps(payload), JSON_HEADERS)
+    if method == 'GET' and path == '/metrics':
+        return await _send(send, 200, metrics.render(health()), [(b'content-type', metrics.CONTENT_TYPE.encode())])
+    if method == 'GET' and path.startswith(prompt_audio.PATH):
+        if_none_match = dict(scope.get('headers', [])).get(b'if-none-match', b'').decode('latin-1')
+        status, headers, body = await asyncio.to_thread(prompt_audio.lookup, path[len(prompt_audio.PATH):],
+                                                        if_none_match)
+        return await _send(send, status, body, [(name.lower().encode(), value.encode()) for name, value in headers])
+
+    route = ROUTES.get(path)
+    if route is None or method != 'POST':
+        return await _send(send, 404, "Not Found", [(b'content-type', b'text/plain')])
+
+    handler, fallback = route
+    started = metrics.start_trace()
+    body = await _read_body(receive)
+    with metrics.span('parse'):
+        # Redirects carry their own parameters in the query string (e.g. /webhook/continue?recording=RE...)
+        form = dict(urllib.parse.parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+        form.update(urllib.parse.parse_qsl(body.decode('utf-8')))
+    _in_flight += 1
+    _max_in_flight = max(_max_in_flight, _in_flight)
+    try:
+        document = await handler(form)
+    except Exception as e:
+        print(f"Error handling {path}: {e}")
+        document = fallback
+    finally:
+        _in_flight -= 1
+    await _send(send, 200, document, TWIML_HEADERS)
+    metrics.finish_trace(method, path, 200, started)
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+μ-law codec, resampling, framing and voice-activity detection for call audio
+Twilio streams the caller as 8 kHz mono G.711 μ-law in 20 ms frames (160
+bytes). Decoding is one lookup in a 256-entry table and encoding one lookup in
+a 65536-entry table, both built with NumPy at import. The detector computes
+the energy of every complete frame of a chunk in one vectorized pass, compares
+it with a noise floor that follows the line's background level, and turns the
+per-frame decisions into utterances: one starts after VAD_MIN_SPEECH_MS of
+speech (with VAD_PREROLL_MS of audio before it, so the first syllable is not
+cut) and ends after VAD_EOU_SILENCE_MS of silence.
+
+Resampler converts between any two rates (8 kHz μ-law ↔ 16 kHz PCM, 24 kHz
+speech → 8 kHz) with a polyphase filter, and trim_silence cuts the silence
+before and after the speech of a recording. Everything works on whole NumPy
+arrays (bytes and memoryviews are read without copying); there is no
+per-sample Python loop.
+
+Environment:
+    VAD_THRESHOLD_DB      dB above the noise floor that counts as speech (default 9)
+    VAD_MIN_ENERGY_DB     frames quieter than this (dBFS) are never speech (default -45)
+    VAD_MIN_SPEECH_MS     speech needed before an utterance starts (default 100)
+    VAD_EOU_SILENCE_MS    silence that ends an utterance (default 600)
+    VAD_PREROLL_MS        audio kept from before the start of speech (default 200)
+    VAD_MAX_UTTERANCE_MS  an utterance is cut after this long (default 15000)
+    AUDIO_TRIM_PADDING_MS audio kept around the speech by trim_silence (default 200)
+"""
+
+import io
+import math
+import os
+import struct
+import wave
+from collections import deque
+
+import numpy as np
+
+SAMPLE_RATE = 8000
+FRAME_MS = 20
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+
+THRESHOLD_DB = float(os.getenv('VAD_THRESHOLD_DB', 9))
+MIN_ENERGY_DB = float(os.getenv('VAD_MIN_ENERGY_DB', -45))
+MIN_SPEECH_MS = int(os.getenv('VAD_MIN_SPEECH_MS', 100))
+EOU_SILENCE_MS = int(os.getenv('VAD_EOU_SILENCE_MS', 600))
+PREROLL_MS = int(os.getenv('VAD_PREROLL_MS', 200))
+MAX_UTTERANCE_MS = int(os.getenv('VAD_MAX_UTTERANCE_MS', 15000))
+TRIM_PADDING_MS = int(os.getenv('AUDIO_TRIM_PADDING_MS', 200))
+
+_BIAS = 0x84
+_CLIP = 8159  # on 14-bit magnitudes
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_MULAW = 7
+
+
+def _build_decode_table():
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = (((mantissa << 3) + _BIAS) << exponent) - _BIAS
+    return np.where(codes & 0x80, -magnitude, magnitude).astype(np.int16)
+
+
+def _build_encode_table():
+    # G.711 on the top 14 bits, as in the ITU reference code (and audioop)
+    samples = np.arange(-32768, 32768, dtype=np.int32) >> 2
+    mask = np.where(samples < 0, 0x7F, 0xFF)
+    magnitude = np.minimum(np.abs(samples), _CLIP) + (_BIAS >> 2)
+    segment = np.maximum(np.floor(np.log2(magnitude)).astype(np.int32) - 5, 0)
+    codes = np.where(segment > 7, 0x7F, (np.minimum(segment, 7) << 4) | ((magnitude >> (segment + 1)) & 0x0F)) ^ mask
+    # Indexed by the sample's bit pattern as uint16, so -1 is entry 0xFFFF
+    return np.roll(codes.astype(np.uint8), -32768)
+
+
+ULAW_DECODE = _build_decode_table()
+ULAW_ENCODE = _build_encode_table()
+
+
+def ulaw_decode(data):
+    """μ-law bytes → int16 samples"""
+    return ULAW_DECODE[np.frombuffer(data, dtype=np.uint8)]
+
+
+def ulaw_encode(samples):
+    """int16 samples → μ-law bytes"""
+    return ULAW_ENCODE[np.asarray(samples, dtype=np.int16).view(np.uint16)].tobytes()
+
+
+def frames(samples, frame_samples=FRAME_SAMPLES):
+    """Complete frames as a (count, frame_samples) view; a trailing partial frame is left out"""
+    count = len(samples) // frame_samples
+    return samples[:count * frame_samples].reshape(count, frame_samples)
+
+
+def frame_energy_db(samples, frame_samples=FRAME_SAMPLES):
+    """RMS level of each complete frame in dBFS"""
+    block = frames(samples, frame_samples).astype(np.float32)
+    rms = np.sqrt(np.mean(block * block, axis=1))
+    return 20 * np.log10(rms / 32768 + 1e-9)
+
+
+def lowpass_taps(cutoff, taps=31):
+    """Hamming-windowed sinc low-pass; cutoff as a fraction of the sample rate (0 < cutoff < 0.5)"""
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)
+    return kernel / kernel.sum()
+
+
+class Resampler:
+    """Streaming polyphase resampler between any two integer rates: feed() chunks, flush() at the end
+
+    The rate ratio is reduced to up / down; the low-pass for the upsampled
+    signal is split into `up` phase filters, so each output sample is one
+    short dot product with the input and the zeros of the upsampled signal are
+    never computed. Outputs sharing a phase are a strided window view × that
+    phase's filter, one matrix product per phase per chunk. The last input
+    samples a later output still needs are carried over, so the chunked output
+    matches resampling the whole signal at once.
+    """
+
+    def __init__(self, from_rate, to_rate, taps_per_phase=16):
+        divisor = math.gcd(from_rate, to_rate)
+        self.up, self.down = to_rate // divisor, from_rate // divisor
+        taps = taps_per_phase * max(self.up, self.down) + 1  # odd, so the delay is a whole sample
+        kernel = lowpass_taps(0.5 / max(self.up, self.down), taps) * self.up
+        # phases[p][j] multiplies input sample i - j for outputs at upsampled time i * up + p
+        self.width = -(-taps // self.up)
+        self.phases = np.ascontiguousarray(
+            np.pad(kernel, (0, self.width * self.up - taps)).reshape(self.width, self.up).T[:, ::-1],
+            dtype=np.float32)
+        self.delay = (taps - 1) // 2
+        self._buffer = np.zeros(self.width - 1, dtype=np.float32)
+        self._start = -(self.width - 1)  # input index of _buffer[0]
+        self._inputs = 0
+        self._outputs = 0
+
+    def _emit(self, limit=None):
+        up, down, width = self.up, self.down, self.width
+        last = self._start + len(self._buffer)  # one past the newest input
+        count = ((last * up - 1 - self.delay) // down) - self._outputs + 1
+        if limit is not None:
+            count = min(count, limit - self._outputs)
+        if count <= 0:
+            return np.zeros(0, dtype=np.int16)
+        out = np.empty(count, dtype=np.float32)
+        windows = np.lib.stride_tricks.sliding_window_view(self._buffer, width)
+        for offset in range(min(up, count)):
+            # Upsampled time of the output; every up-th output after it has the same phase
+            moment = (self._outputs + offset) * down + self.delay
+            first = moment // up - width + 1 - self._start
+            outputs = len(range(offset, count, up))
+            out[offset::up] = windows[first:first + (outputs - 1) * down + 1:down] @ self.phases[moment % up]
+        self._outputs += count
+        keep = (self._outputs * down + self.delay) // up - width + 1 - self._start
+        if keep > 0:
+            self._buffer = self._buffer[keep:]
+            self._start += keep
+        return np.clip(np.rint(out), -32768, 32767).astype(np.int16)
+
+    def feed(self, samples):
+        samples = np.asarray(samples, dtype=np.float32)
+        self._inputs += len(samples)
+        self._buffer = np.concatenate((self._buffer, samples))
+        return self._emit()
+
+    def flush(self):
+        """Remaining output, with the signal zero-padded past its end"""
+        self._buffer = np.concatenate((self._buffer, np.zeros(self.delay // self.up + self.width, dtype=np.float32)))
+        return self._emit(limit=-(-self._inputs * self.up // self.down))
+
+
+def resample(samples, from_rate, to_rate):
+    """int16 samples at from_rate → to_rate (polyphase, band-limited to the lower rate)"""
+    if from_rate == to_rate:
+        return np.asarray(samples, dtype=np.int16)
+    resampler = Resampler(from_rate, to_rate)
+    return np.concatenate((resampler.feed(samples), resampler.flush()))
+
+
+def ulaw_to_pcm16(data, rate=16000):
+    """Twilio 8 kHz μ-law bytes (bytes, bytearray or memoryview) → int16 samples at rate"""
+    return resample(ulaw_decode(data), SAMPLE_RATE, rate)
+
+
+def pcm16_to_ulaw(samples, rate=16000):
+    """int16 samples at rate → 8 kHz μ-law bytes for Twilio"""
+    return ulaw_encode(resample(samples, rate, SAMPLE_RATE))
+
+
+def trim_silence(samples, rate=SAMPLE_RATE, padding_ms=TRIM_PADDING_MS, threshold_db=THRESHOLD_DB,
+                 min_energy_db=MIN_ENERGY_DB):
+    """View of samples without the leading and trailing silence, keeping padding_ms around the speech
+
+    Speech is what the detector would call it: frames louder than the quietest
+    tenth of the recording by threshold_db and above min_energy_db. With no
+    speech at all the samples are returned unchanged.
+    """
+    frame_samples = rate * FRAME_MS // 1000
+    levels = frame_energy_db(samples, frame_samples)
+    if not len(levels):
+        return samples
+    floor = float(np.percentile(levels, 10))
+    voiced = np.flatnonzero(levels > max(floor + threshold_db, min_energy_db))
+    if not len(voiced):
+        return samples
+    padding = rate * padding_ms // 1000
+    return samples[max(0, voiced[0] * frame_samples - padding):(voiced[-1] + 1) * frame_samples + padding]
+
+
+def read_wav(source):
+    """(int16 mono samples, sample rate) from a 16-bit PCM or μ-law WAV path, file object or bytes
+
+    PCM samples are a view of the file contents, not a copy.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = memoryview(source)
+    else:
+        with (open(source, 'rb') if isinstance(source, (str, os.PathLike)) else source) as f:
+            data = memoryview(f.read())
+    if data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        raise ValueError("not a WAV file")
+    position, fmt, payload = 12, None, None
+    while position + 8 <= len(data):
+        chunk_id, size = data[position:position + 4], struct.unpack('<I', data[position + 4:position + 8])[0]
+        body = data[position + 8:position + 8 + size]
+        if chunk_id == b'fmt ':
+            fmt = struct.unpack('<HHIIHH', body[:16])
+        elif chunk_id == b'data':
+            payload = body
+        position += 8 + size + (size & 1)
+    if fmt is None or payload is None:
+        raise ValueError("WAV file without fmt or data chunk")
+    format_tag, channels, rate, _, _, bits = fmt
+    if format_tag == WAVE_FORMAT_MULAW:
+        samples = ulaw_decode(payload)
+    elif format_tag == WAVE_FORMAT_PCM and bits == 16:
+        samples = np.frombuffer(payload[:len(payload) // 2 * 2], dtype='<i2').astype(np.int16, copy=False)
+    else:
+        raise ValueError(f"unsupported WAV encoding (format {format_tag}, {bits} bits)")
+    if channels > 1:
+        samples = samples[:len(samples) // channels * channels].reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return samples, rate
+
+
+def wav_bytes(samples, rate=SAMPLE_RATE, ulaw=False):
+    """Mono WAV file contents: 16-bit PCM, or μ-law (half the size, what Twilio plays natively)"""
+    if ulaw:
+        data = ulaw_encode(samples)
+        # Non-PCM formats carry an 18-byte fmt chunk and a fact chunk with the sample count
+        fmt = struct.pack('<HHIIHHH', WAVE_FORMAT_MULAW, 1, rate, rate, 1, 8, 0)
+        chunks = (b'fmt ' + struct.pack('<I', len(fmt)) + fmt + b'fact' + struct.pack('<II', 4, len(data))
+                  + b'data' + struct.pack('<I', len(data)) + data + b'\0' * (len(data) & 1))
+        return b'RIFF' + struct.pack('<I', 4 + len(chunks)) + b'WAVE' + chunks
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(np.asarray(samples, dtype='<i2').tobytes())
+    return buffer.getvalue()
+
+
+class VoiceActivityDetector:
+    """Streaming utterance detector over 8 kHz int16 audio
+
+    feed() returns a list of (kind, samples) events in order: ("start", pre-roll
+    and onset audio), ("audio", samples inside the utterance) and ("end",
+    trailing audio). Partial frames are kept until the next feed.
+    """
+
+    def __init__(self, threshold_db=THRESHOLD_DB, min_energy_db=MIN_ENERGY_DB, min_speech_ms=MIN_SPEECH_MS,
+                 eou_silence_ms=EOU_SILENCE_MS, preroll_ms=PREROLL_MS, max_utterance_ms=MAX_UTTERANCE_MS):
+        self.threshold_db = threshold_db
+        self.min_energy_db = min_energy_db
+        self.min_speech_frames = max(1, min_speech_ms // FRAME_MS)
+        self.eou_frames = max(1, eou_silence_ms // FRAME_MS)
+        self.max_frames = max(1, max_utterance_ms // FRAME_MS)
+        self.noise_floor = None
+        self.in_utterance = False
+        self._pending = np.zeros(0, dtype=np.int16)
+        self._preroll = deque(maxlen=max(self.min_speech_frames, preroll_ms // FRAME_MS + self.min_speech_frames))
+        self._voiced = 0
+        self._silent = 0
+        self._length = 0
+
+    def _is_speech(self, levels):
+        if self.noise_floor is None and len(levels):
+            self.noise_floor = float(levels[0])
+        return levels > max(self.noise_floor + self.threshold_db, self.min_energy_db)
+
+    def _track_floor(self, level):
+        # Falls at once to a quieter level, rises slowly so speech does not drag it up
+        self.noise_floor = level if level < self.noise_floor else self.noise_floor + 0.02 * (level - self.noise_floor)
+
+    def feed(self, samples):
+        samples = np.concatenate((self._pending, samples)) if len(self._pending) else np.asarray(samples)
+        block = frames(samples)
+        self._pending = samples[len(block) * FRAME_SAMPLES:]
+        if not len(block):
+            return []
+        levels = frame_energy_db(samples[:len(block) * FRAME_SAMPLES])
+        speech = self._is_speech(levels)
+        events, run = [], []
+        for frame, level, voiced in zip(block, levels, speech):
+            if not self.in_utterance:
+                self._preroll.append(frame)
+                if voiced:
+                    self._voiced += 1
+                else:
+                    self._voiced = 0
+                    self._track_floor(float(level))
+                if self._voiced >= self.min_speech_frames:
+                    self.in_utterance = True
+                    self._silent, self._length = 0, len(self._preroll)
+                    if run:
+                        events.append(("audio", np.concatenate(run)))
+                        run = []
+                    events.append(("start", np.concatenate(self._preroll)))
+                    self._preroll.clear()
+                continue
+            self._length += 1
+            self._silent = 0 if voiced else self._silent + 1
+            if self._silent >= self.eou_frames or self._length >= self.max_frames:
+                if run:
+                    events.append(("audio", np.concatenate(run)))
+                    run = []
+                events.append(("end", frame))
+                self.in_utterance = False
+                self._voiced = 0
+            else:
+                run.append(frame)
+        if run:
+            events.append(("audio", np.concatenate(run)))
+        return events
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Audio utilities throughput: per-sample Python loops vs the NumPy versions in audio.py
+Times μ-law decode and encode, 8 kHz ↔ 16 kHz and 24 kHz → 8 kHz resampling,
+20 ms frame energy and silence trimming on a synthetic call (utterances over
+line noise), and reports samples per second. The loop versions are what a
+straightforward port of the G.711 reference code and a direct-form FIR would
+do, and run on a slice of the signal since they are slow. Also reports how
+much of a typical recording trim_silence cuts before the Whisper upload.
+
+Usage:
+    python -m benchmarks.bench_audio --seconds 60 --repeat 5
+"""
+
+import argparse
+import math
+import time
+
+import numpy as np
+
+import audio
+from benchmarks.media_client import line_noise, synthetic_utterance
+
+LOOP_SECONDS = 2
+
+
+def loop_ulaw_decode(data):
+    samples = []
+    for code in data:
+        code = ~code & 0xFF
+        magnitude = ((((code & 0x0F) << 3) + 0x84) << ((code >> 4) & 0x07)) - 0x84
+        samples.append(-magnitude if code & 0x80 else magnitude)
+    return samples
+
+
+def loop_ulaw_encode(samples):
+    out = bytearray()
+    for sample in samples:
+        sample = int(sample) >> 2
+        mask = 0x7F if sample < 0 else 0xFF
+        magnitude = min(abs(sample), 8159) + 0x21
+        segment = max(magnitude.bit_length() - 6, 0)
+        out.append((0x7F if segment > 7 else (segment << 4) | ((magnitude >> (segment + 1)) & 0x0F)) ^ mask)
+    return bytes(out)
+
+
+def loop_resample(samples, from_rate, to_rate, taps_per_phase=16):
+    """The same filter as audio.Resampler, over the zero-stuffed signal one output sample at a time"""
+    divisor = math.gcd(from_rate, to_rate)
+    up, down = to_rate // divisor, from_rate // divisor
+    taps = taps_per_phase * max(up, down) + 1
+    kernel = list(audio.lowpass_taps(0.5 / max(up, down), taps) * up)
+    delay = (taps - 1) // 2
+    out = []
+    for n in range(len(samples) * up // down):
+        moment = n * down + delay
+        total = 0.0
+        for k in range(moment % up, taps, up):
+            index = (moment - k) // up
+            if 0 <= index < len(samples):
+                total += kernel[k] * samples[index]
+        out.append(max(-32768, min(32767, round(total))))
+    return out
+
+
+def loop_frame_energy_db(samples):
+    levels = []
+    for start in range(0, len(samples) - audio.FRAME_SAMPLES + 1, audio.FRAME_SAMPLES):
+        power = sum(int(s) * int(s) for s in samples[start:start + audio.FRAME_SAMPLES]) / audio.FRAME_SAMPLES
+        levels.append(20 * math.log10(math.sqrt(power) / 32768 + 1e-9))
+    return levels
+
+
+def synthetic_call(seconds, rng):
+    """Line noise with a 1.2 s utterance every 2 s"""
+    signal = line_noise(int(seconds * audio.SAMPLE_RATE), rng)
+    utterance = synthetic_utterance()
+    for start in range(0, len(signal) - len(utterance), 2 * audio.SAMPLE_RATE):
+        signal[start:start + len(utterance)] = utterance
+    return signal
+
+
+def synthetic_recording(rng):
+    """A <Record> message: 2 s before the caller speaks, three utterances, 4 s before the timeout"""
+    parts = [line_noise(2 * audio.SAMPLE_RATE, rng)]
+    for seed in range(3):
+        parts += [synthetic_utterance(seed=seed), line_noise(audio.SAMPLE_RATE // 2, rng)]
+    parts.append(line_noise(4 * audio.SAMPLE_RATE, rng))
+    return np.concatenate(parts)
+
+
+def best_of(repeat, function, *args):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--seconds', type=float, default=60, help='length of the synthetic call')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    call = synthetic_call(args.seconds, rng)
+    encoded = audio.ulaw_encode(call)
+    wideband = audio.resample(call, audio.SAMPLE_RATE, 16000)
+    speech = audio.resample(call, audio.SAMPLE_RATE, 24000)
+    part = slice(0, LOOP_SECONDS * audio.SAMPLE_RATE)
+
+    cases = [
+        ('μ-law decode', len(call), lambda: loop_ulaw_decode(encoded[part]), lambda: audio.ulaw_decode(memoryview(encoded))),
+        ('μ-law encode', len(call), lambda: loop_ulaw_encode(call[part].tolist()), lambda: audio.ulaw_encode(call)),
+        ('8 → 16 kHz', len(call), lambda: loop_resample(call[part].tolist(), 8000, 16000),
+         lambda: audio.resample(call, 8000, 16000)),
+        ('16 → 8 kHz', len(wideband), lambda: loop_resample(wideband[:2 * part.stop].tolist(), 16000, 8000),
+         lambda: audio.resample(wideband, 16000, 8000)),
+        ('24 → 8 kHz', len(speech), lambda: loop_resample(speech[:3 * part.stop].tolist(), 24000, 8000),
+         lambda: audio.resample(speech, 24000, 8000)),
+        ('frame energy', len(call), lambda: loop_frame_energy_db(call[part].tolist()), lambda: audio.frame_energy_db(call)),
+        ('trim silence', len(call), None, lambda: audio.trim_silence(call)),
+    ]
+    for name, samples, loop, vectorized in cases:
+        fast = samples / best_of(args.repeat, vectorized)
+        line = f"{name:<13} numpy {fast / 1e6:8.1f} M samples/s"
+        if loop is not None:
+            # The loop versions see a LOOP_SECONDS slice at the input rate
+            slow = samples * LOOP_SECONDS * audio.SAMPLE_RATE / len(call) / best_of(1, loop)
+            line += f"   loop {slow / 1e6:6.2f} M samples/s   ({fast / slow:.0f}x)"
+        print(line)
+
+    decoded = audio.ulaw_decode(encoded)
+    assert loop_ulaw_decode(encoded[part]) == decoded[part].tolist()
+    assert loop_ulaw_encode(call[part].tolist()) == encoded[part]
+    recording = synthetic_recording(rng)
+    trimmed = audio.trim_silence(recording)
+    print(f"trim_silence keeps {len(trimmed) / audio.SAMPLE_RATE:.1f} s of a {len(recording) / audio.SAMPLE_RATE:.1f} s "
+          f"recording ({len(audio.wav_bytes(trimmed)) / len(audio.wav_bytes(recording)):.0%} of the upload)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Call log write throughput, caller-history latency and rotation cost
+Loads synthetic calls (several turns each, callers reused across months)
+through CallLog's group-commit writer, compares against one commit per turn,
+then times caller_history for random callers and a rotation of the oldest calls.
+
+Usage:
+    python -m benchmarks.bench_call_log --turns 1000000 --callers 50000
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from call_log import SCHEMA, CallLog
+
+TURNS_PER_CALL = 5
+
+
+def per_turn_commits(path, turns):
+    """Previous style: a connection per write, one fsync'd commit per turn"""
+    started = time.perf_counter()
+    for index in range(turns):
+        conn = sqlite3.connect(path)
+        conn.execute('INSERT INTO turns (call_sid, ts, user_text, ai_text) VALUES (?, ?, ?, ?)',
+                     (f"CAslow{index // TURNS_PER_CALL}", time.time(), "hola", "¿en qué puedo ayudarte?"))
+        conn.commit()
+        conn.close()
+    return turns / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--turns', type=int, default=1000000)
+    parser.add_argument('--callers', type=int, default=50000)
+    parser.add_argument('--days', type=int, default=180)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--slow-turns', type=int, default=500, help='turns written one commit at a time')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='call-log-bench-')
+    try:
+        slow_path = os.path.join(workdir, 'slow.db')
+        conn = sqlite3.connect(slow_path)
+        conn.executescript(SCHEMA)
+        conn.close()
+        slow_rate = per_turn_commits(slow_path, args.slow_turns)
+
+        log = CallLog(os.path.join(workdir, 'call_log.db'))
+        rng = random.Random(7)
+        callers = [f"+52155{n:08d}" for n in range(args.callers)]
+        now = time.time()
+        started = time.perf_counter()
+        for call in range(args.turns // TURNS_PER_CALL):
+            call_sid, caller = f"CA{call:032d}", rng.choice(callers)
+            ts = now - rng.random() * args.days * 86400
+            for turn in range(TURNS_PER_CALL):
+                log.record_turn(call_sid, caller, "Hola, quiero agendar una cita para el martes",
+                                "Claro, ¿a qué hora te queda bien?", ts=ts + turn * 20, latency_ms=450.0)
+            log.end_call(call_sid, ended=ts + TURNS_PER_CALL * 20)
+        log.flush(timeout=600)
+        load_seconds = time.perf_counter() - started
+        stats = log.stats()
+        print(f"📝 {stats['written']} turns in {load_seconds:.1f}s = {stats['written'] / load_seconds:,.0f} turns/s "
+              f"(batch avg {stats['batch_avg']}, commit avg {stats['commit_ms_avg']} ms); "
+              f"one commit per turn: {slow_rate:,.0f} turns/s")
+
+        latencies = []
+        for _ in range(args.queries):
+            caller = rng.choice(callers)
+            started = time.perf_counter()
+            log.caller_history(caller, limit=20)
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        print(f"🔎 caller_history over {args.queries} callers: p50 {statistics.median(latencies) * 1000:.2f} ms   "
+              f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f} ms")
+
+        size_before = os.path.getsize(log.path)
+        started = time.perf_counter()
+        archived = log.rotate(older_than_days=args.days // 2, archive_dir=os.path.join(workdir, 'archive'))
+        print(f"🗄️ rotated {archived} calls in {time.perf_counter() - started:.1f}s, "
+              f"db {size_before / (1 << 20):.0f} MB → {os.path.getsize(log.path) / (1 << 20):.0f} MB")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Appointment writes from several processes: connect-per-call vs db.py
+The previous save_appointment opened a new connection per insert in rollback
+journal mode; with readers querying the same file (availability lookups) and
+several gunicorn workers writing, inserts wait for locks and fail with
+"database is locked". This starts writer and reader processes against a fresh
+file for each mode and reports throughput, errors and read latency. The db
+mode books through scheduling.Scheduler (appointment plus slot rows in one
+transaction), the only write path; every booking gets its own slot, so a
+rejected booking counts as an error.
+
+Usage:
+    python -m benchmarks.bench_db --writers 4 --readers 2 --rows 2000
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import datetime
+import time
+
+import db
+import scheduling
+
+LEGACY_SCHEMA = db.MIGRATIONS[0][1]
+LEGACY_INSERT = '''
+    INSERT INTO appointments (client_name, client_phone, service_type, appointment_date, appointment_time, notes)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+FIRST_DAY = datetime.date(2026, 11, 1)
+
+
+def _row(writer, index, rows):
+    # One hour of its own per booking, around the clock from FIRST_DAY
+    slot = writer * rows + index
+    day = FIRST_DAY + datetime.timedelta(days=slot // 24)
+    return (f"Cliente {writer}-{index}", f"+52155{writer:02d}{index:06d}", "Consulta",
+            day.isoformat(), f"{slot % 24:02d}:00", "")
+
+
+def legacy_writer(path, writer, rows):
+    errors = 0
+    for index in range(rows):
+        try:
+            conn = sqlite3.connect(path)
+            conn.execute(LEGACY_INSERT, _row(writer, index, rows))
+            conn.commit()
+            conn.close()
+        except sqlite3.OperationalError:
+            errors += 1
+    return errors
+
+
+def db_writer(path, writer, rows):
+    scheduler = scheduling.Scheduler(hours='00:00-24:00', days='0,1,2,3,4,5,6', slot_minutes=60, path=path)
+    errors = 0
+    for index in range(rows):
+        try:
+            if scheduler.book(*_row(writer, index, rows)) is None:
+                errors += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    return errors
+
+
+def legacy_reader(path, stop_at):
+    latencies, errors = [], 0
+    while time.time() < stop_at:
+        started = time.perf_counter()
+        try:
+            conn = sqlite3.connect(path)
+            conn.execute('SELECT appointment_time FROM appointments WHERE appointment_date = ?', ('2026-11-15',)).fetchall()
+            conn.close()
+            latencies.append(time.perf_counter() - started)
+        except sqlite3.OperationalError:
+            errors += 1
+    return latencies, errors
+
+
+def db_reader(path, stop_at):
+    latencies, errors = [], 0
+    while time.time() < stop_at:
+        started = time.perf_counter()
+        try:
+            db.appointments_on('2026-11-15', path)
+            latencies.append(time.perf_counter() - started)
+        except sqlite3.OperationalError:
+            errors += 1
+    return latencies, errors
+
+
+def _write(args):
+    mode, path, writer, rows = args
+    started = time.perf_counter()
+    errors = (legacy_writer if mode == 'legacy' else db_writer)(path, writer, rows)
+    return errors, time.perf_counter() - started
+
+
+def _read(args):
+    mode, path, stop_at = args
+    return (legacy_reader if mode == 'legacy' else db_reader)(path, stop_at)
+
+
+def run(mode, workdir, writers, readers, rows, read_seconds):
+    """Writers insert while readers query the same file for read_seconds"""
+    path = os.path.join(workdir, f'{mode}.db')
+    if mode == 'legacy':
+        conn = sqlite3.connect(path)
+        conn.executescript(LEGACY_SCHEMA)
+        conn.close()
+    else:
+        db.connection(path)
+    with multiprocessing.Pool(writers + readers) as pool:
+        started = time.perf_counter()
+        read_results = pool.map_async(_read, [(mode, path, time.time() + read_seconds)] * readers)
+        write_results = pool.map(_write, [(mode, path, writer, rows) for writer in range(writers)])
+        wall = time.perf_counter() - started
+        reads = read_results.get()
+    write_errors = sum(errors for errors, _ in write_results)
+    latencies = sorted(latency for latency_list, _ in reads for latency in latency_list)
+    return {
+        "written": writers * rows - write_errors,
+        "write_errors": write_errors,
+        "rate": (writers * rows - write_errors) / wall,
+        "reads": len(latencies),
+        "read_errors": sum(errors for _, errors in reads),
+        "read_p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "read_p99_ms": latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000 if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=2)
+    parser.add_argument('--rows', type=int, default=2000, help='inserts per writer process')
+    parser.add_argument('--read-seconds', type=float, default=5.0, help='how long reader processes run')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='db-bench-')
+    try:
+        print(f"🗃️ {args.writers} writer processes × {args.rows} inserts, {args.readers} reader processes")
+        for mode in ('legacy', 'db'):
+            result = run(mode, workdir, args.writers, args.readers, args.rows, args.read_seconds)
+            print(f"{mode:<9} {result['rate']:8,.0f} inserts/s   write errors {result['write_errors']:5}   "
+                  f"reads {result['reads']:6} (errors {result['read_errors']})   "
+                  f"read p50 {result['read_p50_ms']:.2f} ms   p99 {result['read_p99_ms']:.2f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
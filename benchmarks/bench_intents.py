@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Accuracy and speed of end-of-conversation detection
+Runs the labeled Spanish corpus in benchmarks/intent_corpus.tsv through the
+previous substring scan from simple_server_working.py and through
+intents.is_end_of_conversation, printing misclassified utterances and the
+time per utterance of each.
+
+Usage:
+    python -m benchmarks.bench_intents --repeat 2000
+"""
+
+import argparse
+import os
+import timeit
+
+import intents
+
+CORPUS = os.path.join(os.path.dirname(__file__), 'intent_corpus.tsv')
+
+# The phrase list handle_speech scanned with any(word in text.lower() ...)
+LEGACY_PHRASES = ['bye', 'goodbye', 'thanks', 'thank you', 'see you', 'chau', 'adiós', 'gracias', 'hasta luego', 'eso es todo', 'nada más', 'no hay más', 'ya está', 'listo', 'terminado', 'no necesito nada más', 'ya terminé', 'eso es', 'listo gracias', 'perfecto gracias', 'no', 'no gracias', 'no necesito', 'no hay nada más', 'no hay más', 'nada', 'ya está bien', 'perfecto', 'listo gracias', 'no más', 'no necesito más', 'eso es todo', 'eso es', 'ya terminé', 'listo', 'perfecto', 'no hay nada más', 'no necesito nada', 'ya está todo', 'terminé', 'listo gracias', 'perfecto gracias', 'no hay nada', 'no necesito nada más', 'ya está todo', 'terminé', 'listo', 'perfecto', 'no hay nada', 'no necesito nada más', 'ya está todo', 'terminé', 'listo', 'perfecto']
+
+
+def legacy_ends_call(text):
+    return any(word in text.lower() for word in LEGACY_PHRASES)
+
+
+def load_corpus(path=CORPUS):
+    samples = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            label, text = line.rstrip('\n').split('\t', 1)
+            samples.append((label == 'end', text))
+    return samples
+
+
+def evaluate(name, detect, samples, repeat):
+    wrong = [(expected, text) for expected, text in samples if detect(text) != expected]
+    seconds = timeit.timeit(lambda: [detect(text) for _, text in samples], number=repeat)
+    per_call = seconds / (repeat * len(samples)) * 1e6
+    print(f"{name:<8} accuracy {1 - len(wrong) / len(samples):6.1%}  "
+          f"errors {len(wrong):3d}  {per_call:6.2f} µs/utterance")
+    for expected, text in wrong:
+        print(f"    {'missed' if expected else 'misfire'}: {text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--corpus', default=CORPUS)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    samples = load_corpus(args.corpus)
+    print(f"📋 {len(samples)} utterances, {sum(end for end, _ in samples)} closing")
+    evaluate('legacy', legacy_ends_call, samples, args.repeat)
+    evaluate('intents', intents.is_end_of_conversation, samples, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
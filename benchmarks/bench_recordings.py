@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Peak RSS and latency of recording download + Whisper transcription
+Compares the previous process_recording flow (response.content, fixed
+/tmp path, multipart body built in memory) with recordings.py (chunked
+download into a per-call spooled file, multipart streamed from it) against
+the fake Twilio / Whisper endpoints in fake_providers. Each mode runs in its
+own subprocess so ru_maxrss measures that mode alone.
+
+Usage:
+    python -m benchmarks.bench_recordings --calls 8 --concurrency 4 --size-mb 20
+"""
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def legacy_pipeline(recording_url, base_url, path):
+    import http_client
+    response = http_client.get(recording_url)
+    with open(path, 'wb') as f:
+        f.write(response.content)
+    with open(path, 'rb') as audio_file:
+        # Like the OpenAI SDK, requests builds the whole multipart body in memory
+        result = http_client.post(f"{base_url}/v1/audio/transcriptions",
+                                  headers={'Authorization': 'Bearer test'},
+                                  files={'file': ('recording.wav', audio_file, 'audio/wav')},
+                                  data={'model': 'whisper-1', 'language': 'es'})
+    result.raise_for_status()
+    return result.json()['text']
+
+
+def streamed_pipeline(recording_url, base_url, call_sid):
+    import recordings
+    with recordings.download(recording_url, call_sid) as audio:
+        return recordings.transcribe(audio, api_key='test', base_url=base_url)
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_child(mode, calls, concurrency, size_mb, transcription_delay):
+    from fake_providers import FakeProviderServer
+    import recordings  # noqa: F401  # numpy comes with it; keep the import out of the measured peak
+
+    fake = FakeProviderServer(recording_size=int(size_mb * (1 << 20)), transcription_delay=transcription_delay).start()
+    shared_path = os.path.join(tempfile.gettempdir(), 'bench-recording.wav')
+    baseline = _peak_rss_mb()
+
+    def one(index):
+        started = time.perf_counter()
+        url = fake.recording_url(f"RE{index:04d}")
+        if mode == 'legacy':
+            legacy_pipeline(url, fake.base_url, shared_path)
+        else:
+            streamed_pipeline(url, fake.base_url, f"CA{index:04d}")
+        return time.perf_counter() - started
+
+    wall = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(one, range(calls)))
+    wall = time.perf_counter() - wall
+    fake.stop()
+    if os.path.exists(shared_path):
+        os.remove(shared_path)
+    latencies.sort()
+    print(json.dumps({
+        "mode": mode,
+        "peak_rss_mb": round(_peak_rss_mb() - baseline, 1),
+        "latency_avg_ms": round(statistics.mean(latencies) * 1000, 1),
+        "latency_p95_ms": round(latencies[max(0, int(len(latencies) * 0.95) - 1)] * 1000, 1),
+        "wall_s": round(wall, 2),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--calls', type=int, default=8)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--size-mb', type=float, default=20)
+    parser.add_argument('--transcription-delay', type=float, default=0.3)
+    parser.add_argument('--child', choices=['legacy', 'streamed'])
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.calls, args.concurrency, args.size_mb, args.transcription_delay)
+        return
+
+    print(f"🎙️ {args.calls} recordings of {args.size_mb} MB, {args.concurrency} at a time")
+    for mode in ('legacy', 'streamed'):
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_recordings', '--child', mode,
+             '--calls', str(args.calls), '--concurrency', str(args.concurrency),
+             '--size-mb', str(args.size_mb), '--transcription-delay', str(args.transcription_delay)],
+            capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<9} peak RSS +{result['peak_rss_mb']:7.1f} MB   avg {result['latency_avg_ms']:7.1f} ms   "
+              f"p95 {result['latency_p95_ms']:7.1f} ms   wall {result['wall_s']:5.2f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Turn latency with one provider vs the hedging router, under injected stalls
+Starts two fake providers (OpenAI and Claude stand-ins); every Nth OpenAI
+request stalls for several seconds, like a provider having a bad minute. The
+same turns are answered by calling OpenAI alone (the previous behavior, with
+only the HTTP read timeout) and through router.Router, which hedges to Claude
+after OpenAI's p95 and falls back to the local responder at the deadline.
+Then OpenAI fails outright to show the breaker skipping it.
+
+Usage:
+    python -m benchmarks.bench_router --turns 300 --concurrency 8 --stall-every 10 --stall-delay 6
+"""
+
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import http_client
+import router
+from fake_providers import FakeProviderServer
+
+
+def openai_call(base_url):
+    def call(message, call_sid=None, timeout=None):
+        response = http_client.post(f"{base_url}/v1/chat/completions",
+                                    timeout=timeout or (http_client.CONNECT_TIMEOUT, http_client.READ_TIMEOUT),
+                                    json={"model": "gpt-4", "messages": [{"role": "user", "content": message}]})
+        response.raise_for_status()
+        return response.json()['choices'][0]['message']['content']
+    return call
+
+
+def claude_call(base_url):
+    def call(message, call_sid=None, timeout=None):
+        response = http_client.post(f"{base_url}/v1/messages", timeout=timeout,
+                                    json={"model": "claude", "messages": [{"role": "user", "content": message}]})
+        response.raise_for_status()
+        return response.json()['content'][0]['text']
+    return call
+
+
+def run(answer, turns, concurrency):
+    def timed(index):
+        started = time.perf_counter()
+        source = answer(f"pregunta {index}")
+        return time.perf_counter() - started, source
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(timed, range(turns)))
+    latencies = sorted(latency for latency, _ in results)
+    sources = {}
+    for _, source in results:
+        sources[source] = sources.get(source, 0) + 1
+    return latencies, sources
+
+
+def report(name, latencies, sources):
+    print(f"{name:<14} p50 {statistics.median(latencies) * 1000:7.0f} ms   "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:7.0f} ms   "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:7.0f} ms   "
+          f"max {latencies[-1] * 1000:7.0f} ms   answered by {sources}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--turns', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--stall-every', type=int, default=10)
+    parser.add_argument('--stall-delay', type=float, default=6.0)
+    parser.add_argument('--latency', type=float, default=0.3, help='normal provider answer time in seconds')
+    args = parser.parse_args()
+
+    openai = FakeProviderServer(first_token_delay=args.latency, token_delay=0, stall_every=args.stall_every,
+                                stall_delay=args.stall_delay)
+    claude = FakeProviderServer(first_token_delay=args.latency * 1.2, token_delay=0)
+    openai.start()
+    claude.start()
+    try:
+        print(f"🧪 {args.turns} turns, {args.concurrency} at a time; every {args.stall_every}th OpenAI "
+              f"request stalls {args.stall_delay}s")
+        single = openai_call(openai.base_url)
+
+        def openai_only(message):
+            single(message)
+            return 'openai'
+
+        latencies, sources = run(openai_only, args.turns, args.concurrency)
+        report("openai only", latencies, sources)
+
+        routed = router.Router([router.Provider('openai', call=openai_call(openai.base_url)),
+                                router.Provider('claude', call=claude_call(claude.base_url))],
+                               fallback=lambda message: "Gracias por tu mensaje.", primary='openai')
+        latencies, sources = run(lambda message: routed.complete(message)[1], args.turns, args.concurrency)
+        report("router", latencies, sources)
+        stats = routed.stats()
+        print(f"🔀 hedges {stats['hedges']}, hedge wins {stats['hedge_wins']}, fallbacks {stats['fallbacks']}, "
+              f"OpenAI hedge delay {stats['providers']['openai']['hedge_delay_ms']} ms")
+
+        openai.stall_every, openai.fail_every = 0, 1
+        latencies, sources = run(lambda message: routed.complete(message)[1], args.turns // 3, args.concurrency)
+        report("openai down", latencies, sources)
+        print(f"🔌 OpenAI breaker {routed.stats()['providers']['openai']['breaker']}, "
+              f"skipped {routed.stats()['providers']['openai']['skipped']} times")
+    finally:
+        openai.stop()
+        claude.stop()
+
+
+if __name__ == '__main__':
+    main()
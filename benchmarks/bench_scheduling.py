@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Next-free-slot latency over a synthetic year of appointments, plus a booking race
+Fills a calendar (30-minute blocks, mixed 30/60/90-minute services) to the
+requested occupancy, then times Scheduler.next_free_slots against a naive
+lookup that queries each day's appointments and checks every candidate time.
+Finally several processes try to book the same slot at once; exactly one
+must win.
+
+Usage:
+    python -m benchmarks.bench_scheduling --days 365 --occupancy 0.8 --queries 2000
+"""
+
+import argparse
+import datetime
+import multiprocessing
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+import db
+from scheduling import HORIZON_DAYS, Scheduler
+
+DURATIONS = "Consulta=60,Seguimiento=30,Tratamiento=90"
+SERVICES = ["Consulta", "Seguimiento", "Tratamiento"]
+
+
+def make_scheduler(path):
+    return Scheduler(slot_minutes=30, durations=DURATIONS, path=path)
+
+
+def fill_calendar(scheduler, start, days, occupancy, rng):
+    """Insert appointments directly (no per-booking transaction) until occupancy of open blocks is reached"""
+    appointments, slots = [], []
+    next_id = 1
+    for offset in range(days):
+        day = start + datetime.timedelta(days=offset)
+        open_mask = scheduler.open_by_weekday[day.weekday()]
+        blocks = [bit for bit in range(open_mask.bit_length()) if open_mask >> bit & 1]
+        busy = set()
+        for first in rng.sample(blocks, len(blocks)):
+            if len(busy) >= occupancy * len(blocks):
+                break
+            service = rng.choice(SERVICES)
+            span = range(first, first + scheduler.blocks(service))
+            if any(block in busy or not open_mask >> block & 1 for block in span):
+                continue
+            busy.update(span)
+            minute = first * scheduler.slot_minutes
+            appointments.append((next_id, "Cliente", "+5215550000", service, day.isoformat(),
+                                 f"{minute // 60:02d}:{minute % 60:02d}", "", len(span) * scheduler.slot_minutes))
+            slots.extend((day.isoformat(), block * scheduler.slot_minutes, next_id) for block in span)
+            next_id += 1
+    with db.transaction(scheduler.path) as conn:
+        conn.executemany('INSERT INTO appointments (id, client_name, client_phone, service_type, appointment_date, '
+                         'appointment_time, notes, duration_minutes) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', appointments)
+        conn.executemany('INSERT INTO appointment_slots (appointment_date, minute, appointment_id) VALUES (?, ?, ?)',
+                         slots)
+    return len(appointments)
+
+
+def naive_next_free(scheduler, service, count, after, horizon_days=HORIZON_DAYS):
+    """Per day: read that day's appointments and test every candidate start time"""
+    conn = db.connection(scheduler.path)
+    need = scheduler.blocks(service)
+    found = []
+    for offset in range(horizon_days):
+        day = after.date() + datetime.timedelta(days=offset)
+        open_mask = scheduler.open_by_weekday[day.weekday()]
+        taken = set()
+        for row in conn.execute('SELECT appointment_time, duration_minutes FROM appointments '
+                                'WHERE appointment_date = ? AND status = ?', (day.isoformat(), 'scheduled')):
+            hours, minutes = map(int, row[0].split(':'))
+            first = (hours * 60 + minutes) // scheduler.slot_minutes
+            taken.update(range(first, first + row[1] // scheduler.slot_minutes))
+        earliest = -(-(after.hour * 60 + after.minute) // scheduler.slot_minutes) if offset == 0 else 0
+        for block in range(earliest, open_mask.bit_length()):
+            span = range(block, block + need)
+            if all(open_mask >> b & 1 and b not in taken for b in span):
+                found.append((day.isoformat(), f"{block * scheduler.slot_minutes // 60:02d}:"
+                                               f"{block * scheduler.slot_minutes % 60:02d}"))
+                if len(found) == count:
+                    return found
+    return found
+
+
+def _race(args):
+    path, day, time_slot, index = args
+    scheduler = make_scheduler(path)
+    return scheduler.book(f"Cliente {index}", f"+52155500{index:04d}", "Tratamiento", day, time_slot) is not None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--occupancy', type=float, default=0.8)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--racers', type=int, default=8)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='scheduling-bench-')
+    try:
+        path = os.path.join(workdir, 'appointments.db')
+        scheduler = make_scheduler(path)
+        rng = random.Random(11)
+        start = datetime.datetime(2026, 1, 5, 8, 0)
+        total = fill_calendar(scheduler, start.date(), args.days, args.occupancy, rng)
+        print(f"📅 {total} appointments over {args.days} days ({args.occupancy:.0%} of open blocks)")
+
+        queries = [(rng.choice(SERVICES), start + datetime.timedelta(days=rng.randrange(args.days), hours=rng.randrange(10)))
+                   for _ in range(args.queries)]
+        for name, lookup in (('naive', lambda s, a: naive_next_free(scheduler, s, 3, a)),
+                             ('bitmap', lambda s, a: scheduler.next_free_slots(s, 3, a))):
+            if name == 'bitmap':
+                scheduler.next_free_slots('Consulta', 10 ** 6, start, horizon_days=args.days)
+            latencies = []
+            for service, after in queries:
+                started = time.perf_counter()
+                lookup(service, after)
+                latencies.append(time.perf_counter() - started)
+            latencies.sort()
+            print(f"{name:<7} next 3 free slots: p50 {statistics.median(latencies) * 1000:.3f} ms   "
+                  f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.3f} ms")
+        mismatches = sum(naive_next_free(scheduler, s, 3, a) != scheduler.next_free_slots(s, 3, a) for s, a in queries[:200])
+        print(f"🔍 bitmap vs naive mismatches on 200 queries: {mismatches}")
+
+        day, time_slot = scheduler.next_free_slots('Tratamiento', 1, start, horizon_days=args.days)[0]
+        with multiprocessing.Pool(args.racers) as pool:
+            wins = sum(pool.map(_race, [(path, day, time_slot, index) for index in range(args.racers)]))
+        print(f"🏁 {args.racers} processes booking {day} {time_slot}: {wins} succeeded")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Precision and recall of the semantic FAQ cache at its threshold
+Approves the questions in benchmarks/faq_corpus.tsv, runs the labeled queries
+through SemanticCache.search and prints each score, then sweeps thresholds. A
+"miss" query answered from the cache is a wrong answer spoken to a caller, so
+the run fails when SEMANTIC_CACHE_THRESHOLD gives any wrong answer or answers
+fewer than --min-recall of the "hit" queries.
+
+Usage:
+    python -m benchmarks.bench_semantic_cache --repeat 200
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+import semantic_cache
+
+CORPUS = os.path.join(os.path.dirname(__file__), 'faq_corpus.tsv')
+
+
+def load_corpus(path=CORPUS):
+    questions, queries = [], []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            kind, entry, text = line.rstrip('\n').split('\t', 2)
+            if kind == 'faq':
+                questions.append((entry, text))
+            else:
+                queries.append((None if entry == '-' else entry, text))
+    return questions, queries
+
+
+def evaluate(scored, threshold):
+    """(wrong answers, hits answered correctly, hit queries) at threshold"""
+    wrong = answered = 0
+    for expected, found, score in scored:
+        if score >= threshold:
+            if found == expected:
+                answered += 1
+            else:
+                wrong += 1
+    return wrong, answered, sum(expected is not None for expected, _, _ in scored)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--min-recall', type=float, default=0.6)
+    args = parser.parse_args()
+
+    questions, queries = load_corpus()
+    cache = semantic_cache.SemanticCache(path=None)
+    names = {cache.seed(question, entry, approved=True)["id"]: entry for entry, question in questions}
+    scored = []
+    for expected, text in queries:
+        entry, score = cache.search(text)
+        found = names.get(entry["id"]) if entry else None
+        scored.append((expected, found, score))
+        mark = '✓' if (score >= cache.threshold) == (expected is not None) and \
+            (expected is None or found == expected) else '✗'
+        print(f"  {mark} {score:.2f} {found or '-':<10} (expected {expected or '-'})  ← {text}")
+
+    for step in range(10, 20):
+        threshold = step / 20
+        wrong, answered, hits = evaluate(scored, threshold)
+        print(f"  threshold {threshold:.2f}: wrong answers {wrong:2}, recall {answered}/{hits}")
+    per_query = timeit.timeit(lambda: [cache.search(text) for _, text in queries], number=args.repeat)
+    per_query /= args.repeat * len(queries)
+    wrong, answered, hits = evaluate(scored, cache.threshold)
+    print(f"💡 {len(questions)} approved questions, {len(queries)} queries at threshold {cache.threshold}: "
+          f"wrong answers {wrong}, recall {answered / hits:.0%}; {per_query * 1e6:.1f} µs per query")
+    if wrong or answered / hits < args.min_recall:
+        sys.exit(f"❌ Threshold {cache.threshold} fails the FAQ corpus")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Accuracy and speed of the local name / phone / reason extractor
+Runs the labeled utterances in benchmarks/slot_corpus.tsv through
+slots.extract, printing every slot that differs from its label, the share of
+utterances the Lindy template could answer without OpenAI, and the time per
+utterance (an OpenAI round trip for the same decision is hundreds of ms).
+
+Usage:
+    python -m benchmarks.bench_slots --repeat 2000
+"""
+
+import argparse
+import os
+import timeit
+
+import slots
+
+CORPUS = os.path.join(os.path.dirname(__file__), 'slot_corpus.tsv')
+
+
+def load_corpus(path=CORPUS):
+    samples = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            name, phone, reason, text = line.rstrip('\n').split('\t', 3)
+            expected = {"name": None if name == '-' else name, "phone": None if phone == '-' else phone,
+                        "reason": reason == '1'}
+            samples.append((expected, text))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    samples = load_corpus()
+    wrong = {slot: 0 for slot in slots.REQUIRED}
+    complete = 0
+    for expected, text in samples:
+        found = slots.extract(text)
+        found["reason"] = bool(found.get("reason"))
+        for slot in slots.REQUIRED:
+            if found.get(slot) != expected[slot]:
+                wrong[slot] += 1
+                print(f"  ✗ {slot}: expected {expected[slot]!r}, got {found.get(slot)!r}  ← {text}")
+        complete += slots.local_reply(found) is not None
+    per_call = timeit.timeit(lambda: [slots.extract(text) for _, text in samples], number=args.repeat)
+    per_call /= args.repeat * len(samples)
+    print(f"🧩 {len(samples)} utterances: name errors {wrong['name']}, phone errors {wrong['phone']}, "
+          f"reason errors {wrong['reason']}")
+    print(f"⚡ {complete / len(samples):.0%} complete in one utterance (template answer, no OpenAI call); "
+          f"{per_call * 1e6:.1f} µs per utterance")
+
+
+if __name__ == '__main__':
+    main()
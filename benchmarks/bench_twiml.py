@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+TwiML rendering: f-string + double encode vs the twiml builder
+The previous handlers formatted a multi-line f-string per response and encoded
+it twice (Content-Length and write). The builder joins pre-encoded fragments
+and encodes only the dynamic answer, escaping it. Also checks that an answer
+containing "&" or "<" still yields well-formed XML.
+
+Usage:
+    python -m benchmarks.bench_twiml --repeat 200000
+"""
+
+import argparse
+import timeit
+import xml.etree.ElementTree as ET
+
+import twiml
+
+ANSWER = "Perfecto Juan, he tomado nota de tu mensaje. Javier se pondrá en contacto contigo pronto al 805000."
+TRICKY_ANSWER = "Horario: lunes a viernes de 9 a 18 & sábados < 13 hs."
+
+LISTEN_AGAIN = (
+    twiml.gather(input='speech', action='/speech', method='POST', timeout=15, speechTimeout=8, language='es-AR')
+    + twiml.LUPE.say("No pude escucharte bien. Por favor, repite tu mensaje o di 'eso es todo' si ya terminaste.")
+)
+NO_AUDIO = twiml.document(
+    twiml.ALICE.say("No pude escuchar tu mensaje. ¿Podrías repetirlo?"),
+    twiml.record(maxLength=30, timeout=10, action='/webhook/recording', method='POST'),
+)
+
+
+def legacy_dynamic(ai_response):
+    twiml_response = f"""<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    <Say voice="Polly.Lupe" language="es-ES" rate="fast">{ai_response}</Say>
+    <Gather input="speech" action="/speech" method="POST" timeout="15" speechTimeout="8" language="es-AR">
+    </Gather>
+    <Say voice="Polly.Lupe" language="es-ES" rate="fast">No pude escucharte bien. Por favor, repite tu mensaje o di 'eso es todo' si ya terminaste.</Say>
+</Response>"""
+    length = str(len(twiml_response.encode('utf-8')))
+    return length, twiml_response.encode('utf-8')
+
+
+def builder_dynamic(ai_response):
+    body = twiml.document(twiml.LUPE.say(ai_response), LISTEN_AGAIN)
+    return str(len(body)), body
+
+
+def legacy_static():
+    twiml_response = """<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    <Say voice="alice" language="es-MX">No pude escuchar tu mensaje. ¿Podrías repetirlo?</Say>
+    <Record maxLength="30" timeout="10" action="/webhook/recording" method="POST" />
+</Response>"""
+    length = str(len(twiml_response.encode('utf-8')))
+    return length, twiml_response.encode('utf-8')
+
+
+def builder_static():
+    return str(len(NO_AUDIO)), NO_AUDIO
+
+
+def well_formed(body):
+    try:
+        ET.fromstring(body)
+        return True
+    except ET.ParseError:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=200000)
+    args = parser.parse_args()
+
+    cases = [
+        ('dynamic', lambda: legacy_dynamic(ANSWER), lambda: builder_dynamic(ANSWER)),
+        ('static', legacy_static, builder_static),
+    ]
+    for name, legacy, builder in cases:
+        legacy_ns = timeit.timeit(legacy, number=args.repeat) / args.repeat * 1e9
+        builder_ns = timeit.timeit(builder, number=args.repeat) / args.repeat * 1e9
+        print(f"{name:<8} legacy {legacy_ns:7.0f} ns   builder {builder_ns:7.0f} ns   "
+              f"({legacy_ns / builder_ns:.1f}x)")
+
+    print(f"answer with '&' and '<': legacy well-formed={well_formed(legacy_dynamic(TRICKY_ANSWER)[1])}, "
+          f"builder well-formed={well_formed(builder_dynamic(TRICKY_ANSWER)[1])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Load test for the ASGI webhook app
+Fires N concurrent /webhook/recording requests at asgi_server.app (in-process,
+no sockets on the webhook side) while the provider is a local fake with a fixed
+delay. With awaited provider I/O the wall time stays close to one provider
+round trip instead of N of them.
+
+Usage:
+    python -m benchmarks.load_asgi --calls 300 --provider-delay 1.0
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import urllib.parse
+
+
+async def _post(app, path, form):
+    body = urllib.parse.urlencode(form).encode('utf-8')
+    scope = {'type': 'http', 'method': 'POST', 'path': path, 'headers': [
+        (b'content-type', b'application/x-www-form-urlencoded')]}
+    received = {'status': None, 'body': b''}
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            received['status'] = message['status']
+        else:
+            received['body'] += message.get('body', b'')
+
+    started = time.perf_counter()
+    await app(scope, receive, send)
+    return received['status'], time.perf_counter() - started, received['body']
+
+
+async def run(calls, provider_delay):
+    from fake_providers import FakeProviderServer
+    fake = FakeProviderServer(first_token_delay=provider_delay, token_delay=0).start()
+    os.environ['OPENAI_BASE_URL'] = fake.base_url
+    os.environ.setdefault('OPENAI_API_KEY', 'test')
+
+    import server
+    server.OPENAI_BASE_URL = fake.base_url
+    import asgi_server
+    import http_client
+
+    form = {'CallSid': 'CA-load', 'RecordingUrl': 'http://example.invalid/rec', 'RecordingDuration': '5'}
+    started = time.perf_counter()
+    results = await asyncio.gather(*[
+        _post(asgi_server.app, '/webhook/recording', dict(form, CallSid=f'CA{i:05d}')) for i in range(calls)
+    ])
+    wall = time.perf_counter() - started
+    await http_client.aclose()
+    fake.stop()
+
+    latencies = sorted(r[1] for r in results)
+    ok = sum(1 for r in results if r[0] == 200 and b'Perfecto' in r[2])
+    print(f"calls:            {calls}")
+    print(f"provider delay:   {provider_delay:.2f} s")
+    print(f"provider answers: {ok}/{calls}")
+    print(f"max in flight:    {asgi_server._max_in_flight}")
+    print(f"wall time:        {wall:.2f} s  (sequential would be ~{calls * provider_delay:.0f} s)")
+    print(f"p50 / p95 / max:  {statistics.median(latencies):.2f} / "
+          f"{latencies[int(len(latencies) * 0.95) - 1]:.2f} / {latencies[-1]:.2f} s")
+    return wall
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Concurrent load test for asgi_server.app")
+    parser.add_argument('--calls', type=int, default=300)
+    parser.add_argument('--provider-delay', type=float, default=1.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.calls, args.provider_delay))
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Media stream client: replays WAV files as Twilio <Stream> callers and times the answers
+Each simulated call sends the connected and start events, then the audio of
+every WAV file as 20 ms base64 μ-law media messages in real time (one file per
+caller turn), followed by line noise while it waits for the answer, and echoes
+marks back once the answer would have finished playing, as Twilio does. The
+time from the end of the caller's audio to the first frame of the answer is
+the turn latency; it includes VAD_EOU_SILENCE_MS of end-of-utterance silence.
+
+By default the calls run in-process against asgi_server.app over the ASGI
+websocket protocol, with fake_providers (in its own process) answering
+Whisper, the LLM and text-to-speech; --url sends them to a running server instead (needs the websockets
+package). Without --wav, each turn is a synthetic 1.2 s voiced burst. WAV files
+(16-bit PCM or μ-law, any rate) are resampled to 8 kHz mono.
+
+Usage:
+    python -m benchmarks.media_client --streams 100 --turns 2
+    python -m benchmarks.media_client --wav hola.wav --wav telefono.wav --speed 0
+    python -m benchmarks.media_client --url ws://127.0.0.1:8000/media-stream --wav hola.wav
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import audio
+from benchmarks.replay import ROOT, free_port
+
+ANSWER_TIMEOUT = 15.0
+
+
+def synthetic_utterance(seconds=1.2, seed=0):
+    """A voiced burst: 180 Hz tone with a 4 Hz syllable envelope, over a little noise"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * audio.SAMPLE_RATE)) / audio.SAMPLE_RATE
+    envelope = 0.6 + 0.4 * np.sin(2 * np.pi * 4 * t)
+    voiced = 6000 * envelope * np.sin(2 * np.pi * 180 * t) + rng.normal(0, 40, len(t))
+    return np.clip(voiced, -32768, 32767).astype(np.int16)
+
+
+def line_noise(samples, rng):
+    return rng.normal(0, 40, samples).astype(np.int16)
+
+
+def encode_frames(samples):
+    """base64 μ-law payload of each 20 ms frame, encoded once and shared by every call"""
+    return [base64.b64encode(audio.ulaw_encode(samples[offset:offset + audio.FRAME_SAMPLES])).decode('ascii')
+            for offset in range(0, len(samples), audio.FRAME_SAMPLES)]
+
+
+NOISE = encode_frames(line_noise(audio.SAMPLE_RATE, np.random.default_rng(0)))
+
+
+class ASGIConnection:
+    """Websocket connection to an in-process ASGI app"""
+
+    def __init__(self, app, path):
+        self._to_app = asyncio.Queue()
+        self._to_client = asyncio.Queue()
+        self._accepted = asyncio.Event()
+        scope = {'type': 'websocket', 'path': path, 'headers': [], 'query_string': b'', 'subprotocols': []}
+        self._task = asyncio.ensure_future(app(scope, self._to_app.get, self._from_app))
+        self._to_app.put_nowait({'type': 'websocket.connect'})
+
+    async def _from_app(self, message):
+        if message['type'] == 'websocket.accept':
+            self._accepted.set()
+        elif message['type'] == 'websocket.send':
+            self._to_client.put_nowait(message.get('text'))
+        elif message['type'] == 'websocket.close':
+            self._accepted.set()
+            self._to_client.put_nowait(None)
+
+    async def open(self):
+        await self._accepted.wait()
+        return self
+
+    async def send(self, text):
+        self._to_app.put_nowait({'type': 'websocket.receive', 'text': text})
+
+    async def recv(self):
+        return await self._to_client.get()
+
+    async def close(self):
+        self._to_app.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+        await self._task
+
+
+class WebsocketConnection:
+    """Websocket connection to a running server through the websockets package"""
+
+    def __init__(self, url):
+        self.url = url
+        self._socket = None
+
+    async def open(self):
+        import websockets
+        self._socket = await websockets.connect(self.url)
+        return self
+
+    async def send(self, text):
+        await self._socket.send(text)
+
+    async def recv(self):
+        import websockets
+        try:
+            return await self._socket.recv()
+        except websockets.ConnectionClosed:
+            return None
+
+    async def close(self):
+        await self._socket.close()
+
+
+async def run_call(connection, index, utterances, speed, results):
+    """One caller: say each utterance, wait for the answer, listen to it, then hang up"""
+    stream_sid, call_sid = f"MZ{index:032d}", f"CA{index:032d}"
+    frame_seconds = audio.FRAME_MS / 1000
+    state = {"waiting_since": None, "answered": asyncio.Event(), "played": asyncio.Event(), "closed": False,
+             "frames": 0, "sequence": 0}
+
+    async def send(event, **fields):
+        state["sequence"] += 1
+        await connection.send(json.dumps(dict({'event': event, 'sequenceNumber': str(state["sequence"]),
+                                               'streamSid': stream_sid}, **fields)))
+
+    async def send_audio(payloads, chunk):
+        started = time.perf_counter()
+        for number, payload in enumerate(payloads):
+            await send('media', media={'track': 'inbound', 'chunk': str(chunk + number),
+                                       'timestamp': str(int((chunk + number) * audio.FRAME_MS)), 'payload': payload})
+            if speed:
+                await asyncio.sleep(max(0, started + (number + 1) * frame_seconds / speed - time.perf_counter()))
+            else:
+                await asyncio.sleep(0)
+        return chunk + len(payloads)
+
+    async def receive():
+        pending = 0
+        while True:
+            text = await connection.recv()
+            if text is None:
+                state["closed"] = True
+                state["answered"].set()
+                state["played"].set()
+                return
+            message = json.loads(text)
+            if message['event'] == 'media':
+                pending += 1
+                state["frames"] += 1
+                if state["waiting_since"] is not None:
+                    results["latencies"].append(time.perf_counter() - state["waiting_since"])
+                    state["waiting_since"] = None
+                    state["answered"].set()
+            elif message['event'] == 'mark':
+                # Twilio echoes a mark once the audio before it has been played
+                if speed:
+                    await asyncio.sleep(pending * frame_seconds / speed)
+                pending = 0
+                await send('mark', mark=message['mark'])
+                state["played"].set()
+            elif message['event'] == 'clear':
+                pending = 0
+                results["clears"] += 1
+
+    await connection.open()
+    listener = asyncio.ensure_future(receive())
+    await connection.send(json.dumps({'event': 'connected', 'protocol': 'Call', 'version': '1.0.0'}))
+    await send('start', start={'streamSid': stream_sid, 'callSid': call_sid, 'accountSid': 'AC0001',
+                               'tracks': ['inbound'], 'customParameters': {'From': f"+1555{index:07d}"},
+                               'mediaFormat': {'encoding': 'audio/x-mulaw', 'sampleRate': 8000, 'channels': 1}})
+    chunk = await send_audio(NOISE[:25], 1)
+    for utterance in utterances:
+        if state["closed"]:
+            break
+        chunk = await send_audio(utterance, chunk)
+        state["answered"].clear()
+        state["played"].clear()
+        state["waiting_since"] = time.perf_counter()
+        deadline = time.perf_counter() + ANSWER_TIMEOUT
+        while not state["answered"].is_set() and time.perf_counter() < deadline:
+            chunk = await send_audio(NOISE[chunk % 45:chunk % 45 + 5], chunk)
+        if not state["answered"].is_set():
+            results["timeouts"] += 1
+            state["waiting_since"] = None
+            continue
+        try:
+            await asyncio.wait_for(state["played"].wait(), ANSWER_TIMEOUT)
+        except asyncio.TimeoutError:
+            results["timeouts"] += 1
+        results["audio_seconds"] += len(utterance) * audio.FRAME_MS / 1000
+    if not state["closed"]:
+        await send('stop', stop={'accountSid': 'AC0001', 'callSid': call_sid})
+    results["frames_out"] += state["frames"]
+    await connection.close()
+    listener.cancel()
+
+
+def start_fakes(args):
+    """fake_providers in a separate process, so its threads do not share the GIL with the server"""
+    port = free_port()
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'fake_providers.py'), '--port', str(port),
+                                '--first-token-delay', str(args.provider_delay), '--token-delay', '0',
+                                '--transcription-delay', str(args.transcription_delay)], stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("fake_providers did not start")
+
+
+async def run(args, utterances):
+    fake = None
+    if args.url:
+        def connect():
+            return WebsocketConnection(args.url)
+    else:
+        fake, base_url = start_fakes(args)
+        os.environ.update(OPENAI_BASE_URL=base_url, OPENAI_API_KEY='sk-media', AI_PROVIDER='openai')
+        import asgi_server
+
+        def connect():
+            return ASGIConnection(asgi_server.app, asgi_server.MEDIA_STREAM_PATH)
+
+    results = {"latencies": [], "timeouts": 0, "clears": 0, "frames_out": 0, "audio_seconds": 0.0}
+    cpu, started = time.process_time(), time.perf_counter()
+    await asyncio.gather(*[run_call(connect(), index, utterances, args.speed, results)
+                           for index in range(args.streams)])
+    wall, cpu = time.perf_counter() - started, time.process_time() - cpu
+    if fake:
+        import http_client
+        await http_client.aclose()
+        fake.terminate()
+    return results, wall, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--url', help='ws:// URL of a running media stream endpoint (default: in-process)')
+    parser.add_argument('--wav', action='append', default=[], help='one caller turn; repeat for more turns')
+    parser.add_argument('--turns', type=int, default=2, help='synthetic turns per call when no --wav is given')
+    parser.add_argument('--streams', type=int, default=20, help='concurrent calls')
+    parser.add_argument('--speed', type=float, default=1.0, help='1 = real time, 0 = as fast as possible')
+    parser.add_argument('--provider-delay', type=float, default=0.3, help='fake LLM and speech latency (in-process)')
+    parser.add_argument('--transcription-delay', type=float, default=0.2, help='fake Whisper latency (in-process)')
+    args = parser.parse_args()
+
+    utterances = []
+    for path in args.wav:
+        samples, rate = audio.read_wav(path)
+        utterances.append(audio.resample(samples, rate, audio.SAMPLE_RATE))
+    utterances = [encode_frames(samples) for samples in
+                  utterances or [synthetic_utterance(seed=turn) for turn in range(args.turns)]]
+    if args.url:
+        try:
+            import websockets  # noqa: F401
+        except ImportError:
+            parser.error("--url needs the websockets package")
+
+    results, wall, cpu = asyncio.run(run(args, utterances))
+    latencies = sorted(results["latencies"])
+    print(f"streams:           {args.streams} × {len(utterances)} turns, speed {args.speed or 'max'}")
+    print(f"answers:           {len(latencies)} ({results['timeouts']} timed out), "
+          f"{results['frames_out']} frames received, {results['clears']} clears")
+    if latencies:
+        print(f"turn latency:      p50 {statistics.median(latencies) * 1000:.0f} ms, "
+              f"p95 {latencies[max(0, int(len(latencies) * 0.95) - 1)] * 1000:.0f} ms, "
+              f"max {latencies[-1] * 1000:.0f} ms (end of caller audio → first answer frame)")
+    print(f"wall / cpu:        {wall:.1f} s / {cpu:.2f} s (client and server), "
+          f"{cpu / max(results['audio_seconds'], 1e-9) * 1000:.1f} ms CPU per second of caller speech")
+    if not args.url:
+        import media_stream
+        print(f"server stats:      {media_stream.media_stream_stats()}")
+
+
+if __name__ == '__main__':
+    main()
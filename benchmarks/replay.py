@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Replay Twilio call sequences against the webhook servers and report latency per route
+Every call is a conversation as Twilio would drive it: the incoming webhook, a
+menu choice, several speech turns, the recording, its status callback and the
+hang-up, each posted with the form fields Twilio sends (CallSid, From,
+CallStatus, SpeechResult, RecordingUrl...). <Redirect> answers are followed the
+way Twilio follows them. Calls run concurrently against a real server process
+(server.py, or a simple_server*.py handler through serving.serve) whose
+OpenAI, Claude, Whisper, recording and Twilio Messages traffic goes to
+fake_providers on localhost, with log-normal latencies around the given medians.
+
+Sequences come from a JSONL file, one recorded call per line:
+
+    {"steps": [{"step": "incoming"}, {"step": "speech", "form": {"SpeechResult": "Hola"}}, {"step": "hangup"}]}
+
+or are generated from the utterances in slot_corpus.tsv. Steps are logical
+(incoming, gather, speech, recording, recording_status, hangup) and mapped to
+each target's routes; steps a target has no route for are skipped. The report
+gives count, error rate and p50/p95/p99 per route plus throughput, and the
+server's own stage timings from /metrics. --output writes the results as JSON;
+--baseline compares with an earlier file and exits 1 when a route's p95 or
+error rate regressed.
+
+Usage:
+    python -m benchmarks.replay --target server --calls 100 --concurrency 20
+    python -m benchmarks.replay --target all --llm-latency 0.6 --latency-sigma 0.5 --output replay.json
+    python -m benchmarks.replay --target simple_server_working --sequences calls.jsonl --baseline replay.json
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import http_client
+from benchmarks.bench_slots import load_corpus
+from fake_providers import FakeProviderServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_SIMPLE_ROUTES = {'incoming': '/', 'gather': '/gather', 'speech': '/speech', 'recording': '/recording',
+                  'hangup': '/'}
+
+# Logical step -> route per server; the hang-up is Twilio's final callback with CallStatus=completed
+TARGETS = {
+    'server': {
+        'serve': "import os, server; server.app.run(host='127.0.0.1', port=int(os.environ['PORT']), threaded=True)",
+        'ready': '/health',
+        'routes': {'incoming': '/webhook/incoming', 'gather': '/webhook/gather', 'speech': '/webhook/speech',
+                   'recording': '/webhook/recording', 'recording_status': '/webhook/recording-status',
+                   'hangup': '/webhook/recording'},
+    },
+    'simple_server': {'module': 'simple_server', 'routes': _SIMPLE_ROUTES},
+    'simple_server_fixed': {'module': 'simple_server_fixed', 'routes': _SIMPLE_ROUTES},
+    'simple_server_working': {
+        'module': 'simple_server_working',
+        'routes': {'incoming': '/', 'speech': '/speech', 'recording': '/recording', 'hangup': '/'},
+    },
+}
+for _target in TARGETS.values():
+    if 'module' in _target:
+        _target['serve'] = (f"import os, serving, {_target['module']}; "
+                            f"serving.serve({_target['module']}.WebhookHandler, int(os.environ['PORT']))")
+        _target['ready'] = '/metrics'
+
+MAX_REDIRECTS = 3
+_REDIRECT = re.compile(rb'<Redirect[^>]*>([^<]+)</Redirect>')
+_STAGE_LINE = re.compile(r'^receptionist_stage_seconds_(sum|count)\{(.*)\} (\S+)$')
+
+
+def synthetic_calls(count, turns, seed):
+    """count calls of incoming → menu → `turns` corpus utterances → recording → hang-up"""
+    rng = random.Random(seed)
+    utterances = [text for _, text in load_corpus()]
+    calls = []
+    for _ in range(count):
+        steps = [{"step": "incoming", "form": {"CallStatus": "ringing"}},
+                 {"step": "gather", "form": {"Digits": "1"}}]
+        steps += [{"step": "speech", "form": {"SpeechResult": rng.choice(utterances), "Confidence": "0.92"}}
+                  for _ in range(turns)]
+        steps += [{"step": "recording", "form": {"RecordingDuration": "5"}},
+                  {"step": "recording_status", "form": {"RecordingStatus": "completed"}},
+                  {"step": "hangup", "form": {"CallStatus": "completed"}}]
+        calls.append({"steps": steps})
+    return calls
+
+
+def load_calls(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip() and not line.startswith('#')]
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+class Replayer:
+    """Post call sequences to one running server and collect (route, seconds, ok) samples"""
+
+    def __init__(self, base_url, routes, fakes):
+        self.base_url = base_url
+        self.routes = routes
+        self.fakes = fakes
+        self.samples = []
+        self._lock = threading.Lock()
+        self._calls = 0
+
+    def _post(self, path, form):
+        route = path.split('?', 1)[0]
+        started = time.perf_counter()
+        try:
+            response = http_client.post(self.base_url + path, data=form, timeout=(http_client.CONNECT_TIMEOUT, 30),
+                                        allow_redirects=False)
+            body, ok = response.content, response.status_code < 400
+        except Exception as e:
+            body, ok = b'', False
+            print(f"❌ {route}: {e}")
+        with self._lock:
+            self.samples.append((route, time.perf_counter() - started, ok))
+        return body
+
+    def call(self, sequence, think=0.0):
+        with self._lock:
+            self._calls += 1
+            number = self._calls
+        call_sid = f"CA{number:032d}"
+        base = {"CallSid": call_sid, "AccountSid": "AC0001", "From": f"+1555{number:07d}", "To": "+15550000000",
+                "CallStatus": "in-progress", "Direction": "inbound"}
+        recording = self.fakes['openai'].recording_url(f"RE{number:032d}")
+        for step in sequence["steps"]:
+            path = self.routes.get(step["step"])
+            if path is None:
+                continue
+            form = dict(base, **step.get("form", {}))
+            if step["step"] in ('recording', 'recording_status'):
+                form.setdefault("RecordingUrl", recording)
+                form.setdefault("RecordingSid", recording.rsplit('/', 1)[-1])
+            body = self._post(path, form)
+            for _ in range(MAX_REDIRECTS):
+                redirect = _REDIRECT.search(body)
+                if not redirect:
+                    break
+                body = self._post(redirect.group(1).decode('utf-8').replace('&amp;', '&'), form)
+            if think:
+                time.sleep(think)
+
+
+def summarize(samples, wall, calls):
+    by_route = {}
+    for route, seconds, ok in samples:
+        by_route.setdefault(route, []).append((seconds, ok))
+    routes = {}
+    for route, results in sorted(by_route.items()):
+        latencies = sorted(seconds for seconds, _ in results)
+        errors = sum(1 for _, ok in results if not ok)
+        routes[route] = {"count": len(results), "errors": errors, "error_rate": round(errors / len(results), 4),
+                         "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+                         "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+                         "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+                         "max_ms": round(latencies[-1] * 1000, 1)}
+    errors = sum(1 for _, _, ok in samples if not ok)
+    return {"calls": calls, "requests": len(samples), "errors": errors, "wall_seconds": round(wall, 3),
+            "requests_per_second": round(len(samples) / wall, 1) if wall else 0.0,
+            "calls_per_second": round(calls / wall, 2) if wall else 0.0, "routes": routes}
+
+
+def server_stages(base_url):
+    """Average time per stage as the server measured it (from its /metrics)"""
+    try:
+        text = http_client.get(f"{base_url}/metrics", timeout=5).text
+    except Exception:
+        return {}
+    totals = {}
+    for line in text.splitlines():
+        match = _STAGE_LINE.match(line)
+        if match:
+            kind, labels, value = match.groups()
+            labels = dict(part.split('=', 1) for part in labels.split(','))
+            stage = labels.pop('stage').strip('"')
+            if labels:
+                stage += '[' + ','.join(value.strip('"') for value in labels.values()) + ']'
+            totals.setdefault(stage, {})[kind] = float(value)
+    return {stage: {"count": int(values.get('count', 0)),
+                    "avg_ms": round(values.get('sum', 0) * 1000 / values['count'], 2) if values.get('count') else 0.0}
+            for stage, values in sorted(totals.items())}
+
+
+def start_server(name, fakes, port, workdir, extra_env):
+    """Run a target in its own process (fresh caches and database) and wait until it answers"""
+    target = TARGETS[name]
+    fake_url = fakes['openai'].base_url
+    env = dict(os.environ, PYTHONPATH=ROOT, PORT=str(port), PYTHONUNBUFFERED='1',
+               OPENAI_API_KEY='sk-replay', OPENAI_BASE_URL=fake_url,
+               CLAUDE_API_KEY='sk-ant-replay', CLAUDE_BASE_URL=fakes['claude'].base_url,
+               TWILIO_ACCOUNT_SID='AC0001', TWILIO_AUTH_TOKEN='replay', TWILIO_PHONE_NUMBER='+15550000000',
+               TWILIO_API_BASE_URL=fake_url, NOTIFY_WEBHOOK_URL=fakes['openai'].webhook_url,
+               OWNER_PHONE_NUMBER='+15559999999', METRICS_TRACE_LOG='0')
+    env.update(extra_env)
+    log = open(os.path.join(workdir, f"{name}.log"), 'w')
+    process = subprocess.Popen([sys.executable, '-c', target['serve']], cwd=workdir, env=env,
+                               stdout=log, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            if http_client.get(base_url + target['ready'], timeout=1).status_code == 200:
+                return process, base_url
+        except Exception:
+            time.sleep(0.2)
+    process.kill()
+    log.close()
+    with open(log.name, encoding='utf-8', errors='replace') as f:
+        tail = f.read()[-2000:]
+    raise RuntimeError(f"{name} did not start:\n{tail}")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def run_target(name, calls, args, fakes, workdir, extra_env):
+    process, base_url = start_server(name, fakes, free_port(), workdir, extra_env)
+    try:
+        replayer = Replayer(base_url, TARGETS[name]['routes'], fakes)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            list(pool.map(lambda sequence: replayer.call(sequence, args.think), calls))
+        result = summarize(replayer.samples, time.perf_counter() - started, len(calls))
+        result["stages"] = server_stages(base_url)
+        return result
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def report(name, result):
+    print(f"\n🎯 {name}: {result['calls']} calls, {result['requests']} requests in {result['wall_seconds']:.1f} s "
+          f"({result['requests_per_second']} req/s, {result['calls_per_second']} calls/s), {result['errors']} errors")
+    print(f"   {'route':<28}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for route, stats in result["routes"].items():
+        print(f"   {route:<28}{stats['count']:>7}{stats['errors']:>8}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+              f"{stats['p99_ms']:>10}{stats['max_ms']:>10}")
+    if result["stages"]:
+        print("   server stages (avg ms): " + ", ".join(f"{stage} {stats['avg_ms']}"
+                                                       for stage, stats in result["stages"].items()))
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """Routes whose p95 grew by more than tolerance (and min_delta_ms) or whose error rate grew"""
+    regressions = []
+    for name, result in results["targets"].items():
+        for route, stats in result["routes"].items():
+            before = baseline.get("targets", {}).get(name, {}).get("routes", {}).get(route)
+            if not before:
+                continue
+            if (stats["p95_ms"] > before["p95_ms"] * (1 + tolerance)
+                    and stats["p95_ms"] - before["p95_ms"] > min_delta_ms):
+                regressions.append(f"{name} {route}: p95 {before['p95_ms']} → {stats['p95_ms']} ms")
+            if stats["error_rate"] > before["error_rate"] + 0.01:
+                regressions.append(f"{name} {route}: error rate {before['error_rate']} → {stats['error_rate']}")
+    return regressions
+
+
+def version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or 'unknown'
+    except (OSError, subprocess.SubprocessError):
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--target', default='server', choices=sorted(TARGETS) + ['all'])
+    parser.add_argument('--calls', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--turns', type=int, default=3, help='speech turns per synthetic call')
+    parser.add_argument('--think', type=float, default=0.0, help='seconds between the steps of a call')
+    parser.add_argument('--sequences', help='JSONL of recorded calls, replayed round-robin up to --calls')
+    parser.add_argument('--save-sequences', help='write the calls that were replayed as JSONL')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--llm-latency', type=float, default=0.4, help='median first-token delay of the fake LLMs')
+    parser.add_argument('--transcription-latency', type=float, default=0.3, help='median fake Whisper delay')
+    parser.add_argument('--latency-sigma', type=float, default=0.4, help='log-normal spread of the fake delays')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='extra environment for the server, e.g. STREAMING_ENABLED=1')
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--baseline', help='earlier --output file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative p95 growth')
+    parser.add_argument('--min-delta-ms', type=float, default=5.0, help='ignore p95 growth smaller than this')
+    args = parser.parse_args()
+
+    if args.sequences:
+        recorded = load_calls(args.sequences)
+        calls = [recorded[index % len(recorded)] for index in range(args.calls)]
+    else:
+        calls = synthetic_calls(args.calls, args.turns, args.seed)
+    if args.save_sequences:
+        with open(args.save_sequences, 'w', encoding='utf-8') as f:
+            for call in calls:
+                f.write(json.dumps(call, ensure_ascii=False) + '\n')
+    extra_env = dict(item.split('=', 1) for item in args.env)
+    random.seed(args.seed)
+
+    fakes = {
+        'openai': FakeProviderServer(first_token_delay=args.llm_latency, token_delay=0,
+                                     transcription_delay=args.transcription_latency,
+                                     recording_size=64 << 10, latency_sigma=args.latency_sigma),
+        'claude': FakeProviderServer(first_token_delay=args.llm_latency, token_delay=0,
+                                     latency_sigma=args.latency_sigma),
+    }
+    for fake in fakes.values():
+        fake.start()
+    targets = sorted(TARGETS) if args.target == 'all' else [args.target]
+    results = {"version": version(), "timestamp": datetime.now().isoformat(),
+               "config": {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+               "targets": {}}
+    print(f"🧪 {len(calls)} calls, {args.concurrency} at a time; LLM median {args.llm_latency}s, "
+          f"sigma {args.latency_sigma}")
+    try:
+        with tempfile.TemporaryDirectory(prefix='replay-') as workdir:
+            for name in targets:
+                results["targets"][name] = run_target(name, calls, args, fakes, workdir, extra_env)
+                report(name, results["targets"][name])
+    finally:
+        for fake in fakes.values():
+            fake.stop()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Results written to {args.output}")
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.min_delta_ms)
+        for line in regressions:
+            print(f"📉 {line}")
+        if regressions:
+            sys.exit(1)
+        print("✅ No regressions against the baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Structured, append-only call log: one row per call and one per turn
+call_store keeps only the live session; every turn is also queued here and a
+writer thread commits the queue in batches (group commit), so a webhook never
+waits on an fsync and concurrent processes never interleave partial records as
+they did in call_summaries.txt. Calls are indexed by caller and start time, so
+a caller's history is an index range scan even with millions of turns.
+
+Old calls are rotated into gzipped NDJSON archives (one file per month, one
+line per call with its turns) and the freed pages are compacted.
+
+Usage:
+    python call_log.py history +5215550000 [limit]
+    python call_log.py call CA0123...
+    python call_log.py day 2026-10-17
+    python call_log.py rotate [days]
+    python call_log.py stats
+
+Environment:
+    CALL_LOG_ENABLED        record turns (default true)
+    CALL_LOG_PATH           SQLite file (default call_log.db)
+    CALL_LOG_BATCH          most records per commit (default 500)
+    CALL_LOG_FLUSH_MS       longest a record waits for its batch (default 50)
+    CALL_LOG_RETENTION_DAYS calls older than this are archived by rotate (default 90)
+    CALL_LOG_ARCHIVE_DIR    where archives are written (default call_log_archive)
+"""
+
+import datetime
+import gzip
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+CALL_LOG_ENABLED = os.getenv('CALL_LOG_ENABLED', 'true').lower() == 'true'
+CALL_LOG_PATH = os.getenv('CALL_LOG_PATH', 'call_log.db')
+BATCH_SIZE = int(os.getenv('CALL_LOG_BATCH', 500))
+FLUSH_MS = float(os.getenv('CALL_LOG_FLUSH_MS', 50))
+RETENTION_DAYS = int(os.getenv('CALL_LOG_RETENTION_DAYS', 90))
+ARCHIVE_DIR = os.getenv('CALL_LOG_ARCHIVE_DIR', 'call_log_archive')
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS calls (
+        call_sid TEXT PRIMARY KEY,
+        caller TEXT NOT NULL DEFAULT '',
+        started REAL NOT NULL,
+        ended REAL,
+        turns INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS turns (
+        id INTEGER PRIMARY KEY,
+        call_sid TEXT NOT NULL,
+        ts REAL NOT NULL,
+        user_text TEXT NOT NULL,
+        ai_text TEXT NOT NULL,
+        latency_ms REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_calls_caller ON calls (caller, started);
+    CREATE INDEX IF NOT EXISTS idx_calls_started ON calls (started);
+    CREATE INDEX IF NOT EXISTS idx_turns_call ON turns (call_sid, ts);
+'''
+
+
+def _day_bounds(day):
+    start = datetime.datetime.strptime(day, "%Y-%m-%d").timestamp()
+    return start, start + 86400
+
+
+class CallLog:
+    """SQLite call log with a background group-commit writer"""
+
+    def __init__(self, path=CALL_LOG_PATH, batch_size=BATCH_SIZE, flush_ms=FLUSH_MS):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self._local = threading.local()
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._writer_pid = None
+        self._stats = {"queued": 0, "written": 0, "commits": 0, "errors": 0, "commit_seconds": 0.0}
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            # Only takes effect on a new file, and only before the switch to WAL
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _put(self, item):
+        if self._writer_pid != os.getpid():
+            with self._lock:
+                if self._writer_pid != os.getpid():
+                    # After a fork the parent's queue has no writer; the pid is set last so no
+                    # thread skips the lock while self._queue still points at the old queue
+                    pending = queue.SimpleQueue()
+                    self._queue = pending
+                    threading.Thread(target=self._write_loop, args=(pending,), name='call-log-writer',
+                                     daemon=True).start()
+                    self._writer_pid = os.getpid()
+        self._queue.put(item)
+
+    def start_call(self, call_sid, caller, started=None):
+        """Queue the call row when the call comes in, so calls without turns are logged too"""
+        self._put(('start', (call_sid, caller or '', started or time.time())))
+
+    def record_turn(self, call_sid, caller, user_text, ai_text, ts=None, latency_ms=None):
+        """Queue one turn; returns immediately"""
+        self._put(('turn', (call_sid, caller or '', ts or time.time(), user_text or '', ai_text or '', latency_ms)))
+        with self._lock:
+            self._stats["queued"] += 1
+
+    def end_call(self, call_sid, ended=None):
+        self._put(('end', (ended or time.time(), call_sid)))
+
+    def flush(self, timeout=10):
+        """Wait until everything queued so far is committed"""
+        done = threading.Event()
+        self._put(('flush', done))
+        return done.wait(timeout)
+
+    def _write_loop(self, pending):
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _commit(self, batch):
+        starts = [item for kind, item in batch if kind == 'start']
+        turns = [item for kind, item in batch if kind == 'turn']
+        ends = [item for kind, item in batch if kind == 'end']
+        started = time.perf_counter()
+        conn = self._conn()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('''
+                INSERT INTO calls (call_sid, caller, started, turns) VALUES (?, ?, ?, 0)
+                ON CONFLICT (call_sid) DO UPDATE SET started = MIN(calls.started, excluded.started),
+                    caller = CASE WHEN calls.caller = '' THEN excluded.caller ELSE calls.caller END
+            ''', starts)
+            conn.executemany('''
+                INSERT INTO calls (call_sid, caller, started, turns) VALUES (?, ?, ?, 1)
+                ON CONFLICT (call_sid) DO UPDATE SET turns = turns + 1,
+                    caller = CASE WHEN calls.caller = '' THEN excluded.caller ELSE calls.caller END
+            ''', [(call_sid, caller, ts) for call_sid, caller, ts, *_ in turns])
+            conn.executemany('INSERT INTO turns (call_sid, ts, user_text, ai_text, latency_ms) VALUES (?, ?, ?, ?, ?)',
+                             [(call_sid, ts, user_text, ai_text, latency_ms)
+                              for call_sid, _, ts, user_text, ai_text, latency_ms in turns])
+            conn.executemany('UPDATE calls SET ended = ? WHERE call_sid = ? AND ended IS NULL', ends)
+            conn.execute('COMMIT')
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            print(f"❌ Call log commit failed ({len(turns)} turns lost): {e}")
+            with self._lock:
+                self._stats["errors"] += 1
+        else:
+            with self._lock:
+                self._stats["written"] += len(turns)
+                self._stats["commits"] += 1
+                self._stats["commit_seconds"] += time.perf_counter() - started
+        for kind, item in batch:
+            if kind == 'flush':
+                item.set()
+
+    def _turns(self, call_sids):
+        turns = {call_sid: [] for call_sid in call_sids}
+        if not call_sids:
+            return turns
+        placeholders = ','.join('?' * len(call_sids))
+        rows = self._conn().execute(
+            f'SELECT call_sid, ts, user_text, ai_text, latency_ms FROM turns '
+            f'WHERE call_sid IN ({placeholders}) ORDER BY call_sid, ts', call_sids)
+        for call_sid, ts, user_text, ai_text, latency_ms in rows:
+            turns[call_sid].append({"ts": ts, "user": user_text, "ai": ai_text, "latency_ms": latency_ms})
+        return turns
+
+    def _calls(self, rows, with_turns=True):
+        calls = [{"call_sid": call_sid, "caller": caller, "started": started, "ended": ended, "turn_count": count}
+                 for call_sid, caller, started, ended, count in rows]
+        if with_turns:
+            turns = self._turns([call["call_sid"] for call in calls])
+            for call in calls:
+                call["turns"] = turns[call["call_sid"]]
+        return calls
+
+    def caller_history(self, caller, limit=20):
+        """A caller's most recent calls with their turns, newest first"""
+        rows = self._conn().execute(
+            'SELECT call_sid, caller, started, ended, turns FROM calls WHERE caller = ? ORDER BY started DESC LIMIT ?',
+            (caller, limit))
+        return self._calls(rows)
+
+    def call(self, call_sid):
+        rows = self._conn().execute('SELECT call_sid, caller, started, ended, turns FROM calls WHERE call_sid = ?',
+                                    (call_sid,))
+        calls = self._calls(rows)
+        return calls[0] if calls else None
+
+    def calls_on(self, day, limit=1000):
+        """Calls started on a local date (YYYY-MM-DD), without their turns"""
+        start, end = _day_bounds(day)
+        rows = self._conn().execute(
+            'SELECT call_sid, caller, started, ended, turns FROM calls WHERE started >= ? AND started < ? '
+            'ORDER BY started LIMIT ?', (start, end, limit))
+        return self._calls(rows, with_turns=False)
+
+    def rotate(self, older_than_days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR, batch=1000):
+        """Archive calls older than the cutoff to monthly gzipped NDJSON, delete them and compact"""
+        cutoff = time.time() - older_than_days * 86400
+        conn = self._conn()
+        os.makedirs(archive_dir, exist_ok=True)
+        archived = 0
+        while True:
+            calls = self._calls(conn.execute(
+                'SELECT call_sid, caller, started, ended, turns FROM calls WHERE started < ? ORDER BY started LIMIT ?',
+                (cutoff, batch)).fetchall())
+            if not calls:
+                break
+            by_month = {}
+            for call in calls:
+                by_month.setdefault(time.strftime("%Y-%m", time.localtime(call["started"])), []).append(call)
+            for month, month_calls in by_month.items():
+                # gzip members can be appended; readers see one continuous stream
+                with gzip.open(os.path.join(archive_dir, f"call_log-{month}.ndjson.gz"), 'at', encoding='utf-8') as f:
+                    for call in month_calls:
+                        f.write(json.dumps(call, ensure_ascii=False) + "\n")
+            call_sids = [call["call_sid"] for call in calls]
+            placeholders = ','.join('?' * len(call_sids))
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(f'DELETE FROM turns WHERE call_sid IN ({placeholders})', call_sids)
+            conn.execute(f'DELETE FROM calls WHERE call_sid IN ({placeholders})', call_sids)
+            conn.execute('COMMIT')
+            archived += len(calls)
+        if archived:
+            # executescript steps the pragma to completion; execute() frees a single page
+            conn.executescript('PRAGMA incremental_vacuum')
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        print(f"🗄️ Call log rotated: {archived} calls archived to {archive_dir}")
+        return archived
+
+    def stats(self):
+        """Queue and commit counters plus average batch size and commit time"""
+        with self._lock:
+            stats = dict(self._stats)
+        commit_seconds = stats.pop("commit_seconds")
+        stats["pending"] = stats["queued"] - stats["written"]
+        stats["batch_avg"] = round(stats["written"] / stats["commits"], 1) if stats["commits"] else 0.0
+        stats["commit_ms_avg"] = round(commit_seconds * 1000 / stats["commits"], 2) if stats["commits"] else 0.0
+        return stats
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_log():
+    global _log
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                _log = CallLog()
+    return _log
+
+
+def start_call(call_sid, caller):
+    if CALL_LOG_ENABLED and call_sid:
+        get_log().start_call(call_sid, caller)
+
+
+def record_turn(call_sid, caller, user_text, ai_text, ts=None, latency_ms=None):
+    if CALL_LOG_ENABLED and call_sid:
+        get_log().record_turn(call_sid, caller, user_text, ai_text, ts, latency_ms)
+
+
+def end_call(call_sid):
+    if CALL_LOG_ENABLED and call_sid:
+        get_log().end_call(call_sid)
+
+
+def caller_history(caller, limit=20):
+    return get_log().caller_history(caller, limit)
+
+
+def call_log_stats():
+    return get_log().stats() if _log is not None else {}
+
+
+if __name__ == '__main__':
+    command, args = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 1 else ('stats', [])
+    log = get_log()
+    if command == 'history' and args:
+        started = time.perf_counter()
+        history = log.caller_history(args[0], int(args[1]) if len(args) > 1 else 20)
+        print(json.dumps(history, ensure_ascii=False, indent=2))
+        print(f"⏱️ {len(history)} calls in {(time.perf_counter() - started) * 1000:.2f} ms", file=sys.stderr)
+    elif command == 'call' and args:
+        print(json.dumps(log.call(args[0]), ensure_ascii=False, indent=2))
+    elif command == 'day' and args:
+        print(json.dumps(log.calls_on(args[0]), ensure_ascii=False, indent=2))
+    elif command == 'rotate':
+        log.rotate(int(args[0]) if args else RETENTION_DAYS)
+    else:
+        conn = log._conn()
+        print(json.dumps({"calls": conn.execute('SELECT COUNT(*) FROM calls').fetchone()[0],
+                          "turns": conn.execute('SELECT COUNT(*) FROM turns').fetchone()[0]}))
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Per-call conversation state keyed by Twilio CallSid
+BaseHTTPRequestHandler is created per request, so anything kept on the handler
+is lost between turns. Sessions live here instead, in one of three backends:
+
+    memory   in-process LRU with TTL (default)
+    sqlite   SQLite file in WAL mode, shared by prefork workers
+    redis    any server speaking the Redis protocol (RESP)
+
+Environment:
+    CALL_STORE          memory | sqlite | redis
+    CALL_STORE_PATH     SQLite file (default call_sessions.db)
+    CALL_STORE_URL      redis://host:port/db (default redis://127.0.0.1:6379/0)
+    CALL_STORE_TTL      seconds an idle call is kept (default 7200)
+    CALL_ENDED_TTL      seconds a finished call is kept for summaries (default 300)
+    CALL_MAX_CALLS      memory backend capacity (default 10000)
+    CALL_MAX_TURNS      turns kept per call (default 50)
+    CALL_MAX_TEXT       characters kept per utterance / answer (default 1000)
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import call_log
+
+CALL_STORE = os.getenv('CALL_STORE', 'memory')
+CALL_STORE_PATH = os.getenv('CALL_STORE_PATH', 'call_sessions.db')
+CALL_STORE_URL = os.getenv('CALL_STORE_URL', 'redis://127.0.0.1:6379/0')
+CALL_STORE_TTL = int(os.getenv('CALL_STORE_TTL', 7200))
+CALL_ENDED_TTL = int(os.getenv('CALL_ENDED_TTL', 300))
+MAX_CALLS = int(os.getenv('CALL_MAX_CALLS', 10000))
+MAX_TURNS = int(os.getenv('CALL_MAX_TURNS', 50))
+MAX_TEXT = int(os.getenv('CALL_MAX_TEXT', 1000))
+
+ENDED_STATUSES = {'completed', 'busy', 'failed', 'no-answer', 'canceled'}
+
+
+class MemoryStore:
+    """LRU of sessions with per-entry expiry; all operations are O(1)"""
+
+    def __init__(self, max_calls=MAX_CALLS):
+        self.max_calls = max_calls
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, call_sid):
+        with self._lock:
+            entry = self._data.get(call_sid)
+            if entry is None:
+                return None
+            expires_at, session = entry
+            if expires_at < time.time():
+                del self._data[call_sid]
+                return None
+            self._data.move_to_end(call_sid)
+            return json.loads(session)
+
+    def put(self, call_sid, session, ttl=CALL_STORE_TTL):
+        # Stored serialized so callers never share mutable state across threads
+        with self._lock:
+            self._data[call_sid] = (time.time() + ttl, json.dumps(session))
+            self._data.move_to_end(call_sid)
+            while len(self._data) > self.max_calls:
+                self._data.popitem(last=False)
+
+    def update(self, call_sid, change, ttl=CALL_STORE_TTL):
+        """Apply change(session or None) under the store lock; a None result leaves the entry as is"""
+        with self._lock:
+            entry = self._data.get(call_sid)
+            current = json.loads(entry[1]) if entry and entry[0] >= time.time() else None
+            session = change(current)
+            if session is not None:
+                self._data[call_sid] = (time.time() + ttl, json.dumps(session))
+                self._data.move_to_end(call_sid)
+                while len(self._data) > self.max_calls:
+                    self._data.popitem(last=False)
+            return session
+
+    def delete(self, call_sid):
+        with self._lock:
+            self._data.pop(call_sid, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteStore:
+    """Sessions in a WAL-mode SQLite table; safe across threads and processes"""
+
+    def __init__(self, path=CALL_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._conn()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS call_sessions (
+                call_sid TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_call_sessions_expires ON call_sessions (expires_at)')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, call_sid):
+        row = self._conn().execute(
+            'SELECT data FROM call_sessions WHERE call_sid = ? AND expires_at >= ?',
+            (call_sid, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, call_sid, session, ttl=CALL_STORE_TTL):
+        conn = self._conn()
+        conn.execute('INSERT OR REPLACE INTO call_sessions (call_sid, data, expires_at) VALUES (?, ?, ?)',
+                     (call_sid, json.dumps(session), time.time() + ttl))
+        self._writes += 1
+        if self._writes % 100 == 0:
+            conn.execute('DELETE FROM call_sessions WHERE expires_at < ?', (time.time(),))
+
+    def update(self, call_sid, change, ttl=CALL_STORE_TTL):
+        """Read, change and write one session inside BEGIN IMMEDIATE, so other processes wait their turn"""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            session = change(self.get(call_sid))
+            if session is not None:
+                conn.execute('INSERT OR REPLACE INTO call_sessions (call_sid, data, expires_at) VALUES (?, ?, ?)',
+                             (call_sid, json.dumps(session), time.time() + ttl))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return session
+
+    def delete(self, call_sid):
+        self._conn().execute('DELETE FROM call_sessions WHERE call_sid = ?', (call_sid,))
+
+
+class RedisStore:
+    """Sessions as JSON strings with EX expiry, over a minimal RESP client"""
+
+    def __init__(self, url=CALL_STORE_URL, prefix='call:'):
+        parts = urlsplit(url)
+        self.address = (parts.hostname or '127.0.0.1', parts.port or 6379)
+        self.db = int(parts.path.lstrip('/') or 0)
+        self.password = parts.password
+        self.prefix = prefix
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection(self.address, timeout=2)
+        self._local.sock, self._local.rfile, self._local.pid = sock, sock.makefile('rb'), os.getpid()
+        if self.password:
+            self._command('AUTH', self.password)
+        if self.db:
+            self._command('SELECT', self.db)
+
+    def _command(self, *args):
+        parts = [str(arg).encode('utf-8') for arg in args]
+        payload = b'*%d\r\n' % len(parts) + b''.join(b'$%d\r\n%s\r\n' % (len(p), p) for p in parts)
+        self._local.sock.sendall(payload)
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self._local.rfile.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode('utf-8')
+        if kind == b'-':
+            raise RuntimeError(rest.decode('utf-8'))
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            return self._local.rfile.read(length + 2)[:-2].decode('utf-8')
+        if kind == b'*':
+            return [self._read_reply() for _ in range(int(rest))]
+        raise RuntimeError(f"Unexpected Redis reply: {line!r}")
+
+    def execute(self, *args):
+        """Run one command, reconnecting once if the pooled socket went away"""
+        for attempt in range(2):
+            if getattr(self._local, 'sock', None) is None or self._local.pid != os.getpid():
+                self._connect()
+            try:
+                return self._command(*args)
+            except (ConnectionError, OSError):
+                self._local.sock = None
+                if attempt:
+                    raise
+
+    def get(self, call_sid):
+        data = self.execute('GET', self.prefix + call_sid)
+        return json.loads(data) if data else None
+
+    def put(self, call_sid, session, ttl=CALL_STORE_TTL):
+        self.execute('SET', self.prefix + call_sid, json.dumps(session), 'EX', int(ttl))
+
+    def update(self, call_sid, change, ttl=CALL_STORE_TTL, retries=20):
+        """Optimistic WATCH/MULTI/EXEC; change() runs again if another writer got in first"""
+        key = self.prefix + call_sid
+        for _ in range(retries):
+            self.execute('WATCH', key)
+            data = self._command('GET', key)
+            session = change(json.loads(data) if data else None)
+            if session is None:
+                self._command('UNWATCH')
+                return None
+            self._command('MULTI')
+            self._command('SET', key, json.dumps(session), 'EX', int(ttl))
+            if self._command('EXEC') is not None:
+                return session
+        raise RuntimeError(f"Session {call_sid} kept changing under update")
+
+    def delete(self, call_sid):
+        self.execute('DEL', self.prefix + call_sid)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Process-wide store selected by CALL_STORE"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if CALL_STORE == 'sqlite':
+                    _store = SQLiteStore()
+                elif CALL_STORE == 'redis':
+                    _store = RedisStore()
+                else:
+                    _store = MemoryStore()
+    return _store
+
+
+def set_store(store):
+    """Replace the process-wide store (e.g. with a stand-in backend)"""
+    global _store
+    _store = store
+
+
+def new_session(call_sid, caller=""):
+    return {"call_sid": call_sid, "caller": caller, "turns": [], "summary": "",
+            "slots": {}, "started": time.time(), "ended": False}
+
+
+def load_session(call_sid, caller=""):
+    """Session for call_sid, or a fresh one if the call is unknown"""
+    session = get_store().get(call_sid) if call_sid else None
+    return session or new_session(call_sid, caller)
+
+
+def append_turn(call_sid, user_message, ai_response, timestamp=None, caller="", **extra):
+    """Add one user/AI exchange, keeping at most MAX_TURNS per call"""
+    turn = {
+        "timestamp": timestamp or time.strftime("%Y-%m-%d %H:%M:%S"),
+        "user": (user_message or "")[:MAX_TEXT],
+        "ai": (ai_response or "")[:MAX_TEXT],
+    }
+    turn.update(extra)
+
+    def add(session):
+        session = session or new_session(call_sid, caller)
+        session["caller"] = session["caller"] or caller
+        turns = session["turns"] + [turn]
+        dropped = max(0, len(turns) - MAX_TURNS)
+        session["turns"] = turns[dropped:]
+        if dropped and session.get("compacted"):
+            session["compacted"] = max(0, session["compacted"] - dropped)
+        return session
+
+    session = get_store().update(call_sid, add) if call_sid else add(None)
+    call_log.record_turn(call_sid, session["caller"], turn["user"], turn["ai"], latency_ms=extra.get("latency_ms"))
+    return turn
+
+
+def update_session(call_sid, **fields):
+    """Merge fields into the stored session and return it; atomic across workers"""
+    def merge(session):
+        session = session or new_session(call_sid)
+        session.update(fields)
+        return session
+
+    return get_store().update(call_sid, merge) if call_sid else merge(None)
+
+
+def start_call(call_sid, caller=""):
+    """Log the call when Twilio first posts it, before any turn"""
+    if call_sid:
+        call_log.start_call(call_sid, caller)
+
+
+def end_call(call_sid):
+    """Mark the call finished; its state expires after CALL_ENDED_TTL"""
+    if not call_sid:
+        return
+    call_log.end_call(call_sid)
+
+    def mark_ended(session):
+        if session is not None:
+            session["ended"] = True
+        return session
+
+    get_store().update(call_sid, mark_ended, ttl=CALL_ENDED_TTL)
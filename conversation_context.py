@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Conversation context builder with a token budget
+Builds the messages sent to the LLM from the call session kept in call_store:
+the system prompt stays fixed, recent turns are added newest-first while they
+fit, and turns that no longer fit are folded into a short running summary
+(caller name / phone / reason plus a few clipped lines) instead of being dropped.
+
+Environment:
+    CONTEXT_TOKEN_BUDGET    tokens allowed for summary + history + utterance (default 600)
+    CONTEXT_SUMMARY_TOKENS  cap on the running summary (default 120)
+"""
+
+import os
+import re
+import threading
+
+TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', 600))
+SUMMARY_TOKENS = int(os.getenv('CONTEXT_SUMMARY_TOKENS', 120))
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD = 4
+
+_PHONE = re.compile(r'(?:\+?\d[\d\s-]{4,}\d)')
+_NAME = re.compile(r'\b(?:me llamo|mi nombre es|soy)\s+([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+)', re.IGNORECASE)
+_REASON = re.compile(r'\b(?:para|porque|quiero|necesito|quisiera)\b\s+(.{5,80})', re.IGNORECASE)
+
+_lock = threading.Lock()
+_stats = {"turns": 0, "tokens_total": 0, "tokens_max": 0, "compactions": 0}
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for Spanish/English text)"""
+    return len(text) // CHARS_PER_TOKEN + 1 if text else 0
+
+
+def _message_tokens(message):
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+
+def extract_slots(text, slots=None):
+    """Fill name / phone / reason from free text without an LLM call"""
+    slots = dict(slots or {})
+    if not slots.get("phone"):
+        match = _PHONE.search(text)
+        if match:
+            slots["phone"] = re.sub(r'[\s-]', '', match.group(0))
+    if not slots.get("name"):
+        match = _NAME.search(text)
+        if match:
+            slots["name"] = match.group(1).capitalize()
+    if not slots.get("reason"):
+        match = _REASON.search(text)
+        if match:
+            slots["reason"] = match.group(1).strip(' .,')
+    return slots
+
+
+def compact(summary, slots, turns):
+    """Fold turns into the running summary, keeping it under SUMMARY_TOKENS"""
+    for turn in turns:
+        slots = extract_slots(turn.get("user", ""), slots)
+    lines = [line for line in summary.splitlines() if line.startswith("- ")]
+    lines += [f"- Cliente: {turn.get('user', '')[:80]}" for turn in turns]
+    known = ", ".join(f"{key}={value}" for key, value in slots.items() if value)
+    header = f"Datos conocidos: {known}" if known else ""
+    while lines and estimate_tokens("\n".join([header] + lines)) > SUMMARY_TOKENS:
+        lines.pop(0)
+    return "\n".join(line for line in [header] + lines if line), slots
+
+
+def build_context(system_prompt, session, user_message, budget=TOKEN_BUDGET):
+    """Return (system, messages, updates) for the next LLM call
+
+    system   system prompt plus the running summary, if any
+    messages alternating user/assistant history ending with user_message
+    updates  session fields to persist when older turns were compacted
+    """
+    turns = session.get("turns", [])
+    start = min(session.get("compacted", 0), len(turns))
+    summary = session.get("summary", "")
+    slots = session.get("slots", {})
+    current = {"role": "user", "content": user_message}
+
+    # Reserve room for the summary as it may grow when turns are compacted below
+    reserve = SUMMARY_TOKENS if summary or len(turns) > start else 0
+    remaining = budget - reserve - _message_tokens(current)
+    history = []
+    keep_from = len(turns)
+    for index in range(len(turns) - 1, start - 1, -1):
+        pair = [{"role": "user", "content": turns[index]["user"]},
+                {"role": "assistant", "content": turns[index]["ai"]}]
+        cost = sum(_message_tokens(message) for message in pair)
+        if cost > remaining:
+            break
+        remaining -= cost
+        history = pair + history
+        keep_from = index
+
+    updates = {}
+    if keep_from > start:
+        summary, slots = compact(summary, slots, turns[start:keep_from])
+        # The stored turns stay intact for summaries; only the window moves
+        updates = {"summary": summary, "slots": slots, "compacted": keep_from}
+        with _lock:
+            _stats["compactions"] += 1
+
+    system = system_prompt
+    if summary:
+        system = f"{system_prompt}\n\nResumen de la conversación hasta ahora:\n{summary}"
+    messages = history + [current]
+    record_tokens(estimate_tokens(system) + MESSAGE_OVERHEAD + sum(_message_tokens(m) for m in messages))
+    return system, messages, updates
+
+
+def record_tokens(tokens):
+    with _lock:
+        _stats["turns"] += 1
+        _stats["tokens_total"] += tokens
+        _stats["tokens_max"] = max(_stats["tokens_max"], tokens)
+    print(f"🧮 Prompt tokens (est.): {tokens}")
+
+
+def context_stats():
+    """Estimated prompt tokens sent per turn and compaction count"""
+    with _lock:
+        stats = dict(_stats)
+    stats["tokens_avg"] = round(stats["tokens_total"] / stats["turns"], 1) if stats["turns"] else 0.0
+    return stats
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Appointments database access
+One connection per thread (re-opened after a fork, so every gunicorn worker
+gets its own), WAL mode so readers never block the writer, and a busy timeout
+so concurrent writers queue instead of failing with "database is locked".
+Appointments are written only through scheduling.Scheduler.book, which also
+claims their blocks in appointment_slots.
+The schema is versioned with PRAGMA user_version; MIGRATIONS are applied in
+order inside one write transaction, so several workers starting at once
+migrate exactly once. Statements are fixed strings, so sqlite3's per-connection
+statement cache compiles each of them only once.
+
+Environment:
+    APPOINTMENTS_DB       SQLite file (default appointments.db)
+    DB_BUSY_TIMEOUT_MS    how long a writer waits for the lock (default 5000)
+    DB_CACHE_KB           page cache per connection (default 8192)
+    DB_MMAP_BYTES         memory-mapped I/O size (default 67108864)
+"""
+
+import contextlib
+import os
+import sqlite3
+import threading
+
+APPOINTMENTS_DB = os.getenv('APPOINTMENTS_DB', 'appointments.db')
+BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', 5000))
+CACHE_KB = int(os.getenv('DB_CACHE_KB', 8192))
+MMAP_BYTES = int(os.getenv('DB_MMAP_BYTES', 64 << 20))
+
+# (version, statements); append new entries, never edit applied ones
+MIGRATIONS = [
+    (1, '''
+        CREATE TABLE IF NOT EXISTS appointments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            client_name TEXT,
+            client_phone TEXT,
+            service_type TEXT,
+            appointment_date TEXT,
+            appointment_time TEXT,
+            status TEXT DEFAULT 'scheduled',
+            notes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    '''),
+    (2, '''
+        CREATE INDEX IF NOT EXISTS idx_appointments_slot ON appointments (appointment_date, appointment_time);
+        CREATE INDEX IF NOT EXISTS idx_appointments_phone ON appointments (client_phone);
+    '''),
+    # One row per occupied block: the primary key is what makes double booking impossible
+    (3, '''
+        ALTER TABLE appointments ADD COLUMN duration_minutes INTEGER;
+        CREATE TABLE IF NOT EXISTS appointment_slots (
+            appointment_date TEXT NOT NULL,
+            minute INTEGER NOT NULL,
+            appointment_id INTEGER NOT NULL REFERENCES appointments (id) ON DELETE CASCADE,
+            PRIMARY KEY (appointment_date, minute)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_appointment_slots_id ON appointment_slots (appointment_id);
+        INSERT OR IGNORE INTO appointment_slots (appointment_date, minute, appointment_id)
+            SELECT appointment_date,
+                   CAST(substr(appointment_time, 1, 2) AS INTEGER) * 60 + CAST(substr(appointment_time, 4, 2) AS INTEGER),
+                   id
+            FROM appointments
+            WHERE status = 'scheduled' AND appointment_time GLOB '[0-2][0-9]:[0-5][0-9]';
+    '''),
+]
+
+SELECT_COLUMNS = ('id, client_name, client_phone, service_type, appointment_date, appointment_time, status, notes, '
+                  'created_at, duration_minutes')
+
+_local = threading.local()
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+
+def _open(path):
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None, cached_statements=256)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA cache_size=-{CACHE_KB}')
+    conn.execute(f'PRAGMA mmap_size={MMAP_BYTES}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA foreign_keys=ON')
+    return conn
+
+
+def connection(path=None):
+    """This thread's connection to path, migrated to the latest schema"""
+    path = path or APPOINTMENTS_DB
+    conns = getattr(_local, 'conns', None)
+    if conns is None or getattr(_local, 'pid', None) != os.getpid():
+        conns = _local.conns = {}
+        _local.pid = os.getpid()
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = _open(path)
+        if path not in _migrated:
+            with _migrate_lock:
+                migrate(conn)
+                _migrated.add(path)
+    return conn
+
+
+def migrate(conn):
+    """Apply the migrations newer than the file's user_version; returns the final version"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for target, script in MIGRATIONS:
+            if target > version:
+                for statement in script.split(';'):
+                    if statement.strip():
+                        conn.execute(statement)
+                conn.execute(f'PRAGMA user_version={target}')
+                version = target
+                print(f"🗃️ Database migrated to version {target}")
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return version
+
+
+@contextlib.contextmanager
+def transaction(path=None):
+    """BEGIN IMMEDIATE ... COMMIT on this thread's connection (ROLLBACK on error)"""
+    conn = connection(path)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+def appointments_on(appointment_date, path=None):
+    rows = connection(path).execute(
+        f'SELECT {SELECT_COLUMNS} FROM appointments WHERE appointment_date = ? ORDER BY appointment_time',
+        (appointment_date,))
+    return [dict(row) for row in rows]
+
+
+def appointments_for_phone(client_phone, path=None):
+    rows = connection(path).execute(
+        f'SELECT {SELECT_COLUMNS} FROM appointments WHERE client_phone = ? ORDER BY appointment_date, appointment_time',
+        (client_phone,))
+    return [dict(row) for row in rows]
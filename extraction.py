@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+Appointment slot filling: local parsers first, structured LLM extraction second
+Every caller turn goes through cheap regex / number parsers for dates ("el 15
+de noviembre", "mañana", "el martes", 15/11), times ("a las diez y media de la
+mañana", 16:30), phone numbers, "me llamo ..." names and known services. Only
+when a field is still missing is the provider asked, in its strict
+structured-output mode (OpenAI json_schema, Claude forced tool call), so the
+answer is an object matching SCHEMA instead of prose to be parsed.
+
+Filled fields are kept on the call session under "appointment" and merged turn
+after turn, so the follow-up question only asks for what is still missing.
+
+Environment:
+    AI_PROVIDER               openai | claude (default openai)
+    OPENAI_API_KEY / CLAUDE_API_KEY
+    OPENAI_BASE_URL / CLAUDE_BASE_URL
+    EXTRACTION_OPENAI_MODEL   (default gpt-4o-mini)
+    EXTRACTION_CLAUDE_MODEL   (default claude-3-5-haiku-20241022)
+"""
+
+import datetime
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+
+import call_store
+import http_client
+import metrics
+import scheduling
+
+AI_PROVIDER = os.getenv('AI_PROVIDER', 'openai')
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
+CLAUDE_API_KEY = os.getenv('CLAUDE_API_KEY', '')
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com')
+CLAUDE_BASE_URL = os.getenv('CLAUDE_BASE_URL', 'https://api.anthropic.com')
+OPENAI_MODEL = os.getenv('EXTRACTION_OPENAI_MODEL', 'gpt-4o-mini')
+CLAUDE_MODEL = os.getenv('EXTRACTION_CLAUDE_MODEL', 'claude-3-5-haiku-20241022')
+
+FIELDS = ("client_name", "service_type", "preferred_date", "preferred_time", "notes")
+# What a booking needs; client_phone comes from the caller or the local parser, never the LLM
+REQUIRED = ("client_name", "client_phone", "preferred_date", "preferred_time")
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "client_name": {"type": ["string", "null"], "description": "Nombre del cliente"},
+        "service_type": {"type": ["string", "null"], "description": "Servicio solicitado"},
+        "preferred_date": {"type": ["string", "null"], "description": "Fecha preferida, YYYY-MM-DD"},
+        "preferred_time": {"type": ["string", "null"], "description": "Hora preferida, HH:MM en 24 horas"},
+        "notes": {"type": ["string", "null"], "description": "Otros detalles que mencionó el cliente"},
+    },
+    "required": list(FIELDS),
+    "additionalProperties": False,
+}
+TOOL_NAME = "record_appointment"
+
+WEEKDAYS = ["lunes", "martes", "miercoles", "jueves", "viernes", "sabado", "domingo"]
+MONTHS = ["enero", "febrero", "marzo", "abril", "mayo", "junio", "julio", "agosto",
+          "septiembre", "octubre", "noviembre", "diciembre"]
+SPOKEN_WEEKDAYS = ["lunes", "martes", "miércoles", "jueves", "viernes", "sábado", "domingo"]
+
+_UNITS = ("cero uno dos tres cuatro cinco seis siete ocho nueve diez once doce trece catorce quince "
+          "dieciseis diecisiete dieciocho diecinueve veinte").split()
+NUMBER_WORDS = {word: value for value, word in enumerate(_UNITS)}
+NUMBER_WORDS.update({"veinti" + word: 20 + value for value, word in enumerate(_UNITS[1:10], 1)})
+NUMBER_WORDS["primero"] = 1
+for _value, _tens in enumerate(("treinta", "cuarenta", "cincuenta", "sesenta", "setenta", "ochenta", "noventa"), 3):
+    NUMBER_WORDS[_tens] = _value * 10
+    NUMBER_WORDS.update({f"{_tens} y {word}": _value * 10 + unit for unit, word in enumerate(_UNITS[1:10], 1)})
+_NUMBER_WORD = re.compile(r'\b(?:' + '|'.join(sorted(map(re.escape, NUMBER_WORDS), key=len, reverse=True)) + r')\b')
+
+_NOT_KEPT = re.compile(r'[^a-z0-9:/+\- ]+')
+_ISO_DATE = re.compile(r'\b(\d{4})-(\d{1,2})-(\d{1,2})\b')
+_NUMERIC_DATE = re.compile(r'\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b')
+_NAMED_DATE = re.compile(rf"\b(\d{{1,2}}) de ({'|'.join(MONTHS)})(?: (?:de |del )?(\d{{4}}))?\b")
+_RELATIVE_DATE = re.compile(r'\b(?:pasado manana|(?<!la )manana|hoy)\b')
+_WEEKDAY = re.compile(rf"\b({'|'.join(WEEKDAYS)})\b")
+_SPOKEN_TIME = re.compile(r'\b(?:a |de |desde )?las? (\d{1,2})(?::(\d{2}))?(?: y (media|cuarto|\d{1,2}))?'
+                          r'(?: ?(am|pm|a m|p m)| (?:de|en|por) la (manana|tarde|noche))?\b')
+_CLOCK_TIME = re.compile(r'\b(\d{1,2})(?::(\d{2}))?(?: ?(am|pm|a m|p m)\b| (?:de|en|por) la (manana|tarde|noche)\b)'
+                         r'|\b(\d{1,2}):(\d{2})\b')
+_NOON = re.compile(r'\bmedio ?dia\b')
+_PHONE = re.compile(r'\+?\d(?:[ -]?\d){5,14}')
+# A number is only a phone when the caller says so, e.g. "mi celular es ...", "llámame al ...",
+# not "el pedido número ..."
+_PHONE_CUE = re.compile(r'\b(?:(?:mi|su|tu) (?:numero|cel|movil)|telefono|celular|whatsapp'
+                        r'|(?:llam|marc|contact|comunic|escrib)[a-z]* al)'
+                        r'(?: de (?:contacto|telefono))?(?: es)?(?: el)? (\+?\d(?:[ -]?\d){5,14})')
+_CLAUSE_BREAK = re.compile(r'[,.;:!?¿¡]')
+_NAME = re.compile(r'\b(?i:me llamo|mi nombre es|soy|habla)\s+([A-Za-zÁÉÍÓÚÑáéíóúñ]+)(?:\s+([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+))?')
+_NOT_NAMES = {"de", "del", "el", "la", "un", "una", "nuevo", "nueva", "cliente", "paciente", "yo", "quien",
+              "muy", "su", "tu", "alguien", "mama", "papa", "esposo", "esposa", "inglés", "español"}
+_DATE_LEADS = {"el", "la", "los", "las", "este", "esta", "para", "mejor", "sino", "hasta"}
+_UNSPECIFIED = {"", "no especificado", "no especificada", "null", "none", "desconocido", "n/a"}
+
+_lock = threading.Lock()
+_stats = {"turns": 0, "local_fields": 0, "local_complete": 0, "llm_calls": 0, "llm_errors": 0,
+          "llm_fields": 0, "llm_seconds": 0.0, "completed": 0}
+
+
+def _record(**deltas):
+    with _lock:
+        for key, value in deltas.items():
+            _stats[key] += value
+
+
+def normalize(text):
+    """Lowercase, no accents, number words as digits; keeps : / + - for times, dates and phones"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    text = ' '.join(_NOT_KEPT.sub(' ', text).split()).replace('la una', 'la 1')
+    return _NUMBER_WORD.sub(lambda match: str(NUMBER_WORDS[match.group(0)]), text)
+
+
+def _date(year, month, day, today):
+    """A valid date not in the past (a year-less date that already passed means next year)"""
+    try:
+        value = datetime.date(year or today.year, month, day)
+        if year is None and value < today:
+            value = value.replace(year=today.year + 1)
+    except ValueError:
+        return None
+    return value
+
+
+def _negated(text, span):
+    """"hoy no", "no puedo mañana": the caller is ruling the date out"""
+    before = text[:span[0]].split()[-2:]
+    after = text[span[1]:].split()[:1]
+    if after == ["no"] or before[-1:] == ["no"]:
+        return True
+    # "no puedo mañana", but not the new choice in "mañana no, el viernes"
+    return len(before) == 2 and before[0] == "no" and before[1] not in _DATE_LEADS
+
+
+def _find_date(text, today):
+    """(date, span) for the last date expression in normalized text that is not ruled out
+
+    "hoy no puedo, mejor el martes" means Tuesday; a weekday next to an explicit
+    date ("el martes 17 de noviembre") defers to the date.
+    """
+    found = []
+    for match in _ISO_DATE.finditer(text):
+        found.append((_date(int(match.group(1)), int(match.group(2)), int(match.group(3)), today), match.span()))
+    for match in _NAMED_DATE.finditer(text):
+        year = int(match.group(3)) if match.group(3) else None
+        found.append((_date(year, MONTHS.index(match.group(2)) + 1, int(match.group(1)), today), match.span()))
+    for match in _NUMERIC_DATE.finditer(text):
+        year = int(match.group(3)) if match.group(3) else None
+        if year is not None and year < 100:
+            year += 2000
+        found.append((_date(year, int(match.group(2)), int(match.group(1)), today), match.span()))
+    explicit = [span for _, span in found]
+    for match in _RELATIVE_DATE.finditer(text):
+        if not _negated(text, match.span()):
+            days = {"hoy": 0, "manana": 1, "pasado manana": 2}[match.group(0)]
+            found.append((today + datetime.timedelta(days=days), match.span()))
+    for match in _WEEKDAY.finditer(text):
+        start, end = match.span()
+        if _negated(text, match.span()) or any(start - 4 <= other_end and other_start <= end + 4
+                                              for other_start, other_end in explicit):
+            continue
+        # "el martes" said on a Tuesday means next week's
+        ahead = (WEEKDAYS.index(match.group(1)) - today.weekday() - 1) % 7 + 1
+        found.append((today + datetime.timedelta(days=ahead), match.span()))
+    if not found:
+        return None, None
+    return max(found, key=lambda item: item[1][0])
+
+
+def _clock(hour, minute, period):
+    """HH:MM from a spoken hour; bare 1-7 are read as afternoon (business hours)"""
+    if period in ("pm", "p m", "tarde", "noche") and hour < 12:
+        hour += 12
+    elif period in ("am", "a m", "manana") and hour == 12:
+        hour = 0
+    elif period is None and 1 <= hour <= 7:
+        hour += 12
+    if hour > 23 or minute > 59:
+        return None
+    return f"{hour:02d}:{minute:02d}"
+
+
+def _find_time(text):
+    """(HH:MM, span) for the first time expression in normalized text"""
+    match = _SPOKEN_TIME.search(text)
+    if match:
+        hour, minute = int(match.group(1)), int(match.group(2) or 0)
+        extra = match.group(3)
+        if extra:
+            minute = {"media": 30, "cuarto": 15}.get(extra) or int(extra)
+        return _clock(hour, minute, match.group(4) or match.group(5)), match.span()
+    match = _CLOCK_TIME.search(text)
+    if match:
+        if match.group(5):
+            return _clock(int(match.group(5)), int(match.group(6)), None), match.span()
+        return _clock(int(match.group(1)), int(match.group(2) or 0), match.group(3) or match.group(4)), match.span()
+    match = _NOON.search(text)
+    if match:
+        return "12:00", match.span()
+    return None, None
+
+
+def find_name(message):
+    """Name introduced by "me llamo", "mi nombre es", "soy" or "habla", if any"""
+    match = _NAME.search(message)
+    if not match or match.group(1).lower() in _NOT_NAMES:
+        return None
+    return " ".join(part.capitalize() for part in match.groups() if part)
+
+
+def _find_phone(text, message):
+    """Phone number after a cue, or given on its own ("805000", "Juan, 805000, ...")
+
+    Other numbers (invoices, orders, amounts) are not taken for the callback number.
+    """
+    cued = _PHONE_CUE.search(text)
+    if cued:
+        return re.sub(r'[ -]', '', cued.group(1))
+    for clause in _CLAUSE_BREAK.split(message):
+        clause = normalize(clause)
+        number = _PHONE.fullmatch(clause)
+        if number and not _ISO_DATE.search(clause):
+            return re.sub(r'[ -]', '', number.group(0))
+    return None
+
+
+def _find_service(text):
+    for service in scheduling.get_scheduler().durations:
+        if re.search(rf"\b{re.escape(normalize(service))}\b", text):
+            return service.capitalize()
+    return None
+
+
+def parse_local(message, now=None):
+    """Fields found in message by the regex / number parsers (no LLM call)"""
+    now = now or datetime.datetime.now()
+    text = normalize(message)
+    found = {}
+    day, day_span = _find_date(text, now.date())
+    if day:
+        found["preferred_date"] = day.isoformat()
+    time_of_day, time_span = _find_time(text)
+    if time_of_day:
+        found["preferred_time"] = time_of_day
+    # Digits that belong to the date or the time are not part of a phone number
+    for span in sorted(filter(None, (day_span, time_span)), reverse=True):
+        text = text[:span[0]] + " " + text[span[1]:]
+    phone = _find_phone(text, message)
+    if phone:
+        found["client_phone"] = phone
+    name = find_name(message)
+    if name:
+        found["client_name"] = name
+    service = _find_service(text)
+    if service:
+        found["service_type"] = service
+    return found
+
+
+def _instructions(known, now):
+    known_text = ", ".join(f"{key}={value}" for key, value in known.items() if key in FIELDS and value)
+    return (f"Extrae los datos de la cita del mensaje del cliente. Hoy es {SPOKEN_WEEKDAYS[now.weekday()]} "
+            f"{now.date().isoformat()}. Fechas en formato YYYY-MM-DD y horas en HH:MM (24 horas). "
+            f"Usa null para lo que el cliente no dijo; no inventes datos."
+            + (f" Datos ya conocidos: {known_text}." if known_text else ""))
+
+
+def openai_request(message, known=None, now=None):
+    """Chat completions body with a strict json_schema response format"""
+    return {
+        "model": OPENAI_MODEL,
+        "temperature": 0,
+        "max_tokens": 200,
+        "messages": [{"role": "system", "content": _instructions(known or {}, now or datetime.datetime.now())},
+                     {"role": "user", "content": message}],
+        "response_format": {"type": "json_schema",
+                            "json_schema": {"name": "appointment", "strict": True, "schema": SCHEMA}},
+    }
+
+
+def claude_request(message, known=None, now=None):
+    """Messages body that forces a single record_appointment tool call"""
+    return {
+        "model": CLAUDE_MODEL,
+        "max_tokens": 300,
+        "temperature": 0,
+        "system": _instructions(known or {}, now or datetime.datetime.now()),
+        "messages": [{"role": "user", "content": message}],
+        "tools": [{"name": TOOL_NAME, "description": "Guarda los datos de la cita que dio el cliente",
+                   "input_schema": SCHEMA}],
+        "tool_choice": {"type": "tool", "name": TOOL_NAME},
+    }
+
+
+def validate(raw):
+    """Keep only schema fields with usable values (ISO date, HH:MM time, no "no especificado")"""
+    result = {}
+    for field in FIELDS:
+        value = raw.get(field)
+        if not isinstance(value, str) or value.strip().lower() in _UNSPECIFIED:
+            continue
+        value = value.strip()
+        if field == "preferred_date":
+            try:
+                value = datetime.date.fromisoformat(value).isoformat()
+            except ValueError:
+                continue
+        elif field == "preferred_time":
+            match = re.fullmatch(r'(\d{1,2}):(\d{2})(?::\d{2})?', value)
+            if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+                continue
+            value = f"{int(match.group(1)):02d}:{match.group(2)}"
+        result[field] = value
+    return result
+
+
+def llm_extract(message, known=None, now=None, provider=None):
+    """Structured extraction through the configured provider; raises on HTTP or format errors"""
+    provider = provider or AI_PROVIDER
+    started = time.perf_counter()
+    try:
+        if provider == 'claude':
+            response = http_client.post(f"{CLAUDE_BASE_URL}/v1/messages", json=claude_request(message, known, now),
+                                        headers={"x-api-key": CLAUDE_API_KEY, "Content-Type": "application/json",
+                                                 "anthropic-version": "2023-06-01"})
+            response.raise_for_status()
+            raw = next(block["input"] for block in response.json()["content"]
+                       if block.get("type") == "tool_use" and block.get("name") == TOOL_NAME)
+        else:
+            response = http_client.post(f"{OPENAI_BASE_URL}/v1/chat/completions", json=openai_request(message, known, now),
+                                        headers={"Authorization": f"Bearer {OPENAI_API_KEY}",
+                                                 "Content-Type": "application/json"})
+            response.raise_for_status()
+            raw = json.loads(response.json()["choices"][0]["message"]["content"])
+    except Exception:
+        _record(llm_calls=1, llm_errors=1, llm_seconds=time.perf_counter() - started)
+        raise
+    _record(llm_calls=1, llm_seconds=time.perf_counter() - started)
+    metrics.observe('stage_seconds', time.perf_counter() - started, stage='extraction')
+    return validate(raw)
+
+
+def missing(slots):
+    """Required fields not filled yet, in the order they are asked"""
+    return [field for field in REQUIRED if not slots.get(field)]
+
+
+def _fill(slots, found, override):
+    filled = 0
+    for field, value in found.items():
+        if field == "notes" and slots.get("notes") and value not in slots["notes"]:
+            slots["notes"] = f"{slots['notes']}; {value}"
+        elif override or not slots.get(field):
+            filled += slots.get(field) != value
+            slots[field] = value
+    return filled
+
+
+def update_slots(call_sid, message, caller="", use_llm=True, now=None, use_local=True):
+    """Merge what message says into the call's appointment slots, store and return them
+
+    Local parser results replace earlier values (the caller may correct a date);
+    LLM results only fill fields that are still empty. The LLM is skipped when
+    nothing required is missing. LLM errors propagate after the local results
+    are stored, so a queued job can retry. A job following up a turn whose local
+    pass already ran uses use_local=False, so an old utterance never overwrites
+    a correction made on a later turn.
+    """
+    now = now or datetime.datetime.now()
+    session = call_store.load_session(call_sid, caller)
+    slots = dict(session.get("appointment") or {})
+    if use_local:
+        was_missing = missing(slots)
+        local_fields = _fill(slots, parse_local(message, now), override=True)
+        if not slots.get("client_phone") and (caller or session.get("caller")):
+            slots["client_phone"] = caller or session["caller"]
+        _record(turns=1, local_fields=local_fields, local_complete=int(bool(was_missing) and not missing(slots)))
+        if call_sid:
+            call_store.update_session(call_sid, appointment=slots)
+    if not use_llm or not missing(slots):
+        return slots
+
+    extracted = llm_extract(message, slots, now)
+    # Re-read: another turn may have stored slots while the provider answered
+    slots = dict(call_store.load_session(call_sid).get("appointment") or slots) if call_sid else slots
+    still_missing = missing(slots)
+    _record(llm_fields=_fill(slots, extracted, override=False),
+            completed=int(bool(still_missing) and not missing(slots)))
+    if call_sid:
+        call_store.update_session(call_sid, appointment=slots)
+    return slots
+
+
+def has_slot_content(message, slots, now=None):
+    """Whether message looks like an answer to the booking questions: a required field the local parsers
+    find (a service alone is just a question about it), or a short reply while the name is still missing
+    (bare names are left to the LLM)"""
+    if any(field in REQUIRED for field in parse_local(message, now)):
+        return True
+    return not slots.get("client_name") and "?" not in message and len(message.split()) <= 3
+
+
+def extract(message, now=None):
+    """One-shot extraction of message: local parsers, then the LLM for what they missed"""
+    now = now or datetime.datetime.now()
+    slots = parse_local(message, now)
+    if any(not slots.get(field) for field in FIELDS if field != "notes"):
+        _fill(slots, llm_extract(message, slots, now), override=False)
+    return slots
+
+
+def spoken_date(iso_date):
+    """"martes 17 de noviembre" for 2026-11-17"""
+    day = datetime.date.fromisoformat(iso_date)
+    return f"{SPOKEN_WEEKDAYS[day.weekday()]} {day.day} de {MONTHS[day.month - 1]}"
+
+
+def follow_up(slots):
+    """Question asking only for the fields still missing"""
+    asks = {
+        "client_name": "tu nombre",
+        "client_phone": "un número de teléfono",
+        "preferred_date": "qué día te gustaría venir",
+        "preferred_time": "a qué hora",
+    }
+    wanted = [asks[field] for field in missing(slots)]
+    if not wanted:
+        return ""
+    known = []
+    if slots.get("preferred_date"):
+        known.append(f"el {spoken_date(slots['preferred_date'])}")
+    if slots.get("preferred_time"):
+        known.append(f"a las {slots['preferred_time']}")
+    prefix = f"Perfecto, {' '.join(known)}. " if known else "¡Claro que sí! "
+    asked = wanted[0] if len(wanted) == 1 else f"{', '.join(wanted[:-1])} y {wanted[-1]}"
+    return f"{prefix}¿Me dices {asked}?"
+
+
+def confirmation(slots):
+    """What to say once the appointment is booked"""
+    service = slots.get("service_type") or "cita"
+    return (f"¡Listo, {slots['client_name']}! Tu {service.lower()} quedó agendada para el "
+            f"{spoken_date(slots['preferred_date'])} a las {slots['preferred_time']}. "
+            f"¿Hay algo más en lo que pueda ayudarte?")
+
+
+def unavailable(slots, alternatives):
+    """What to say when the requested slot is taken, offering the next free ones"""
+    options = [f"el {spoken_date(day)} a las {hhmm}" for day, hhmm in alternatives]
+    if not options:
+        return "Lo siento, ese horario no está disponible. ¿Qué otro día te gustaría?"
+    offered = options[0] if len(options) == 1 else f"{', '.join(options[:-1])} o {options[-1]}"
+    return f"Lo siento, ese horario ya está ocupado. Tengo disponible {offered}. ¿Cuál prefieres?"
+
+
+def extraction_stats():
+    """Turns parsed, fields filled locally vs by the LLM, and LLM latency"""
+    with _lock:
+        stats = dict(_stats)
+    llm_seconds = stats.pop("llm_seconds")
+    stats["llm_ms_avg"] = round(llm_seconds * 1000 / stats["llm_calls"], 1) if stats["llm_calls"] else 0.0
+    return stats
@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the OpenAI and Claude APIs (and a Redis-protocol server)
+Serves chat completions / messages (plain JSON or SSE streams, or a fixed
+structured extraction for json_schema / tool requests) with configurable
+delays so the streaming and latency paths can be exercised without network access.
+Chat requests can also be made to stall or fail every Nth time, to exercise the
+provider router's hedging and circuit breakers. With latency_sigma > 0 the
+first-token and transcription delays are drawn from a log-normal distribution
+around the configured value (its median), which gives the long tail real
+providers have.
+Also serves Twilio recordings (generated WAV, optionally 404 for the first
+requests like a recording that is not ready yet), Whisper transcriptions, the
+Twilio Messages API (optionally answering 429 first), a notification webhook
+and OpenAI text-to-speech (a 24 kHz PCM tone as long as the text would take to say).
+MiniRedisServer speaks enough RESP for the redis call_store backend and
+MiniSMTPServer enough SMTP to receive the notification e-mails.
+
+Usage:
+    python fake_providers.py --port 9000 --first-token-delay 0.4
+    OPENAI_BASE_URL=http://127.0.0.1:9000 CLAUDE_BASE_URL=http://127.0.0.1:9000 python server.py
+"""
+
+import argparse
+import http.server
+import json
+import math
+import random
+import urllib.parse
+import socketserver
+import struct
+import sys
+import threading
+import time
+
+DEFAULT_TRANSCRIPT = "Hola, me llamo Juan, mi teléfono es 805000 y quiero agendar una cita."
+DEFAULT_EXTRACTION = {"client_name": "Juan", "service_type": "Consulta", "preferred_date": None,
+                      "preferred_time": None, "notes": "Quiere agendar una cita"}
+# One 5 ms period of a 200 Hz tone at 24 kHz, 16-bit little-endian
+SPEECH_PERIOD = struct.pack('<120h', *(int(6000 * math.sin(2 * math.pi * i / 120)) for i in range(120)))
+DEFAULT_REPLY = ("¡Perfecto! Con gusto te ayudo con eso. "
+                 "Nuestro horario es de lunes a viernes de 9 AM a 6 PM. "
+                 "¿Hay algo más en lo que pueda ayudarte?")
+
+
+class FakeProviderHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b''
+        try:
+            return json.loads(body or b'{}')
+        except ValueError:
+            return {}
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_sse(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+    def _write_event(self, data, event=None):
+        chunk = (f"event: {event}\n" if event else "") + f"data: {data}\n\n"
+        self.wfile.write(chunk.encode('utf-8'))
+        self.wfile.flush()
+
+    def _tokens(self):
+        words = self.server.reply.split(' ')
+        return [word if i == 0 else ' ' + word for i, word in enumerate(words)]
+
+    def do_GET(self):
+        self.server.requests += 1
+        if '/Recordings/' in self.path:
+            self.handle_recording()
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        self.server.requests += 1
+        if self.path.endswith('/v1/audio/transcriptions'):
+            self.handle_whisper()
+            return
+        if self.path.endswith('/Messages.json'):
+            self.handle_sms()
+            return
+        payload = self._read_json()
+        if self.path.endswith(('/v1/chat/completions', '/v1/messages')) and self._inject_fault():
+            return
+        if self.path.endswith('/v1/chat/completions'):
+            self.handle_openai(payload)
+        elif self.path.endswith('/v1/messages'):
+            self.handle_claude(payload)
+        elif self.path.endswith('/v1/audio/speech'):
+            self.handle_speech(payload)
+        elif self.path.startswith('/notify'):
+            with self.server.lock:
+                self.server.webhooks.append(payload)
+            self._send_json({"ok": True})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _inject_fault(self):
+        """Every stall_every-th chat request waits stall_delay first; every fail_every-th answers 500"""
+        with self.server.lock:
+            self.server.chat_requests += 1
+            number = self.server.chat_requests
+        if self.server.stall_every and number % self.server.stall_every == 0:
+            time.sleep(self.server.stall_delay)
+        if self.server.fail_every and number % self.server.fail_every == 0:
+            self._send_json({"error": {"message": "injected failure"}}, status=500)
+            return True
+        return False
+
+    def handle_openai(self, payload):
+        time.sleep(self.server.delay(self.server.first_token_delay))
+        if (payload.get('response_format') or {}).get('type') == 'json_schema':
+            content = json.dumps(self.server.extraction, ensure_ascii=False)
+            self._send_json({"choices": [{"message": {"role": "assistant", "content": content}}]})
+            return
+        if not payload.get('stream'):
+            time.sleep(self.server.token_delay * len(self._tokens()))
+            self._send_json({"choices": [{"message": {"role": "assistant", "content": self.server.reply}}]})
+            return
+        self._start_sse()
+        for token in self._tokens():
+            self._write_event(json.dumps({"choices": [{"delta": {"content": token}}]}))
+            time.sleep(self.server.token_delay)
+        self._write_event('[DONE]')
+
+    def handle_claude(self, payload):
+        time.sleep(self.server.delay(self.server.first_token_delay))
+        if payload.get('tools'):
+            tool = payload['tools'][0]['name']
+            self._send_json({"content": [{"type": "tool_use", "id": "toolu_fake", "name": tool,
+                                          "input": self.server.extraction}], "stop_reason": "tool_use"})
+            return
+        if not payload.get('stream'):
+            time.sleep(self.server.token_delay * len(self._tokens()))
+            self._send_json({"content": [{"type": "text", "text": self.server.reply}]})
+            return
+        self._start_sse()
+        self._write_event(json.dumps({"type": "message_start"}), event='message_start')
+        for token in self._tokens():
+            delta = {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": token}}
+            self._write_event(json.dumps(delta), event='content_block_delta')
+            time.sleep(self.server.token_delay)
+        self._write_event(json.dumps({"type": "message_stop"}), event='message_stop')
+
+
+    def handle_speech(self, payload):
+        """OpenAI speech: 60 ms of 200 Hz tone per character as 24 kHz 16-bit PCM"""
+        time.sleep(self.server.delay(self.server.first_token_delay))
+        periods = max(1, len(payload.get('input', '')) * 12)
+        body = SPEECH_PERIOD * periods
+        self.send_response(200)
+        self.send_header('Content-Type', 'audio/pcm')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_recording(self):
+        """Twilio recording media: 404 while "processing", then a WAV streamed in chunks"""
+        sid = self.path.rsplit('/', 1)[-1].split('.')[0]
+        with self.server.lock:
+            misses = self.server.recording_misses.get(sid, 0)
+            if misses < self.server.recording_not_found:
+                self.server.recording_misses[sid] = misses + 1
+                not_ready = True
+            else:
+                not_ready = False
+        if not_ready:
+            self._send_json({"code": 20404, "message": "The requested resource was not found"}, status=404)
+            return
+        size = self.server.recording_size
+        self.send_response(200)
+        self.send_header('Content-Type', 'audio/x-wav')
+        self.send_header('Content-Length', str(44 + size))
+        self.end_headers()
+        # 8 kHz 16-bit mono PCM header, then a repeating test pattern
+        self.wfile.write(b'RIFF' + struct.pack('<I', 36 + size) + b'WAVEfmt '
+                         + struct.pack('<IHHIIHH', 16, 1, 1, 8000, 16000, 2, 16)
+                         + b'data' + struct.pack('<I', size))
+        pattern = bytes(range(256)) * 256
+        sent = 0
+        while sent < size:
+            chunk = pattern[:min(len(pattern), size - sent)]
+            self.wfile.write(chunk)
+            sent += len(chunk)
+
+    def handle_whisper(self):
+        """Read the multipart upload in chunks (never whole) and return a fixed transcript"""
+        remaining = int(self.headers.get('Content-Length', 0))
+        received = 0
+        has_file = False
+        while remaining:
+            chunk = self.rfile.read(min(remaining, 65536))
+            if not chunk:
+                break
+            if not has_file and b'name="file"' in chunk:
+                has_file = True
+            received += len(chunk)
+            remaining -= len(chunk)
+        self.server.uploaded_bytes += received
+        time.sleep(self.server.delay(self.server.transcription_delay))
+        if not has_file:
+            self._send_json({"error": {"message": "file is required"}}, status=400)
+            return
+        self._send_json({"text": self.server.transcript})
+
+    def handle_sms(self):
+        """Twilio Messages API: 429 with Retry-After for the first sms_rate_limited requests, then 201"""
+        length = int(self.headers.get('Content-Length', 0))
+        form = dict(urllib.parse.parse_qsl(self.rfile.read(length).decode('utf-8')))
+        with self.server.lock:
+            limited = self.server.sms_rejections < self.server.sms_rate_limited
+            if limited:
+                self.server.sms_rejections += 1
+            else:
+                self.server.messages.append(form)
+                sid = f"SM{len(self.server.messages):032d}"
+        if limited:
+            body = json.dumps({"code": 20429, "message": "Too Many Requests", "status": 429}).encode('utf-8')
+            self.send_response(429)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Retry-After', '1')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self._send_json({"sid": sid, "status": "queued", "to": form.get('To'), "body": form.get('Body')}, status=201)
+
+
+class FakeProviderServer(http.server.ThreadingHTTPServer):
+    """Threaded fake provider; use as a context manager or call start()/stop()"""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, port=0, reply=DEFAULT_REPLY, first_token_delay=0.2, token_delay=0.02,
+                 transcript=DEFAULT_TRANSCRIPT, transcription_delay=0.3, recording_size=1 << 20, recording_not_found=0,
+                 sms_rate_limited=0, extraction=None, stall_every=0, stall_delay=5.0, fail_every=0,
+                 latency_sigma=0.0):
+        super().__init__(('127.0.0.1', port), FakeProviderHandler)
+        self.reply = reply
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.transcript = transcript
+        self.transcription_delay = transcription_delay
+        self.recording_size = recording_size
+        self.recording_not_found = recording_not_found
+        self.recording_misses = {}
+        self.sms_rate_limited = sms_rate_limited
+        self.extraction = dict(DEFAULT_EXTRACTION if extraction is None else extraction)
+        self.stall_every = stall_every
+        self.stall_delay = stall_delay
+        self.fail_every = fail_every
+        self.latency_sigma = latency_sigma
+        self.chat_requests = 0
+        self.sms_rejections = 0
+        self.messages = []
+        self.webhooks = []
+        self.uploaded_bytes = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._thread = None
+
+    def delay(self, median):
+        """median itself, or a log-normal draw around it when latency_sigma is set"""
+        if self.latency_sigma <= 0 or median <= 0:
+            return median
+        return random.lognormvariate(math.log(median), self.latency_sigma)
+
+    def handle_error(self, request, client_address):
+        # Timed-out and losing hedged requests close their socket before the answer is written
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def recording_url(self, recording_sid='RE0001'):
+        return f"{self.base_url}/2010-04-01/Accounts/AC0001/Recordings/{recording_sid}"
+
+    @property
+    def webhook_url(self):
+        return f"{self.base_url}/notify"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class MiniRedisHandler(socketserver.StreamRequestHandler):
+    """GET / SET [EX] / DEL / EXPIRE / TTL / PING / SELECT / AUTH over RESP"""
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.decode('utf-8').split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2].decode('utf-8'))
+        return args
+
+    def _bulk(self, value):
+        if value is None:
+            return b'$-1\r\n'
+        data = value.encode('utf-8')
+        return b'$%d\r\n%s\r\n' % (len(data), data)
+
+    def handle(self):
+        data = self.server.data
+        while True:
+            args = self._read_command()
+            if not args:
+                return
+            command, now = args[0].upper(), time.time()
+            with self.server.lock:
+                for key in [k for k, (_, exp) in data.items() if exp is not None and exp < now]:
+                    del data[key]
+                if command == 'PING':
+                    reply = b'+PONG\r\n'
+                elif command in ('SELECT', 'AUTH'):
+                    reply = b'+OK\r\n'
+                elif command == 'GET':
+                    reply = self._bulk(data.get(args[1], (None, None))[0])
+                elif command == 'SET':
+                    ttl = int(args[4]) if len(args) > 4 and args[3].upper() == 'EX' else None
+                    data[args[1]] = (args[2], now + ttl if ttl else None)
+                    reply = b'+OK\r\n'
+                elif command == 'DEL':
+                    reply = b':%d\r\n' % sum(1 for key in args[1:] if data.pop(key, None))
+                elif command == 'EXPIRE':
+                    if args[1] in data:
+                        data[args[1]] = (data[args[1]][0], now + int(args[2]))
+                    reply = b':%d\r\n' % (args[1] in data)
+                elif command == 'TTL':
+                    value = data.get(args[1])
+                    ttl = -2 if value is None else (-1 if value[1] is None else int(value[1] - now))
+                    reply = b':%d\r\n' % ttl
+                else:
+                    reply = f"-ERR unknown command '{command}'\r\n".encode('utf-8')
+            self.wfile.write(reply)
+
+
+class MiniRedisServer(socketserver.ThreadingTCPServer):
+    """In-memory Redis stand-in for exercising the redis call_store backend"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0):
+        super().__init__(('127.0.0.1', port), MiniRedisHandler)
+        self.data = {}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"redis://127.0.0.1:{self.server_address[1]}/0"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class MiniSMTPHandler(socketserver.StreamRequestHandler):
+    """EHLO / HELO / MAIL / RCPT / DATA / RSET / NOOP / QUIT, no auth or TLS"""
+
+    def _reply(self, line):
+        self.wfile.write(line.encode('utf-8') + b'\r\n')
+
+    def handle(self):
+        self._reply('220 localhost fake SMTP ready')
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command[:4].upper()
+            if verb in ('EHLO', 'HELO'):
+                self._reply('250 localhost')
+            elif verb == 'MAIL':
+                with self.server.lock:
+                    busy = self.server.rejections < self.server.busy
+                    if busy:
+                        self.server.rejections += 1
+                if busy:
+                    self._reply('451 4.7.1 Too many messages, try again later')
+                    continue
+                sender, recipients = command.partition(':')[2].strip(' <>'), []
+                self._reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command.partition(':')[2].strip(' <>'))
+                self._reply('250 OK')
+            elif verb == 'DATA':
+                self._reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data == b'.\r\n':
+                        break
+                    lines.append(data[1:] if data.startswith(b'..') else data)
+                with self.server.lock:
+                    self.server.messages.append({"from": sender, "to": recipients,
+                                                 "data": b''.join(lines).decode('utf-8', 'replace')})
+                self._reply('250 OK queued')
+            elif verb in ('RSET', 'NOOP'):
+                self._reply('250 OK')
+            elif verb == 'QUIT':
+                self._reply('221 Bye')
+                return
+            else:
+                self._reply('502 Command not implemented')
+
+
+class MiniSMTPServer(socketserver.ThreadingTCPServer):
+    """Receives e-mail into .messages; the first `busy` MAIL commands get a 451"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, busy=0):
+        super().__init__(('127.0.0.1', port), MiniSMTPHandler)
+        self.busy = busy
+        self.rejections = 0
+        self.messages = []
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--first-token-delay', type=float, default=0.2)
+    parser.add_argument('--token-delay', type=float, default=0.02)
+    parser.add_argument('--transcription-delay', type=float, default=0.3)
+    parser.add_argument('--recording-size', type=int, default=1 << 20, help='bytes of audio per recording')
+    parser.add_argument('--recording-not-found', type=int, default=0, help='404 answers before a recording is ready')
+    parser.add_argument('--sms-rate-limited', type=int, default=0, help='429 answers before SMS are accepted')
+    parser.add_argument('--stall-every', type=int, default=0, help='every Nth chat request stalls --stall-delay seconds')
+    parser.add_argument('--stall-delay', type=float, default=5.0)
+    parser.add_argument('--fail-every', type=int, default=0, help='every Nth chat request answers 500')
+    parser.add_argument('--latency-sigma', type=float, default=0.0, help='log-normal spread of the delays (0 = fixed)')
+    parser.add_argument('--smtp-port', type=int, default=0, help='also run the fake SMTP server on this port')
+    args = parser.parse_args()
+    server = FakeProviderServer(args.port, first_token_delay=args.first_token_delay, token_delay=args.token_delay,
+                                transcription_delay=args.transcription_delay, recording_size=args.recording_size,
+                                recording_not_found=args.recording_not_found, sms_rate_limited=args.sms_rate_limited,
+                                stall_every=args.stall_every, stall_delay=args.stall_delay, fail_every=args.fail_every,
+                                latency_sigma=args.latency_sigma)
+    print(f"🧪 Fake providers running on {server.base_url}")
+    if args.smtp_port:
+        MiniSMTPServer(args.smtp_port).start()
+        print(f"🧪 Fake SMTP running on 127.0.0.1:{args.smtp_port}")
+    server.serve_forever()
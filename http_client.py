@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP client for the AI Receptionist servers
+Keeps one process-wide session with per-host keep-alive connection pools so
+OpenAI, Claude, Whisper and Twilio calls reuse TCP/TLS connections between turns.
+
+Environment:
+    HTTP_POOL_CONNECTIONS   number of host pools kept alive (default 10)
+    HTTP_POOL_MAXSIZE       connections per host pool (default 20)
+    HTTP_POOL_SIZES         per-host overrides, e.g. "api.openai.com=32,api.twilio.com=4"
+    HTTP_CONNECT_TIMEOUT    connect timeout in seconds (default 3.05)
+    HTTP_READ_TIMEOUT       read timeout in seconds (default 30)
+    HTTP_CLIENT_HTTP2       "1" to send non-streamed JSON requests over HTTP/2 (needs httpx[http2]);
+                            uploads, form posts, auth and streams stay on the requests session,
+                            and HTTP/2 answers and errors come back as requests objects
+    HTTP_ASYNC_MAX_CONNECTIONS  connection cap of the asyncio client (default 500)
+    HTTP_ASYNC_SHARDS       asyncio clients requests are spread over (default 8); httpcore
+                            scans every pooled connection for every queued request, so a
+                            few small pools stay fast with hundreds of requests in flight
+"""
+
+import asyncio
+import contextlib
+import itertools
+import os
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', 10))
+POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 20))
+CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 3.05))
+READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 30))
+HTTP2_ENABLED = os.getenv('HTTP_CLIENT_HTTP2', '0') == '1'
+ASYNC_MAX_CONNECTIONS = int(os.getenv('HTTP_ASYNC_MAX_CONNECTIONS', 500))
+ASYNC_SHARDS = max(1, int(os.getenv('HTTP_ASYNC_SHARDS', 8)))
+
+_lock = threading.Lock()
+_session = None
+_http2_client = None
+_owner_pid = None
+_async_clients = {}
+_stats = {}
+
+
+def _parse_pool_sizes(value):
+    """Parse "host=size,host=size" into a dict"""
+    sizes = {}
+    for item in value.split(','):
+        host, _, size = item.strip().partition('=')
+        if host and size.isdigit():
+            sizes[host] = int(size)
+    return sizes
+
+
+POOL_SIZES = _parse_pool_sizes(os.getenv('HTTP_POOL_SIZES', ''))
+
+
+def _count(host, outcome):
+    with _lock:
+        entry = _stats.setdefault(host, {"requests": 0, "hits": 0, "misses": 0, "http2": 0})
+        entry["requests"] += 1
+        if outcome:
+            entry[outcome] += 1
+
+
+class _CountingPoolMixin:
+    """Record whether each checkout reuses a live connection or opens a new one"""
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        _count(self.host, 'hits' if getattr(conn, 'sock', None) is not None else 'misses')
+        return conn
+
+
+class _CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools report hit/miss counters"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool,
+        }
+
+
+def _build_session():
+    session = requests.Session()
+    default = PooledAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+    session.mount('http://', default)
+    session.mount('https://', default)
+    for host, size in POOL_SIZES.items():
+        session.mount(f'https://{host}', PooledAdapter(pool_connections=1, pool_maxsize=size))
+        session.mount(f'http://{host}', PooledAdapter(pool_connections=1, pool_maxsize=size))
+    return session
+
+
+def _build_http2_client():
+    try:
+        import httpx
+        import h2  # noqa: F401  (httpx only negotiates HTTP/2 when h2 is installed)
+    except ImportError:
+        print("⚠️ HTTP_CLIENT_HTTP2=1 but httpx[http2] is not installed, using HTTP/1.1")
+        return None
+    limits = httpx.Limits(max_connections=POOL_CONNECTIONS * POOL_MAXSIZE,
+                          max_keepalive_connections=POOL_MAXSIZE)
+    return httpx.Client(http2=True, limits=limits)
+
+
+def get_session():
+    """Return the process-wide pooled session, rebuilding it after a fork"""
+    global _session, _http2_client, _owner_pid
+    pid = os.getpid()
+    if _session is None or _owner_pid != pid:
+        with _lock:
+            if _session is None or _owner_pid != pid:
+                _session = _build_session()
+                _http2_client = _build_http2_client() if HTTP2_ENABLED else None
+                _owner_pid = pid
+                _stats.clear()
+    return _session
+
+
+def _httpx_timeout(timeout):
+    import httpx
+    if isinstance(timeout, tuple):
+        return httpx.Timeout(timeout[1], connect=timeout[0])
+    return httpx.Timeout(timeout)
+
+
+# Arguments that mean the same to requests and httpx; anything else goes through the requests session
+_HTTP2_ARGUMENTS = {'headers', 'json', 'params', 'timeout'}
+
+
+def _as_requests_response(response):
+    """requests.Response with the status, headers and body of an httpx response"""
+    converted = requests.Response()
+    converted.status_code = response.status_code
+    converted.headers = requests.structures.CaseInsensitiveDict(response.headers)
+    converted._content = response.content
+    converted.encoding = response.charset_encoding
+    converted.reason = response.reason_phrase
+    converted.url = str(response.url)
+    return converted
+
+
+def _http2_request(method, url, **kwargs):
+    """Send over the HTTP/2 client, raising requests exceptions like the session would"""
+    import httpx
+
+    kwargs['timeout'] = _httpx_timeout(kwargs['timeout'])
+    try:
+        response = _http2_client.request(method, url, **kwargs)
+    except httpx.ConnectTimeout as e:
+        raise requests.exceptions.ConnectTimeout(str(e)) from e
+    except httpx.TimeoutException as e:
+        raise requests.exceptions.ReadTimeout(str(e)) from e
+    except httpx.TransportError as e:
+        raise requests.exceptions.ConnectionError(str(e)) from e
+    except httpx.HTTPError as e:
+        raise requests.exceptions.RequestException(str(e)) from e
+    # httpx multiplexes streams over one connection and does not expose reuse
+    _count(urlsplit(url).hostname, 'http2' if response.http_version == 'HTTP/2' else None)
+    return _as_requests_response(response)
+
+
+def request(method, url, **kwargs):
+    """Send a request through the shared pools (requests-compatible arguments)"""
+    session = get_session()
+    kwargs.setdefault('timeout', (CONNECT_TIMEOUT, READ_TIMEOUT))
+    if _http2_client is not None and set(kwargs) <= _HTTP2_ARGUMENTS:
+        return _http2_request(method, url, **kwargs)
+    return session.request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def _new_async_client(max_connections, max_keepalive):
+    import httpx
+    try:
+        import h2  # noqa: F401
+        http2 = HTTP2_ENABLED
+    except ImportError:
+        http2 = False
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+    return httpx.AsyncClient(http2=http2, limits=limits,
+                             timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT))
+
+
+def get_async_client():
+    """Return one of the pooled httpx.AsyncClients of the running event loop, round-robin"""
+    loop = asyncio.get_running_loop()
+    entry = _async_clients.get(loop)
+    if entry is None or any(client.is_closed for client in entry[0]):
+        clients = [_new_async_client(max(1, ASYNC_MAX_CONNECTIONS // ASYNC_SHARDS),
+                                     max(1, POOL_MAXSIZE * POOL_CONNECTIONS // ASYNC_SHARDS))
+                   for _ in range(ASYNC_SHARDS)]
+        entry = _async_clients[loop] = (clients, itertools.cycle(clients))
+    return next(entry[1])
+
+
+async def apost(url, **kwargs):
+    """Async POST through the event loop's shared client"""
+    response = await get_async_client().post(url, **kwargs)
+    _count(urlsplit(url).hostname, 'http2' if response.http_version == 'HTTP/2' else None)
+    return response
+
+
+@contextlib.asynccontextmanager
+async def astream(method, url, **kwargs):
+    """Async streamed request through the event loop's shared clients; read with response.aiter_bytes()"""
+    async with get_async_client().stream(method, url, **kwargs) as response:
+        _count(urlsplit(url).hostname, 'http2' if response.http_version == 'HTTP/2' else None)
+        yield response
+
+
+async def aclose():
+    """Close the async clients of the running event loop (call on shutdown)"""
+    entry = _async_clients.pop(asyncio.get_running_loop(), None)
+    if entry is not None:
+        await asyncio.gather(*[client.aclose() for client in entry[0]])
+
+
+def pool_stats():
+    """Per-host counters: requests, hits (reused connection), misses (new connection), http2"""
+    with _lock:
+        stats = {host: dict(entry) for host, entry in _stats.items()}
+    for entry in stats.values():
+        pooled = entry["hits"] + entry["misses"]
+        entry["hit_rate"] = round(entry["hits"] / pooled, 3) if pooled else 0.0
+    return stats
+
+
+def reset_pool_stats():
+    with _lock:
+        _stats.clear()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Caller intent detection shared by server.py and the simple_server*.py handlers
+Utterances are folded (lowercase, no accents, no punctuation) and matched
+against one precompiled regex built from a prefix trie of the phrases, with
+word boundaries so "no" does not fire inside "nombre", "bueno" or "teléfono".
+
+Short answers that only close the call when said on their own ("no", "nada",
+"perfecto", "listo", "gracias") are kept apart and compared against the whole
+utterance, so "no, quiero una cita" or "gracias, me llamo Juan" keep going.
+Phrases that are also ordinary sentence openers ("no más", "nada más",
+"no hay nada", "terminé") only close the call at the end of the utterance,
+optionally followed by a thank you: "no más, gracias" ends it, "no más de dos
+personas", "nada más quería saber el horario" and "terminé de llenar el
+formulario, ¿y ahora?" do not.
+"""
+
+import re
+import unicodedata
+
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+# Latin letters with diacritics mapped to their base letter (á→a, ñ→n, ü→u)
+_ACCENTS = {code: unicodedata.normalize('NFKD', chr(code))[0] for code in range(0xC0, 0x250)
+            if unicodedata.normalize('NFKD', chr(code))[0].isascii()}
+
+
+def fold(text):
+    """Lowercase, strip accents and punctuation, collapse whitespace"""
+    text = text.lower()
+    if not text.isascii():
+        text = text.translate(_ACCENTS)
+    return _NON_WORD.sub(' ', text).strip()
+
+
+def _trie_pattern(phrases):
+    """Regex alternation that shares common prefixes, e.g. no (?:gracias|hay mas)"""
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        ends_here = '' in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        pattern = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        if ends_here:
+            pattern = f"(?:{pattern})?"
+        return pattern
+
+    return build(trie)
+
+
+# Courtesy that may follow a closing phrase said at the end of the utterance
+_TRAILING_THANKS = r"(?: (?:muchas )?gracias)?"
+
+
+class PhraseMatcher:
+    """Whole-word phrase search, phrases that must end the utterance, and whole-utterance answers"""
+
+    def __init__(self, phrases=(), exact=(), final=()):
+        self.phrases = sorted({fold(phrase) for phrase in phrases} - {''})
+        self.final = sorted({fold(phrase) for phrase in final} - {''})
+        self.exact = frozenset(fold(phrase) for phrase in exact)
+        self._regex = re.compile(rf"\b{_trie_pattern(self.phrases)}\b") if self.phrases else None
+        self._final_regex = (re.compile(rf"\b({_trie_pattern(self.final)}){_TRAILING_THANKS}$")
+                             if self.final else None)
+
+    def match(self, text):
+        """Matched (folded) phrase, or None"""
+        folded = fold(text or '')
+        if folded in self.exact:
+            return folded
+        if self._regex is not None:
+            found = self._regex.search(folded)
+            if found:
+                return found.group(0)
+        if self._final_regex is not None:
+            found = self._final_regex.search(folded)
+            if found:
+                return found.group(1)
+        return None
+
+    def __contains__(self, text):
+        return self.match(text) is not None
+
+
+END_OF_CONVERSATION = PhraseMatcher(
+    phrases=[
+        'adiós', 'chau', 'hasta luego', 'bye', 'goodbye', 'see you',
+        'eso es todo', 'eso sería todo', 'no hay nada más', 'no necesito nada',
+        'ya está todo', 'ya está bien', 'no gracias', 'listo gracias', 'perfecto gracias',
+    ],
+    final=['no más', 'nada más', 'no hay más', 'no hay nada', 'no necesito más',
+           'ya terminé', 'terminé', 'terminado'],
+    exact=[
+        'no', 'nada', 'listo', 'perfecto', 'ya está', 'eso es', 'no necesito',
+        'gracias', 'muchas gracias', 'thanks', 'thank you',
+    ],
+)
+
+
+def is_end_of_conversation(text):
+    """True when the caller is closing the conversation"""
+    return END_OF_CONVERSATION.match(text) is not None
+
+
+APPOINTMENT_REQUEST = PhraseMatcher(
+    phrases=[
+        'cita', 'agendar', 'agenda', 'agendas', 'agende', 'agendes', 'agéndame', 'agendarme',
+        'reservar', 'reserva', 'reservación', 'reservarme', 'turno',
+        'programar', 'apartar', 'hora disponible', 'horario disponible', 'appointment', 'book',
+    ],
+)
+
+
+def is_appointment_request(text):
+    """True when the caller asks to book (or talks about) an appointment"""
+    return APPOINTMENT_REQUEST.match(text) is not None
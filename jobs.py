@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Background job queue for work that must not run inside a Twilio webhook
+Webhooks enqueue a job and answer right away; worker threads run the job with
+per-job concurrency limits and retry failures with exponential backoff. A job
+key (e.g. the RecordingSid) makes enqueueing idempotent, so Twilio retries and
+the recording-status callback never process the same recording twice.
+
+    memory   in-process heap, lost on restart (default)
+    sqlite   durable table in WAL mode; jobs survive restarts and can be shared
+             by several processes (a claimed job is leased, not deleted; a lease
+             that expires because its worker died counts as a failed attempt)
+
+Environment:
+    JOB_QUEUE          memory | sqlite
+    JOB_QUEUE_PATH     SQLite file (default jobs.db)
+    JOB_WORKERS        worker threads per process (default 4)
+    JOB_MAX_ATTEMPTS   attempts before a job is marked failed (default 4)
+    JOB_RETRY_DELAY    first retry delay in seconds, doubled per attempt (default 2)
+    JOB_CONCURRENCY    per-job limits, e.g. "transcribe_recording=2,call_summary=1"
+    JOB_LEASE          seconds a claimed sqlite job stays hidden from other workers (default 300)
+    JOB_KEYS_KEPT      finished job keys remembered for idempotency, memory backend (default 10000)
+"""
+
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from collections import OrderedDict
+
+JOB_QUEUE = os.getenv('JOB_QUEUE', 'memory')
+JOB_QUEUE_PATH = os.getenv('JOB_QUEUE_PATH', 'jobs.db')
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 4))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 4))
+JOB_RETRY_DELAY = float(os.getenv('JOB_RETRY_DELAY', 2))
+JOB_LEASE = float(os.getenv('JOB_LEASE', 300))
+JOB_KEYS_KEPT = int(os.getenv('JOB_KEYS_KEPT', 10000))
+POLL_INTERVAL = 1.0
+
+
+def _parse_limits(value):
+    """Parse "name=limit,name=limit" into a dict"""
+    limits = {}
+    for item in value.split(','):
+        name, _, limit = item.strip().partition('=')
+        if name and limit.isdigit():
+            limits[name] = int(limit)
+    return limits
+
+
+JOB_CONCURRENCY = _parse_limits(os.getenv('JOB_CONCURRENCY', ''))
+
+
+class MemoryBackend:
+    """Due-time heap plus a bounded map of job keys already seen"""
+
+    def __init__(self, keys_kept=JOB_KEYS_KEPT):
+        self.keys_kept = keys_kept
+        self._heap = []
+        self._keys = OrderedDict()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def add(self, job):
+        with self._lock:
+            if job["key"] in self._keys:
+                return False
+            self._keys[job["key"]] = "pending"
+            while len(self._keys) > self.keys_kept:
+                self._keys.popitem(last=False)
+            job["id"] = next(self._seq)
+            heapq.heappush(self._heap, (job["run_at"], job["id"], job))
+            return True
+
+    def claim(self, now, skip=()):
+        """Earliest due job whose name is not in skip, or None"""
+        with self._lock:
+            deferred, found = [], None
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                if entry[2]["name"] in skip:
+                    deferred.append(entry)
+                    continue
+                found = entry[2]
+                self._keys[found["key"]] = "running"
+                break
+            for entry in deferred:
+                heapq.heappush(self._heap, entry)
+            return found
+
+    def next_run_at(self):
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def retry(self, job, run_at, error):
+        job["run_at"], job["last_error"] = run_at, error
+        with self._lock:
+            self._keys[job["key"]] = "pending"
+            heapq.heappush(self._heap, (run_at, job["id"], job))
+
+    def complete(self, job):
+        with self._lock:
+            self._keys[job["key"]] = "done"
+
+    def fail(self, job, error):
+        with self._lock:
+            self._keys[job["key"]] = "failed"
+
+    def depth(self):
+        with self._lock:
+            return len(self._heap)
+
+
+class SQLiteBackend:
+    """Jobs table in WAL mode; claims are leases so a crashed worker's job runs again"""
+
+    def __init__(self, path=JOB_QUEUE_PATH, lease=JOB_LEASE):
+        self.path = path
+        self.lease = lease
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                key TEXT NOT NULL UNIQUE,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                run_at REAL NOT NULL,
+                created REAL NOT NULL,
+                last_error TEXT
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs (status, run_at)')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def add(self, job):
+        cursor = self._conn().execute(
+            'INSERT OR IGNORE INTO jobs (name, key, payload, attempts, run_at, created) VALUES (?, ?, ?, ?, ?, ?)',
+            (job["name"], job["key"], json.dumps(job["payload"]), job["attempts"], job["run_at"], job["created"]))
+        return cursor.rowcount == 1
+
+    def claim(self, now, skip=()):
+        conn = self._conn()
+        skip = list(skip)
+        placeholders = ','.join('?' * len(skip))
+        exclude = f"AND name NOT IN ({placeholders})" if skip else ""
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                f"SELECT id, name, key, payload, attempts, created, status FROM jobs "
+                f"WHERE status IN ('pending', 'running') AND run_at <= ? {exclude} ORDER BY run_at LIMIT 1",
+                [now] + skip).fetchone()
+            if row is not None:
+                # A running job whose lease expired lost its worker; that counts as a failed attempt
+                expired = row[6] == 'running'
+                conn.execute("UPDATE jobs SET status = 'running', run_at = ?, attempts = ? WHERE id = ?",
+                             (now + self.lease, row[4] + expired, row[0]))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if row is None:
+            return None
+        return {"id": row[0], "name": row[1], "key": row[2], "payload": json.loads(row[3]),
+                "attempts": row[4] + expired, "created": row[5], "expired": expired}
+
+    def next_run_at(self):
+        row = self._conn().execute("SELECT MIN(run_at) FROM jobs WHERE status IN ('pending', 'running')").fetchone()
+        return row[0]
+
+    def retry(self, job, run_at, error):
+        self._conn().execute("UPDATE jobs SET status = 'pending', attempts = ?, run_at = ?, last_error = ? WHERE id = ?",
+                             (job["attempts"], run_at, error, job["id"]))
+
+    def complete(self, job):
+        self._conn().execute("UPDATE jobs SET status = 'done', attempts = ?, last_error = NULL WHERE id = ?",
+                             (job["attempts"], job["id"]))
+
+    def fail(self, job, error):
+        self._conn().execute("UPDATE jobs SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+                             (job["attempts"], error, job["id"]))
+
+    def depth(self):
+        return self._conn().execute("SELECT COUNT(*) FROM jobs WHERE status = 'pending'").fetchone()[0]
+
+
+class JobQueue:
+    """Named job handlers run by a pool of worker threads"""
+
+    def __init__(self, backend=None, workers=JOB_WORKERS, max_attempts=JOB_MAX_ATTEMPTS,
+                 retry_delay=JOB_RETRY_DELAY, concurrency=None):
+        self._backend = backend
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.limits = dict(JOB_CONCURRENCY if concurrency is None else concurrency)
+        self.handlers = {}
+        self._running = {}
+        self._cond = threading.Condition()
+        # Serializes claims so per-job limits hold; never held by enqueue()
+        self._claim_lock = threading.Lock()
+        self._wakeups = 0
+        self._owner_pid = None
+        self._stats = {"enqueued": 0, "duplicates": 0, "completed": 0, "failed": 0, "retries": 0,
+                       "latency_total": 0.0, "latency_max": 0.0}
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._cond:
+                if self._backend is None:
+                    self._backend = SQLiteBackend() if JOB_QUEUE == 'sqlite' else MemoryBackend()
+        return self._backend
+
+    def register(self, name, func, concurrency=None, max_attempts=None):
+        """Run func(payload) for jobs called name"""
+        self.handlers[name] = (func, max_attempts or self.max_attempts)
+        if concurrency is not None:
+            self.limits.setdefault(name, concurrency)
+        self.start()
+        return func
+
+    def enqueue(self, name, payload=None, key=None, delay=0):
+        """Queue a job; returns False when a job with the same key was already queued"""
+        now = time.time()
+        job = {"name": name, "key": f"{name}:{key}" if key else f"{name}:{now}:{id(payload)}",
+               "payload": payload or {}, "attempts": 0, "run_at": now + delay, "created": now}
+        added = self.backend.add(job)
+        with self._cond:
+            self._stats["enqueued" if added else "duplicates"] += 1
+            self._wakeups += 1
+            self._cond.notify()
+        if added:
+            print(f"📥 Job queued: {job['key']}")
+        self.start()
+        return added
+
+    def start(self):
+        """Start the worker threads (again after a fork)"""
+        if self._owner_pid == os.getpid():
+            return
+        with self._cond:
+            if self._owner_pid == os.getpid():
+                return
+            self._owner_pid = os.getpid()
+            self._running = {}
+            for index in range(self.workers):
+                threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True).start()
+
+    def _work(self):
+        while True:
+            # The backend is only touched outside _cond: a sqlite claim can wait on the file lock,
+            # and enqueue() on the webhook path must not wait behind it
+            with self._claim_lock:
+                with self._cond:
+                    wakeups = self._wakeups
+                    skip = {name for name, count in self._running.items() if count >= self.limits.get(name, count + 1)}
+                now = time.time()
+                job = self.backend.claim(now, skip)
+                if job is not None:
+                    with self._cond:
+                        self._running[job["name"]] = self._running.get(job["name"], 0) + 1
+            if job is None:
+                next_run_at = self.backend.next_run_at()
+                wait = POLL_INTERVAL if next_run_at is None else min(POLL_INTERVAL, max(0.01, next_run_at - now))
+                with self._cond:
+                    # Something was enqueued or finished since the claim: look again right away
+                    if self._wakeups == wakeups:
+                        self._cond.wait(timeout=wait)
+                continue
+            try:
+                self._run(job)
+            finally:
+                with self._cond:
+                    self._running[job["name"]] -= 1
+                    self._wakeups += 1
+                    self._cond.notify_all()
+
+    def _run(self, job):
+        func, max_attempts = self.handlers.get(job["name"], (None, 1))
+        if job.get("expired") and job["attempts"] >= max_attempts:
+            error = "lease expired: the worker running it stopped"
+            print(f"❌ Job {job['key']} failed after {job['attempts']} attempts: {error}")
+            self.backend.fail(job, error)
+            with self._cond:
+                self._stats["failed"] += 1
+            return
+        try:
+            if func is None:
+                raise LookupError(f"no handler registered for job {job['name']}")
+            func(job["payload"])
+        except Exception as e:
+            job["attempts"] += 1
+            error = f"{type(e).__name__}: {e}"
+            if job["attempts"] < max_attempts:
+                delay = self.retry_delay * 2 ** (job["attempts"] - 1)
+                print(f"🔁 Job {job['key']} failed ({error}), retry {job['attempts']} in {delay:.1f}s")
+                self.backend.retry(job, time.time() + delay, error)
+                with self._cond:
+                    self._stats["retries"] += 1
+            else:
+                print(f"❌ Job {job['key']} failed after {job['attempts']} attempts: {error}")
+                traceback.print_exc()
+                self.backend.fail(job, error)
+                with self._cond:
+                    self._stats["failed"] += 1
+            return
+        self.backend.complete(job)
+        latency = time.time() - job["created"]
+        with self._cond:
+            self._stats["completed"] += 1
+            self._stats["latency_total"] += latency
+            self._stats["latency_max"] = max(self._stats["latency_max"], latency)
+        print(f"✅ Job {job['key']} done in {latency:.2f}s")
+
+    def wait_idle(self, timeout=30):
+        """Block until nothing is due or running (shutdown, benchmarks); True if idle"""
+        deadline = time.time() + timeout
+        with self._cond:
+            while time.time() < deadline:
+                if not any(self._running.values()) and self.backend.depth() == 0:
+                    return True
+                self._cond.wait(timeout=0.05)
+        return False
+
+    def stats(self):
+        """Queue depth, running jobs, outcome counters and enqueue-to-done latency"""
+        with self._cond:
+            stats = dict(self._stats, running=sum(self._running.values()))
+        stats["depth"] = self.backend.depth()
+        latency_total = stats.pop("latency_total")
+        stats["latency_ms_avg"] = round(latency_total * 1000 / stats["completed"], 1) if stats["completed"] else 0.0
+        stats["latency_ms_max"] = round(stats.pop("latency_max") * 1000, 1)
+        return stats
+
+
+queue = JobQueue()
+
+
+def register(name, func, concurrency=None, max_attempts=None):
+    return queue.register(name, func, concurrency, max_attempts)
+
+
+def enqueue(name, payload=None, key=None, delay=0):
+    return queue.enqueue(name, payload, key, delay)
+
+
+def job_stats():
+    return queue.stats()
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Streaming LLM responses for the AI Receptionist
+Reads the OpenAI / Claude SSE streams and cuts the output at the first sentence
+boundary so the first TwiML <Say> can go out while the rest is still generating.
+The remainder is picked up by a follow-up <Redirect> to the continue route.
+
+Twilio may deliver that <Redirect> to a different worker than the one running
+the stream, so a finished turn that knows its CallSid also writes its text to
+the call's session in call_store (use the sqlite or redis backend when running
+several workers). The continue route waits at most STREAM_REST_WAIT for the
+remainder, well inside Twilio's webhook timeout.
+
+Environment:
+    STREAMING_ENABLED           "1" to answer with the first sentence + <Redirect>
+    STREAM_MIN_SENTENCE_CHARS   shortest text accepted as a first sentence (default 20)
+    STREAM_FIRST_TIMEOUT        seconds to wait for the first sentence (default 8)
+    STREAM_TURN_TTL             seconds an unclaimed remainder is kept (default 60)
+    STREAM_REST_WAIT            seconds the continue route waits for the remainder (default 5)
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+import call_store
+import http_client
+import metrics
+
+STREAMING_ENABLED = os.getenv('STREAMING_ENABLED', '0') == '1'
+MIN_SENTENCE_CHARS = int(os.getenv('STREAM_MIN_SENTENCE_CHARS', 20))
+FIRST_SENTENCE_TIMEOUT = float(os.getenv('STREAM_FIRST_TIMEOUT', 8))
+TURN_TTL = float(os.getenv('STREAM_TURN_TTL', 60))
+REST_WAIT = float(os.getenv('STREAM_REST_WAIT', 5))
+
+_SENTENCE_END = re.compile(r'[.!?…](?=\s)')
+
+_lock = threading.Lock()
+_turns = {}
+_stats = {"turns": 0, "first_sentence_total": 0.0, "first_sentence_max": 0.0, "errors": 0}
+
+
+def _iter_sse(response):
+    """Yield (event, data) pairs from a text/event-stream response"""
+    event = None
+    for line in response.iter_lines():
+        raw = line.decode('utf-8')
+        if not raw:
+            event = None
+            continue
+        if raw.startswith('event:'):
+            event = raw[6:].strip()
+        elif raw.startswith('data:'):
+            yield event, raw[5:].strip()
+
+
+def stream_openai(url, api_key, payload):
+    """Yield text deltas from an OpenAI chat completion stream"""
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    response = http_client.post(url, headers=headers, json=dict(payload, stream=True), stream=True)
+    with response:
+        response.raise_for_status()
+        for _, data in _iter_sse(response):
+            if data == '[DONE]':
+                break
+            choices = json.loads(data).get('choices') or [{}]
+            text = choices[0].get('delta', {}).get('content')
+            if text:
+                yield text
+
+
+def stream_claude(url, api_key, payload):
+    """Yield text deltas from a Claude messages stream"""
+    headers = {
+        "x-api-key": api_key,
+        "Content-Type": "application/json",
+        "anthropic-version": "2023-06-01"
+    }
+    response = http_client.post(url, headers=headers, json=dict(payload, stream=True), stream=True)
+    with response:
+        response.raise_for_status()
+        for event, data in _iter_sse(response):
+            if event == 'message_stop':
+                break
+            if event == 'content_block_delta':
+                text = json.loads(data).get('delta', {}).get('text')
+                if text:
+                    yield text
+
+
+def split_first_sentence(text, min_chars=MIN_SENTENCE_CHARS):
+    """Return (first_sentence, rest) once a boundary past min_chars exists, else None"""
+    for match in _SENTENCE_END.finditer(text):
+        if match.end() >= min_chars:
+            return text[:match.end()].strip(), text[match.end():]
+    return None
+
+
+class StreamingTurn:
+    """One streamed completion consumed on a background thread"""
+
+    def __init__(self, chunks, fallback="", on_complete=None, call_sid=None, user_message=""):
+        self.token = uuid.uuid4().hex
+        self.created = time.monotonic()
+        self.fallback = fallback
+        self.on_complete = on_complete
+        self.call_sid = call_sid
+        self.user_message = user_message
+        self.first_sentence = None
+        self.rest = ""
+        self.text = ""
+        self.error = None
+        self.first_delivered = False
+        self._first_ready = threading.Event()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._consume, args=(chunks,), daemon=True)
+        self._thread.start()
+
+    def _consume(self, chunks):
+        started = time.monotonic()
+        try:
+            for chunk in chunks:
+                self.text += chunk
+                if self.first_sentence is None:
+                    split = split_first_sentence(self.text)
+                    if split:
+                        self.first_sentence = split[0]
+                        _record_first_sentence(time.monotonic() - started)
+                        self._first_ready.set()
+        except Exception as e:
+            print(f"❌ Error streaming AI response: {e}")
+            self.error = e
+            with _lock:
+                _stats["errors"] += 1
+        finally:
+            if self.error is None and self.text.strip() and self.on_complete:
+                self.on_complete(self.text.strip())
+            if not self.text.strip():
+                self.text = self.fallback
+            if self.first_sentence is None:
+                self.first_sentence = self.text.strip()
+                _record_first_sentence(time.monotonic() - started)
+            self.rest = self.text.strip()[len(self.first_sentence):].strip()
+            if self.call_sid:
+                self._publish()
+            self._first_ready.set()
+            self._done.set()
+
+    def _publish(self):
+        """Leave the answer in the call's session for a continue request served by another worker"""
+        try:
+            call_store.update_session(self.call_sid, stream={
+                "token": self.token, "first": self.first_sentence,
+                "text": self.text.strip(), "user": self.user_message,
+            })
+        except Exception as e:
+            print(f"❌ Error storing streamed answer: {e}")
+
+    def wait_first(self, timeout=FIRST_SENTENCE_TIMEOUT):
+        """First sentence of the answer, or None if it did not arrive in time"""
+        if not self._first_ready.wait(timeout):
+            return None
+        self.first_delivered = True
+        return self.first_sentence
+
+    def wait_rest(self, timeout=None):
+        """Text not yet spoken, once the stream has finished"""
+        self._done.wait(timeout)
+        if not self.first_delivered:
+            return self.text.strip()
+        return self.rest
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def full_text(self, timeout=None):
+        self._done.wait(timeout)
+        return self.text.strip()
+
+
+def _record_first_sentence(elapsed):
+    with _lock:
+        _stats["turns"] += 1
+        _stats["first_sentence_total"] += elapsed
+        _stats["first_sentence_max"] = max(_stats["first_sentence_max"], elapsed)
+    metrics.observe('stage_seconds', elapsed, stage='llm_first_sentence')
+    print(f"⚡ Time to first sentence: {elapsed * 1000:.0f} ms")
+
+
+def start_turn(chunks, fallback="", on_complete=None, call_sid=None, user_message=""):
+    """Start consuming a stream of text chunks and register it for a later Redirect
+
+    on_complete(text) is called with the full answer when the stream ends cleanly.
+    With a call_sid the finished answer is also stored in the call's session.
+    """
+    turn = StreamingTurn(chunks, fallback, on_complete, call_sid, user_message)
+    now = time.monotonic()
+    with _lock:
+        for token in [t for t, old in _turns.items() if now - old.created > TURN_TTL]:
+            del _turns[token]
+        _turns[turn.token] = turn
+    return turn
+
+
+def take_turn(token):
+    """Claim a registered turn by its token (None if unknown or expired)"""
+    with _lock:
+        return _turns.pop(token, None)
+
+
+def continue_query(turn):
+    """Query string for the continue <Redirect>; whole=1 when the first sentence was not spoken"""
+    return f"turn={turn.token}" + ("" if turn.first_delivered else "&whole=1")
+
+
+def wait_remainder(token, call_sid=None, whole=False, timeout=REST_WAIT):
+    """(user_message, full_text, rest) of a streamed turn, or None if it did not finish in time
+
+    The turn is claimed from this process when it ran here; otherwise its
+    answer is read from the call's session once the other worker stores it.
+    """
+    turn = take_turn(token)
+    if turn is not None:
+        if not turn._done.wait(timeout):
+            return None
+        return turn.user_message, turn.full_text(), turn.wait_rest()
+    if not call_sid:
+        return None
+    deadline = time.monotonic() + timeout
+    while True:
+        stream = call_store.load_session(call_sid).get("stream")
+        if stream and stream.get("token") == token:
+            text = stream["text"]
+            rest = text if whole else text[len(stream["first"]):].strip()
+            return stream.get("user", ""), text, rest
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(0.1)
+
+
+def stream_stats():
+    """Time-to-first-sentence counters"""
+    with _lock:
+        stats = dict(_stats)
+        stats["pending_turns"] = len(_turns)
+    total = stats.pop("first_sentence_total")
+    stats["first_sentence_avg_ms"] = round(total / stats["turns"] * 1000, 1) if stats["turns"] else 0.0
+    stats["first_sentence_max_ms"] = round(stats.pop("first_sentence_max") * 1000, 1)
+    return stats
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Real-time call audio over Twilio Media Streams
+A call answered with <Connect><Stream> (see asgi_server.py) sends the caller's
+audio over a websocket as base64 μ-law frames instead of going through
+<Record> / <Gather> and a new webhook per turn. Each frame is decoded and run
+through the voice-activity detector in audio.py; audio inside an utterance is
+fed to the speech recognizer as it arrives, and when the detector hears the end
+of the utterance the transcript is answered and synthesized, and the speech is
+streamed back as μ-law media messages while it is still being downloaded,
+followed by a mark. If the caller starts talking while the
+answer is still playing, a clear message stops the playback (barge-in).
+
+Recognizers and synthesizers are pluggable: RECOGNIZERS and SYNTHESIZERS map a
+name to a factory, and a streaming STT only has to implement feed() / finish().
+The Whisper recognizer buffers the utterance and uploads it when it ends. A
+synthesizer's stream(text) yields μ-law bytes in chunks of any size.
+
+Environment:
+    MEDIA_STT            recognizer name in RECOGNIZERS (default whisper)
+    MEDIA_TTS            synthesizer name in SYNTHESIZERS (default openai)
+    MEDIA_TTS_MODEL      OpenAI speech model (default tts-1)
+    MEDIA_TTS_VOICE      OpenAI speech voice (default nova)
+    MEDIA_STT_TIMEOUT    seconds allowed for one transcription (default 5)
+    MEDIA_TTS_TIMEOUT    seconds allowed for one synthesis (default 5)
+    OPENAI_BASE_URL / OPENAI_API_KEY  Whisper and speech endpoints
+"""
+
+import asyncio
+import base64
+import contextlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+import audio
+import http_client
+import metrics
+import recordings
+
+STT = os.getenv('MEDIA_STT', 'whisper')
+TTS = os.getenv('MEDIA_TTS', 'openai')
+TTS_MODEL = os.getenv('MEDIA_TTS_MODEL', 'tts-1')
+TTS_VOICE = os.getenv('MEDIA_TTS_VOICE', 'nova')
+STT_TIMEOUT = float(os.getenv('MEDIA_STT_TIMEOUT', 5))
+TTS_TIMEOUT = float(os.getenv('MEDIA_TTS_TIMEOUT', 5))
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com')
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
+
+# OpenAI's "pcm" speech format is 24 kHz 16-bit mono
+TTS_SAMPLE_RATE = 24000
+# Outbound audio is sent in 20 ms frames, like Twilio's inbound ones
+FRAME_BYTES = audio.FRAME_SAMPLES
+
+_lock = threading.Lock()
+_stats = {"streams": 0, "active": 0, "frames_in": 0, "frames_out": 0, "utterances": 0, "empty_transcripts": 0,
+          "barge_ins": 0, "errors": 0, "stt_seconds": 0.0, "turn_seconds": 0.0, "turns": 0}
+
+
+def _record(**deltas):
+    with _lock:
+        for key, value in deltas.items():
+            _stats[key] += value
+
+
+class WhisperRecognizer:
+    """Collects one utterance and transcribes it with Whisper when it ends"""
+
+    def __init__(self, language='es'):
+        self.language = language
+        self._chunks = []
+
+    async def feed(self, samples):
+        self._chunks.append(samples)
+
+    async def finish(self):
+        if not self._chunks:
+            return ""
+        body = audio.wav_bytes(np.concatenate(self._chunks))
+        response = await http_client.apost(
+            f"{OPENAI_BASE_URL}/v1/audio/transcriptions",
+            headers={'Authorization': f'Bearer {OPENAI_API_KEY}'},
+            data={'model': recordings.WHISPER_MODEL, 'language': self.language},
+            files={'file': ('utterance.wav', body, 'audio/wav')},
+            timeout=STT_TIMEOUT,
+        )
+        response.raise_for_status()
+        return response.json().get('text', '').strip()
+
+
+class OpenAISpeech:
+    """Text → 8 kHz μ-law through OpenAI's speech endpoint (24 kHz PCM, resampled as it arrives)"""
+
+    def __init__(self, model=TTS_MODEL, voice=TTS_VOICE):
+        self.model = model
+        self.voice = voice
+
+    async def stream(self, text):
+        resampler = audio.Resampler(TTS_SAMPLE_RATE, audio.SAMPLE_RATE)
+        carry = b''
+        async with http_client.astream(
+            'POST', f"{OPENAI_BASE_URL}/v1/audio/speech",
+            headers={'Authorization': f'Bearer {OPENAI_API_KEY}'},
+            json={'model': self.model, 'voice': self.voice, 'input': text, 'response_format': 'pcm'},
+            timeout=TTS_TIMEOUT,
+        ) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                data = carry + chunk
+                even = len(data) // 2 * 2
+                carry = data[even:]
+                samples = resampler.feed(np.frombuffer(data[:even], dtype='<i2'))
+                if len(samples):
+                    yield audio.ulaw_encode(samples)
+        yield audio.ulaw_encode(resampler.flush())
+
+
+RECOGNIZERS = {'whisper': WhisperRecognizer}
+SYNTHESIZERS = {'openai': OpenAISpeech}
+
+
+class MediaStream:
+    """One Twilio media stream: handle() each inbound message, close() when the socket ends
+
+    send(message) writes one JSON message to the websocket; reply(call_sid,
+    text, parameters) returns (answer, ends_call) for one caller utterance.
+    """
+
+    def __init__(self, send, reply, recognizer=None, synthesizer=None):
+        self.send = send
+        self.reply = reply
+        self.recognizer_factory = recognizer or RECOGNIZERS[STT]
+        self.synthesizer = synthesizer or SYNTHESIZERS[TTS]()
+        self.vad = audio.VoiceActivityDetector()
+        self.stream_sid = None
+        self.call_sid = None
+        self.parameters = {}
+        self.closed = False
+        self._recognizer = None
+        self._turns = []
+        self._turn_lock = asyncio.Lock()
+        self._playing = set()
+        self._marks = 0
+        self._hangup_mark = None
+
+    async def handle(self, message):
+        """Process one inbound message; returns False once the stream should be closed"""
+        event = message.get('event')
+        if event == 'media':
+            await self._media(message['media'])
+        elif event == 'start':
+            start = message['start']
+            self.stream_sid = message.get('streamSid') or start.get('streamSid')
+            self.call_sid = start.get('callSid')
+            self.parameters = start.get('customParameters') or {}
+            _record(streams=1, active=1)
+            print(f"🔊 Media stream {self.stream_sid} started for call {self.call_sid}")
+        elif event == 'mark':
+            name = message.get('mark', {}).get('name')
+            self._playing.discard(name)
+            if name is not None and name == self._hangup_mark:
+                return False
+        elif event == 'stop':
+            return False
+        return not self.closed
+
+    async def _media(self, media):
+        if media.get('track', 'inbound') != 'inbound':
+            return
+        samples = audio.ulaw_decode(base64.b64decode(media['payload']))
+        _record(frames_in=1)
+        for kind, chunk in self.vad.feed(samples):
+            if kind == 'start':
+                if self._playing:
+                    await self._barge_in()
+                self._recognizer = self.recognizer_factory()
+            if self._recognizer is None:
+                continue
+            await self._recognizer.feed(chunk)
+            if kind == 'end':
+                recognizer, self._recognizer = self._recognizer, None
+                self._turns.append(asyncio.ensure_future(self._turn(recognizer, time.perf_counter())))
+                self._turns = [turn for turn in self._turns if not turn.done()]
+
+    async def _barge_in(self):
+        self._playing.clear()
+        _record(barge_ins=1)
+        await self._send({'event': 'clear', 'streamSid': self.stream_sid})
+
+    async def _turn(self, recognizer, ended):
+        """Transcribe, answer and speak one utterance; turns of a stream are answered in order"""
+        try:
+            with metrics.span('transcription', source='media_stream'):
+                text = await recognizer.finish()
+            _record(utterances=1, stt_seconds=time.perf_counter() - ended)
+            if not text:
+                _record(empty_transcripts=1)
+                return
+            async with self._turn_lock:
+                answer, ends_call = await self.reply(self.call_sid, text, self.parameters)
+                elapsed = await self._play(answer, ended, hangup=ends_call)
+            _record(turns=1, turn_seconds=elapsed)
+            metrics.observe('stage_seconds', elapsed, stage='media_turn')
+            print(f"🔊 {self.call_sid}: «{text}» → «{answer}», answered after {elapsed * 1000:.0f} ms")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _record(errors=1)
+            print(f"❌ Media stream turn failed for call {self.call_sid}: {e}")
+
+    async def _play(self, answer, ended, hangup=False):
+        """Stream the synthesized answer as 20 ms frames, then a mark; returns the dead air the caller heard
+        (end of their utterance → first frame of the answer). A barge-in stops the download."""
+        self._marks += 1
+        name = f"reply-{self._marks}"
+        self._playing.add(name)
+        elapsed, buffered, sent = None, b'', 0
+        with metrics.span('tts'):
+            async with contextlib.aclosing(self.synthesizer.stream(answer)) as chunks:
+                async for chunk in chunks:
+                    buffered += chunk
+                    whole = len(buffered) // FRAME_BYTES * FRAME_BYTES
+                    if whole and elapsed is None:
+                        elapsed = time.perf_counter() - ended
+                    sent += await self._send_frames(buffered[:whole])
+                    buffered = buffered[whole:]
+                    if name not in self._playing:
+                        break
+        if name in self._playing:
+            sent += await self._send_frames(buffered)
+        _record(frames_out=sent)
+        if name in self._playing or hangup:
+            if hangup:
+                self._hangup_mark = name
+            await self._send({'event': 'mark', 'streamSid': self.stream_sid, 'mark': {'name': name}})
+        return time.perf_counter() - ended if elapsed is None else elapsed
+
+    async def _send_frames(self, payload):
+        for offset in range(0, len(payload), FRAME_BYTES):
+            frame = base64.b64encode(payload[offset:offset + FRAME_BYTES]).decode('ascii')
+            await self._send({'event': 'media', 'streamSid': self.stream_sid, 'media': {'payload': frame}})
+        return -(-len(payload) // FRAME_BYTES)
+
+    async def _send(self, message):
+        if not self.closed:
+            await self.send(json.dumps(message))
+
+    async def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for turn in self._turns:
+            turn.cancel()
+        if self.stream_sid:
+            _record(active=-1)
+            print(f"🔊 Media stream {self.stream_sid} closed")
+
+
+def media_stream_stats():
+    """Stream and frame counters, barge-ins, and average transcription / end-of-speech-to-answer latency"""
+    with _lock:
+        stats = dict(_stats)
+    stt_seconds, turn_seconds = stats.pop("stt_seconds"), stats.pop("turn_seconds")
+    stats["stt_ms_avg"] = round(stt_seconds * 1000 / stats["utterances"], 1) if stats["utterances"] else 0.0
+    stats["turn_ms_avg"] = round(turn_seconds * 1000 / stats["turns"], 1) if stats["turns"] else 0.0
+    return stats
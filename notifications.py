@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Call-summary notifications delivered off the request path
+notify() only queues the summary and returns; a dispatcher thread waits
+NOTIFY_COALESCE_SECONDS so a burst of calls for the same owner becomes one
+message, then hands it to every sink. Failed deliveries are retried with
+exponential backoff, honouring Retry-After on rate limits (Twilio 429, SMTP
+4xx); permanent failures and exhausted retries go to a dead-letter file.
+
+Sinks (enabled when listed in NOTIFY_SINKS and configured):
+    sms      Twilio Messages API to the owner number
+    email    SMTP to NOTIFY_EMAIL_TO (python -m fake_providers --smtp-port 1025 for a local server)
+    file     append to NOTIFY_FILE
+    webhook  JSON POST to NOTIFY_WEBHOOK_URL
+
+Environment:
+    NOTIFY_SINKS              default sms,email,file,webhook
+    NOTIFY_COALESCE_SECONDS   window that merges summaries per owner (default 10)
+    NOTIFY_MAX_ATTEMPTS       attempts per sink before dead-lettering (default 5)
+    NOTIFY_RETRY_DELAY        first retry delay in seconds, doubled per attempt (default 1)
+    NOTIFY_MAX_RETRY_AFTER    cap on a server-requested Retry-After in seconds (default 60)
+    NOTIFY_WORKERS            concurrent deliveries (default 4)
+    NOTIFY_DEAD_LETTER        NDJSON file of undelivered notifications (default notifications_dead_letter.ndjson)
+    NOTIFY_FILE               file sink path (default call_summaries.txt)
+    NOTIFY_WEBHOOK_URL        webhook sink URL
+    TWILIO_ACCOUNT_SID / TWILIO_AUTH_TOKEN / TWILIO_PHONE_NUMBER  sms sink
+    TWILIO_API_BASE_URL       default https://api.twilio.com
+    SMTP_HOST / SMTP_PORT (25) / SMTP_USER / SMTP_PASSWORD / SMTP_STARTTLS  email sink
+    NOTIFY_EMAIL_FROM / NOTIFY_EMAIL_TO
+"""
+
+import heapq
+import itertools
+import json
+import os
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+
+import http_client
+import metrics
+
+NOTIFY_SINKS = [name.strip() for name in os.getenv('NOTIFY_SINKS', 'sms,email,file,webhook').split(',') if name.strip()]
+COALESCE_SECONDS = float(os.getenv('NOTIFY_COALESCE_SECONDS', 10))
+MAX_ATTEMPTS = int(os.getenv('NOTIFY_MAX_ATTEMPTS', 5))
+RETRY_DELAY = float(os.getenv('NOTIFY_RETRY_DELAY', 1))
+MAX_RETRY_AFTER = float(os.getenv('NOTIFY_MAX_RETRY_AFTER', 60))
+WORKERS = int(os.getenv('NOTIFY_WORKERS', 4))
+DEAD_LETTER_PATH = os.getenv('NOTIFY_DEAD_LETTER', 'notifications_dead_letter.ndjson')
+FILE_PATH = os.getenv('NOTIFY_FILE', 'call_summaries.txt')
+WEBHOOK_URL = os.getenv('NOTIFY_WEBHOOK_URL', '')
+TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID', '')
+TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN', '')
+TWILIO_PHONE_NUMBER = os.getenv('TWILIO_PHONE_NUMBER', '')
+TWILIO_API_BASE_URL = os.getenv('TWILIO_API_BASE_URL', 'https://api.twilio.com')
+SMTP_HOST = os.getenv('SMTP_HOST', '')
+SMTP_PORT = int(os.getenv('SMTP_PORT', 25))
+SMTP_USER = os.getenv('SMTP_USER', '')
+SMTP_PASSWORD = os.getenv('SMTP_PASSWORD', '')
+SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', 'false').lower() == 'true'
+EMAIL_FROM = os.getenv('NOTIFY_EMAIL_FROM', 'receptionist@localhost')
+EMAIL_TO = os.getenv('NOTIFY_EMAIL_TO', '')
+SMS_MAX_CHARS = 1600
+SUBJECT = "📞 Call Summary"
+
+
+class DeliveryError(Exception):
+    """A sink could not deliver; retry_after is set for rate limits, permanent for rejections"""
+
+    def __init__(self, message, retry_after=None, permanent=False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.permanent = permanent
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get('Retry-After', ''))
+    except ValueError:
+        return RETRY_DELAY
+
+
+def _check_http(response, ok=(200, 201, 202, 204)):
+    if response.status_code in ok:
+        return
+    if response.status_code == 429:
+        raise DeliveryError(f"rate limited ({response.status_code})", retry_after=_retry_after(response))
+    raise DeliveryError(f"HTTP {response.status_code}: {response.text[:200]}",
+                        permanent=400 <= response.status_code < 500)
+
+
+def _cap(body, limit):
+    return body if len(body) <= limit else body[:limit - 1] + "…"
+
+
+def pack(bodies, limit=None):
+    """Group summaries into as few messages as fit in limit characters each (one group when unlimited);
+    a single summary longer than limit is cut to fit"""
+    if limit is None:
+        return [list(bodies)]
+    groups, size = [], 0
+    for body in (_cap(body, limit) for body in bodies):
+        if groups and size + 1 + len(body) <= limit:
+            groups[-1].append(body)
+            size += 1 + len(body)
+        else:
+            groups.append([body])
+            size = len(body)
+    return groups
+
+
+def format_summary(turns):
+    """Plain-text summary of a call's turns"""
+    summary = "📞 Call Summary:\n\n"
+    for turn in turns:
+        summary += f"⏰ {turn['timestamp']}\n"
+        summary += f"👤 User: {turn['user']}\n"
+        summary += f"🤖 AI: {turn['ai']}\n\n"
+    return summary
+
+
+class TwilioSMSSink:
+    name = 'sms'
+    # A coalesced batch is split into messages of at most this many characters
+    max_chars = SMS_MAX_CHARS
+
+    def __init__(self, account_sid=TWILIO_ACCOUNT_SID, auth_token=TWILIO_AUTH_TOKEN,
+                 from_number=TWILIO_PHONE_NUMBER, base_url=TWILIO_API_BASE_URL):
+        self.url = f"{base_url}/2010-04-01/Accounts/{account_sid}/Messages.json"
+        self.auth = (account_sid, auth_token)
+        self.from_number = from_number
+
+    def send(self, owner, subject, body):
+        if not owner:
+            raise DeliveryError("no owner phone number", permanent=True)
+        body = _cap(body, SMS_MAX_CHARS)
+        response = http_client.post(self.url, auth=self.auth, data={'From': self.from_number, 'To': owner, 'Body': body})
+        _check_http(response)
+
+
+class SMTPSink:
+    name = 'email'
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, sender=EMAIL_FROM, recipient=EMAIL_TO,
+                 username=SMTP_USER, password=SMTP_PASSWORD, starttls=SMTP_STARTTLS, timeout=10):
+        self.host, self.port = host, port
+        self.sender, self.recipient = sender, recipient
+        self.username, self.password = username, password
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def send(self, owner, subject, body):
+        message = EmailMessage()
+        message['From'] = self.sender
+        message['To'] = self.recipient
+        message['Subject'] = f"{subject} ({owner})" if owner else subject
+        message.set_content(body)
+        try:
+            with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+                if self.starttls:
+                    smtp.starttls()
+                if self.username:
+                    smtp.login(self.username, self.password)
+                smtp.send_message(message)
+        except smtplib.SMTPResponseException as e:
+            # 4xx is "try again later" (greylisting, sending limits), 5xx is final
+            if 400 <= e.smtp_code < 500:
+                raise DeliveryError(f"SMTP {e.smtp_code}: {e.smtp_error!r}", retry_after=RETRY_DELAY) from e
+            raise DeliveryError(f"SMTP {e.smtp_code}: {e.smtp_error!r}", permanent=True) from e
+        except smtplib.SMTPRecipientsRefused as e:
+            raise DeliveryError(f"recipients refused: {e.recipients}", permanent=True) from e
+
+
+class FileSink:
+    name = 'file'
+
+    def __init__(self, path=FILE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, owner, subject, body):
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(f"\n=== NEW CALL SUMMARY ===\n{body}\n")
+
+
+class WebhookSink:
+    name = 'webhook'
+
+    def __init__(self, url=WEBHOOK_URL):
+        self.url = url
+
+    def send(self, owner, subject, body):
+        _check_http(http_client.post(self.url, json={"owner": owner, "subject": subject, "text": body}))
+
+
+def configured_sinks(names=NOTIFY_SINKS):
+    """Sinks from NOTIFY_SINKS whose settings are present"""
+    sinks = []
+    for name in names:
+        if name == 'sms':
+            if all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER]):
+                sinks.append(TwilioSMSSink())
+        elif name == 'email':
+            if SMTP_HOST and EMAIL_TO:
+                sinks.append(SMTPSink())
+        elif name == 'file':
+            sinks.append(FileSink())
+        elif name == 'webhook':
+            if WEBHOOK_URL:
+                sinks.append(WebhookSink())
+        else:
+            print(f"⚠️ Unknown notification sink: {name}")
+    return sinks
+
+
+class Dispatcher:
+    """Coalesces summaries per owner and delivers them to the sinks in the background"""
+
+    def __init__(self, sinks, coalesce_seconds=COALESCE_SECONDS, max_attempts=MAX_ATTEMPTS,
+                 retry_delay=RETRY_DELAY, dead_letter_path=DEAD_LETTER_PATH, workers=WORKERS):
+        self.sinks = {sink.name: sink for sink in sinks}
+        self.coalesce_seconds = coalesce_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.dead_letter_path = dead_letter_path
+        self.workers = workers
+        self._batches = {}
+        self._deliveries = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._executor = None
+        self._owner_pid = None
+        self._stats = {"queued": 0, "coalesced": 0, "sent": 0, "delivered": 0, "retries": 0,
+                       "rate_limited": 0, "dead_lettered": 0, "latency_total": 0.0, "latency_max": 0.0}
+
+    def notify(self, owner, body, subject=SUBJECT, sinks=None):
+        """Queue a summary for owner; returns False when no sink would take it"""
+        names = tuple(name for name in (sinks or self.sinks) if name in self.sinks)
+        if not names:
+            return False
+        now = time.time()
+        with self._cond:
+            batch = self._batches.get((owner, names))
+            if batch is None:
+                self._batches[(owner, names)] = {"owner": owner, "subject": subject, "bodies": [body],
+                                                 "sinks": names, "queued": now, "due": now + self.coalesce_seconds}
+            else:
+                batch["bodies"].append(body)
+                self._stats["coalesced"] += 1
+            self._stats["queued"] += 1
+            self._cond.notify()
+        self._start()
+        return True
+
+    def _start(self):
+        if self._owner_pid == os.getpid():
+            return
+        with self._cond:
+            if self._owner_pid == os.getpid():
+                return
+            self._owner_pid = os.getpid()
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='notify')
+            threading.Thread(target=self._run, name='notify-dispatcher', daemon=True).start()
+
+    def _close_batch(self, batch):
+        """Turn a coalescing window into one delivery per sink, or several where the sink limits the length"""
+        for name in batch["sinks"]:
+            for bodies in pack(batch["bodies"], getattr(self.sinks[name], 'max_chars', None)):
+                count = len(bodies)
+                subject = batch["subject"] if count == 1 else f"{batch['subject']} ×{count}"
+                delivery = {"sink": name, "owner": batch["owner"], "subject": subject, "body": "\n".join(bodies),
+                            "count": count, "queued": batch["queued"], "attempts": 0}
+                heapq.heappush(self._deliveries, (time.time(), next(self._seq), delivery))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                now = time.time()
+                for key in [key for key, batch in self._batches.items() if batch["due"] <= now]:
+                    self._close_batch(self._batches.pop(key))
+                due = []
+                while self._deliveries and self._deliveries[0][0] <= now:
+                    due.append(heapq.heappop(self._deliveries)[2])
+                self._in_flight += len(due)
+                if not due:
+                    wake = [batch["due"] for batch in self._batches.values()]
+                    if self._deliveries:
+                        wake.append(self._deliveries[0][0])
+                    self._cond.wait(timeout=max(0.01, min(wake) - now) if wake else None)
+                    continue
+            for delivery in due:
+                self._executor.submit(self._deliver, delivery)
+
+    def _deliver(self, delivery):
+        sink = self.sinks[delivery["sink"]]
+        delivery["attempts"] += 1
+        try:
+            with metrics.span('notification', sink=delivery["sink"]):
+                sink.send(delivery["owner"], delivery["subject"], delivery["body"])
+        except Exception as e:
+            error = e if isinstance(e, DeliveryError) else DeliveryError(f"{type(e).__name__}: {e}")
+            self._failed(delivery, error)
+        else:
+            latency = time.time() - delivery["queued"]
+            with self._cond:
+                self._stats["sent"] += 1
+                self._stats["delivered"] += delivery["count"]
+                self._stats["latency_total"] += latency
+                self._stats["latency_max"] = max(self._stats["latency_max"], latency)
+            print(f"✅ Summary sent via {delivery['sink']} to {delivery['owner'] or 'owner'} "
+                  f"({delivery['count']} call(s), {latency:.1f}s after queueing)")
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def _failed(self, delivery, error):
+        if error.permanent or delivery["attempts"] >= self.max_attempts:
+            print(f"❌ Summary via {delivery['sink']} failed after {delivery['attempts']} attempt(s): {error}")
+            self._dead_letter(delivery, error)
+            return
+        backoff = self.retry_delay * 2 ** (delivery["attempts"] - 1)
+        if error.retry_after is not None:
+            backoff = max(backoff, min(error.retry_after, MAX_RETRY_AFTER))
+        print(f"🔁 Summary via {delivery['sink']} failed ({error}), retry in {backoff:.1f}s")
+        with self._cond:
+            self._stats["retries"] += 1
+            if error.retry_after is not None:
+                self._stats["rate_limited"] += 1
+            heapq.heappush(self._deliveries, (time.time() + backoff, next(self._seq), delivery))
+            self._cond.notify()
+
+    def _dead_letter(self, delivery, error):
+        record = dict(delivery, error=str(error), failed_at=time.strftime("%Y-%m-%d %H:%M:%S"))
+        with self._cond:
+            self._stats["dead_lettered"] += delivery["count"]
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def flush(self, timeout=30):
+        """Close every coalescing window now and wait for deliveries (shutdown, benchmarks)"""
+        deadline = time.time() + timeout
+        with self._cond:
+            for batch in self._batches.values():
+                batch["due"] = 0
+            self._cond.notify_all()
+            while self._batches or self._deliveries or self._in_flight:
+                if time.time() >= deadline:
+                    return False
+                self._cond.wait(timeout=0.05)
+        return True
+
+    def stats(self):
+        """Queue, outcome counters and queue-to-delivery latency"""
+        with self._cond:
+            stats = dict(self._stats, pending=sum(len(batch["bodies"]) for batch in self._batches.values()),
+                         retrying=len(self._deliveries), sinks=list(self.sinks))
+        latency_total = stats.pop("latency_total")
+        stats["latency_ms_avg"] = round(latency_total * 1000 / stats["sent"], 1) if stats["sent"] else 0.0
+        stats["latency_ms_max"] = round(stats.pop("latency_max") * 1000, 1)
+        return stats
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = Dispatcher(configured_sinks())
+                print(f"📨 Notification sinks: {', '.join(_dispatcher.sinks) or 'none'}")
+    return _dispatcher
+
+
+def notify(owner, body, subject=SUBJECT, sinks=None):
+    return get_dispatcher().notify(owner, body, subject, sinks)
+
+
+def notification_stats():
+    return get_dispatcher().stats()
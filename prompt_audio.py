@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Pre-synthesized audio for the servers' static prompts
+The greeting, menu, retry and goodbye phrases never change, yet Twilio
+synthesizes every <Say> of them again on every call. With the cache enabled,
+twiml.Voice.prompt(text) renders each phrase once per voice / language / rate
+through a TTS backend, stores it on disk as an 8 kHz μ-law WAV named after a
+hash of everything that shapes the audio (backend and its settings, voice,
+language, rate, text), and emits <Play> of its URL instead of <Say>. Editing a
+phrase changes its hash, so the new text is rendered and the old file is never
+served; `python prompt_audio.py prune` deletes the files no phrase of the
+listed modules points to any more. Files are served from PROMPT_AUDIO_PATH with a strong
+ETag (the hash) and a year-long immutable Cache-Control, so Twilio fetches
+each one once. Without PROMPT_AUDIO_BASE_URL, for a voice PROMPT_AUDIO_VOICES
+does not map, or when a phrase cannot be rendered, the prompt stays a <Say>.
+
+The backend's voices are not Twilio's: a prompt rendered as OpenAI "nova"
+sounds like a different person from the Polly.Lupe <Say> of the dynamic
+replies around it. No voice is mapped by default, so prompts keep Twilio's
+voice; map a voice only when the caller hearing both is acceptable, or when
+the replies are spoken by the same TTS (e.g. media_stream with MEDIA_TTS_VOICE).
+
+Importing a server never waits for the TTS backend: a phrase that is not on
+disk yet stays a <Say> and is rendered on a background thread, one phrase at a
+time, under a lock file so concurrent workers render it only once. The servers
+build their TwiML at import, so the <Play> is used from the next start on;
+render ahead of a deploy so the first start already has every file:
+
+    python prompt_audio.py render server simple_server_working
+    python prompt_audio.py prune server simple_server simple_server_fixed simple_server_working
+
+Environment:
+    PROMPT_AUDIO_BASE_URL   public http(s) URL of this server; enables <Play> prompts
+    PROMPT_AUDIO_PATH       URL path the files are served under (default /prompts/)
+    PROMPT_AUDIO_DIR        directory of the rendered files (default prompt_audio)
+    PROMPT_AUDIO_BACKEND    TTS backend in BACKENDS (default openai)
+    PROMPT_AUDIO_MODEL      OpenAI speech model (default tts-1-hd)
+    PROMPT_AUDIO_VOICES     Twilio voice → OpenAI voice to render with, e.g. "Polly.Lupe=nova" (default none)
+    PROMPT_AUDIO_TIMEOUT    seconds allowed to render one phrase (default 20)
+    OPENAI_BASE_URL / OPENAI_API_KEY  speech endpoint
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+
+BASE_URL = os.getenv('PROMPT_AUDIO_BASE_URL', '').rstrip('/')
+PATH = '/' + os.getenv('PROMPT_AUDIO_PATH', '/prompts/').strip('/') + '/'
+DIRECTORY = os.getenv('PROMPT_AUDIO_DIR', 'prompt_audio')
+BACKEND = os.getenv('PROMPT_AUDIO_BACKEND', 'openai')
+MODEL = os.getenv('PROMPT_AUDIO_MODEL', 'tts-1-hd')
+TIMEOUT = float(os.getenv('PROMPT_AUDIO_TIMEOUT', 20))
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com')
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
+
+CONTENT_TYPE = 'audio/wav'
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+_NAME = re.compile(r'^[0-9a-f]{64}\.wav$')
+
+
+def _parse_voices(value):
+    """Parse "twilio_voice=openai_voice,..." into a dict"""
+    voices = {}
+    for item in value.split(','):
+        twilio_voice, _, openai_voice = item.strip().partition('=')
+        if twilio_voice and openai_voice:
+            voices[twilio_voice] = openai_voice
+    return voices
+
+
+VOICES = _parse_voices(os.getenv('PROMPT_AUDIO_VOICES', ''))
+
+_lock = threading.Lock()
+_phrases = {}
+_pending = set()
+_renders = None
+_renderer_pid = None
+# The command line renders before returning; servers render in the background
+_inline = False
+_stats = {"phrases": 0, "unmapped": 0, "cached": 0, "queued": 0, "rendered": 0, "failures": 0, "served": 0, "not_modified": 0}
+
+
+def _record(**deltas):
+    with _lock:
+        for key, value in deltas.items():
+            _stats[key] += value
+
+
+class OpenAIPromptSpeech:
+    """Phrase → 8 kHz μ-law WAV through OpenAI's speech endpoint; Twilio's rate becomes the speed"""
+
+    SPEEDS = {None: 1.0, 'medium': 1.0, 'slow': 0.85, 'x-slow': 0.7, 'fast': 1.15, 'x-fast': 1.3}
+
+    def __init__(self, model=MODEL, voices=None):
+        self.model = model
+        self.voices = VOICES if voices is None else voices
+
+    def speaks(self, voice):
+        """Whether the Twilio voice is mapped to one of ours; unmapped voices stay <Say>"""
+        return voice in self.voices
+
+    def settings(self, voice, language, rate):
+        """Everything besides the text that changes the audio; part of the file's hash"""
+        return {'model': self.model, 'voice': self.voices[voice], 'speed': self.SPEEDS.get(rate, 1.0)}
+
+    def render(self, text, voice, language, rate):
+        import audio
+        import http_client
+        import numpy as np
+
+        response = http_client.post(
+            f"{OPENAI_BASE_URL}/v1/audio/speech",
+            headers={'Authorization': f'Bearer {OPENAI_API_KEY}'},
+            json=dict(self.settings(voice, language, rate), input=text, response_format='pcm'),
+            timeout=(http_client.CONNECT_TIMEOUT, TIMEOUT),
+        )
+        response.raise_for_status()
+        pcm = np.frombuffer(response.content[:len(response.content) // 2 * 2], dtype='<i2')
+        # OpenAI's "pcm" format is 24 kHz 16-bit mono; Twilio plays 8 kHz μ-law as is
+        samples = audio.trim_silence(audio.resample(pcm, 24000, audio.SAMPLE_RATE))
+        return audio.wav_bytes(samples, ulaw=True)
+
+
+BACKENDS = {'openai': OpenAIPromptSpeech}
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = BACKENDS[BACKEND]()
+    return _backend
+
+
+def phrase_key(text, voice, language=None, rate=None, backend=None):
+    """Content address of a phrase: SHA-256 over the backend, its settings, the voice attributes and the text"""
+    backend = backend or get_backend()
+    material = json.dumps([BACKEND, backend.settings(voice, language, rate), voice, language, rate, text],
+                          ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def _file(name):
+    return os.path.join(DIRECTORY, name)
+
+
+def _render(key, text, voice, language, rate):
+    import metrics
+
+    os.makedirs(DIRECTORY, exist_ok=True)
+    # Workers starting together queue the same phrases; the first to hold the lock renders it
+    with open(_file(f"{key}.lock"), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        if os.path.exists(_file(f"{key}.wav")):
+            return False
+        with metrics.span('prompt_render'):
+            body = get_backend().render(text, voice, language, rate)
+        temporary = _file(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temporary, 'wb') as f:
+            f.write(body)
+        os.replace(temporary, _file(f"{key}.wav"))
+    return True
+
+
+def _render_phrase(key, text, voice, language, rate):
+    try:
+        if _render(key, text, voice, language, rate):
+            _record(rendered=1)
+            print(f"🎵 Rendered prompt «{text[:40]}» ({voice}, {language})")
+        return True
+    except Exception as e:
+        _record(failures=1)
+        print(f"❌ Could not render prompt «{text[:40]}»: {e}")
+        return False
+    finally:
+        with _lock:
+            _pending.discard(key)
+
+
+def _render_loop(renders):
+    while True:
+        _render_phrase(*renders.get())
+
+
+def _queue_render(key, text, voice, language, rate):
+    # Forked workers do not inherit the parent's thread
+    global _renders, _renderer_pid
+    with _lock:
+        if key in _pending:
+            return
+        _pending.add(key)
+        if _renderer_pid != os.getpid():
+            _renders = queue.SimpleQueue()
+            threading.Thread(target=_render_loop, args=(_renders,), daemon=True,
+                             name='prompt-audio').start()
+            _renderer_pid = os.getpid()
+        _renders.put((key, text, voice, language, rate))
+    _record(queued=1)
+
+
+def url(text, voice, language=None, rate=None):
+    """URL of the phrase's audio, or None when it should stay a <Say> (rendering it in the background if missing)"""
+    if not BASE_URL:
+        return None
+    try:
+        backend = get_backend()
+    except KeyError:
+        print(f"❌ Unknown prompt audio backend {BACKEND!r}; prompts stay <Say>")
+        return None
+    if not backend.speaks(voice):
+        _record(unmapped=1)
+        return None
+    key = phrase_key(text, voice, language, rate, backend)
+    with _lock:
+        known = key in _phrases
+        _phrases[key] = (text, voice, language, rate)
+    if not known:
+        _record(phrases=1)
+    if os.path.exists(_file(f"{key}.wav")):
+        if not known:
+            _record(cached=1)
+    elif _inline:
+        if not _render_phrase(key, text, voice, language, rate):
+            return None
+    else:
+        _queue_render(key, text, voice, language, rate)
+        return None
+    return f"{BASE_URL}{PATH}{key}.wav"
+
+
+def lookup(name, if_none_match=None):
+    """(status, headers, body) for GET PROMPT_AUDIO_PATH + name; 304 when the ETag matches"""
+    if not _NAME.match(name) or not os.path.exists(_file(name)):
+        return 404, [('Content-Type', 'text/plain')], b'Not found'
+    etag = f'"{name[:-4]}"'
+    headers = [('ETag', etag), ('Cache-Control', CACHE_CONTROL)]
+    if if_none_match and (if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]):
+        _record(not_modified=1)
+        return 304, headers, b''
+    with open(_file(name), 'rb') as f:
+        body = f.read()
+    _record(served=1)
+    return 200, [('Content-Type', CONTENT_TYPE)] + headers, body
+
+
+def prune():
+    """Delete rendered files no phrase of this process points to; returns the names removed
+
+    Temporary and lock files are only removed once they are older than a render
+    may take, so a worker still rendering keeps its own.
+    """
+    with _lock:
+        live = {f"{key}.wav" for key in _phrases}
+    removed = []
+    if os.path.isdir(DIRECTORY):
+        stale = time.time() - TIMEOUT
+        for name in os.listdir(DIRECTORY):
+            if name.endswith(('.tmp', '.lock')):
+                try:
+                    if os.path.getmtime(_file(name)) >= stale:
+                        continue
+                except OSError:
+                    continue
+            elif not _NAME.match(name) or name in live:
+                continue
+            try:
+                os.remove(_file(name))
+            except FileNotFoundError:
+                continue
+            removed.append(name)
+    return removed
+
+
+def prompt_stats():
+    """Phrases seen, prompts left as <Say> for an unmapped voice, how many were already on disk / rendered / failed, and files served"""
+    with _lock:
+        return dict(_stats, enabled=bool(BASE_URL))
+
+
+if __name__ == '__main__':
+    command, modules = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 1 else ('render', [])
+    if not BASE_URL:
+        sys.exit("PROMPT_AUDIO_BASE_URL is not set")
+    import importlib
+    # twiml uses the imported module, not this __main__ copy
+    import prompt_audio
+    prompt_audio._inline = True
+    # Importing a server module builds its TwiML, which renders its prompts
+    for module in modules or ['server']:
+        importlib.import_module(module)
+    if command == 'prune':
+        print(json.dumps({"removed": prompt_audio.prune()}))
+    print(json.dumps(prompt_audio.prompt_stats()))
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Recording pipeline: Twilio recording → Whisper transcript
+The recording is streamed in chunks into a SpooledTemporaryFile owned by the
+call (in memory up to RECORDING_SPOOL_BYTES, then a unique temp file on disk),
+and uploaded to Whisper as a multipart body read from that file chunk by chunk,
+so no step holds the whole recording in memory twice and concurrent calls never
+share a path. Twilio answers 404 for a few seconds after RecordingUrl is sent;
+those are retried with exponential backoff.
+
+Before the upload, silence before and after the caller's speech is cut from
+WAV recordings (audio.trim_silence), which shrinks both the upload and the
+audio Whisper has to transcribe. Trimming reads the recording into memory
+and uploads a trimmed copy, so only recordings up to RECORDING_SPOOL_BYTES
+are trimmed; larger ones, recordings that are not WAV, and ones where nothing
+would be cut are uploaded as they are.
+
+Environment:
+    RECORDING_CHUNK_BYTES   download / upload chunk size (default 65536)
+    RECORDING_SPOOL_BYTES   bytes kept in memory before spilling to disk (default 1048576)
+    RECORDING_RETRIES       attempts while Twilio answers 404 (default 5)
+    RECORDING_RETRY_DELAY   first retry delay in seconds, doubled each time (default 0.5)
+    RECORDING_TRIM_SILENCE  "0" to upload recordings untrimmed (default 1)
+    WHISPER_MODEL           transcription model (default whisper-1)
+    OPENAI_BASE_URL         Whisper is called at {OPENAI_BASE_URL}/v1/audio/transcriptions
+    TWILIO_ACCOUNT_SID / TWILIO_AUTH_TOKEN  basic auth for recording downloads, if set
+"""
+
+import io
+import os
+import struct
+import tempfile
+import threading
+import time
+import uuid
+
+import audio
+import http_client
+import metrics
+
+CHUNK_BYTES = int(os.getenv('RECORDING_CHUNK_BYTES', 65536))
+SPOOL_BYTES = int(os.getenv('RECORDING_SPOOL_BYTES', 1 << 20))
+RETRIES = int(os.getenv('RECORDING_RETRIES', 5))
+RETRY_DELAY = float(os.getenv('RECORDING_RETRY_DELAY', 0.5))
+TRIM_SILENCE = os.getenv('RECORDING_TRIM_SILENCE', '1') == '1'
+WHISPER_MODEL = os.getenv('WHISPER_MODEL', 'whisper-1')
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com')
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
+TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID', '')
+TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN', '')
+
+_lock = threading.Lock()
+_stats = {"downloads": 0, "not_found_retries": 0, "failures": 0, "bytes": 0, "trimmed": 0, "trimmed_bytes": 0,
+          "transcriptions": 0, "download_seconds": 0.0, "transcribe_seconds": 0.0}
+
+
+class RecordingUnavailable(Exception):
+    """Twilio did not serve the recording (still 404 after retries, or another error status)"""
+
+
+def _record(**deltas):
+    with _lock:
+        for key, value in deltas.items():
+            _stats[key] += value
+
+
+def download(recording_url, call_sid=None, auth=None):
+    """Stream a recording into a per-call spooled temp file, rewound and ready to read
+
+    The caller owns the returned file and should close it (it is deleted on close).
+    """
+    if auth is None and TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN:
+        auth = (TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    started = time.perf_counter()
+    delay = RETRY_DELAY
+    for attempt in range(RETRIES):
+        with http_client.get(recording_url, auth=auth, stream=True) as response:
+            if response.status_code == 404 and attempt < RETRIES - 1:
+                print(f"⏳ Recording not available yet, retrying in {delay:.1f}s")
+                _record(not_found_retries=1)
+                time.sleep(delay)
+                delay *= 2
+                continue
+            if response.status_code != 200:
+                _record(failures=1)
+                raise RecordingUnavailable(f"recording download failed with status {response.status_code}")
+
+            spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES, prefix=f"recording-{call_sid or 'call'}-")
+            try:
+                for chunk in response.iter_content(chunk_size=CHUNK_BYTES):
+                    spool.write(chunk)
+            except Exception:
+                spool.close()
+                _record(failures=1)
+                raise
+            size = spool.tell()
+            spool.seek(0)
+            _record(downloads=1, bytes=size, download_seconds=time.perf_counter() - started)
+            metrics.observe('stage_seconds', time.perf_counter() - started, stage='download')
+            print(f"📥 Recording downloaded: {size} bytes in {time.perf_counter() - started:.2f}s")
+            return spool
+    raise RecordingUnavailable("recording not available")
+
+
+class MultipartFile:
+    """multipart/form-data body that streams one file part from an open file
+
+    Has a known length (so requests sends Content-Length instead of chunked
+    encoding) and is read chunk by chunk while the request is being written.
+    """
+
+    def __init__(self, fileobj, fields=None, filename='recording.wav', content_type='audio/wav',
+                 chunk_size=CHUNK_BYTES):
+        self.boundary = uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        head = b''.join(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8')
+            for name, value in (fields or {}).items()
+        )
+        head += (f'--{self.boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                 f'Content-Type: {content_type}\r\n\r\n').encode('utf-8')
+        tail = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+        start = fileobj.tell()
+        fileobj.seek(0, io.SEEK_END)
+        size = fileobj.tell() - start
+        fileobj.seek(start)
+        self._parts = [io.BytesIO(head), fileobj, io.BytesIO(tail)]
+        self.length = len(head) + size + len(tail)
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return b''.join(part.read() for part in self._parts)
+        while self._parts:
+            data = self._parts[0].read(size)
+            if data:
+                return data
+            self._parts.pop(0)
+        return b''
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def trim(audio_file):
+    """A WAV recording without its leading and trailing silence, rewound; audio_file itself if there is nothing to cut"""
+    start = audio_file.tell()
+    audio_file.seek(0, io.SEEK_END)
+    size = audio_file.tell() - start
+    audio_file.seek(start)
+    if size > SPOOL_BYTES:
+        return audio_file
+    data = audio_file.read()
+    try:
+        samples, rate = audio.read_wav(data)
+    except (ValueError, struct.error):
+        audio_file.seek(start)
+        return audio_file
+    speech = audio.trim_silence(samples, rate)
+    trimmed = audio.wav_bytes(speech, rate) if len(speech) < len(samples) else data
+    if len(trimmed) >= len(data):
+        audio_file.seek(start)
+        return audio_file
+    _record(trimmed=1, trimmed_bytes=len(data) - len(trimmed))
+    return io.BytesIO(trimmed)
+
+
+def transcribe(audio_file, filename='recording.wav', language='es', api_key=None, base_url=None):
+    """Send an open audio file to Whisper and return the transcript text"""
+    started = time.perf_counter()
+    if TRIM_SILENCE:
+        with metrics.span('trim'):
+            audio_file = trim(audio_file)
+    body = MultipartFile(audio_file, {'model': WHISPER_MODEL, 'language': language}, filename=filename)
+    response = http_client.post(
+        f"{base_url or OPENAI_BASE_URL}/v1/audio/transcriptions",
+        headers={'Authorization': f'Bearer {api_key or OPENAI_API_KEY}', 'Content-Type': body.content_type},
+        data=body,
+    )
+    response.raise_for_status()
+    text = response.json().get('text', '')
+    _record(transcriptions=1, transcribe_seconds=time.perf_counter() - started)
+    metrics.observe('stage_seconds', time.perf_counter() - started, stage='transcription')
+    return text
+
+
+def transcribe_recording(recording_url, call_sid=None, language='es'):
+    """Download a Twilio recording and return its transcript"""
+    with download(recording_url, call_sid) as audio:
+        return transcribe(audio, filename=f"{call_sid or 'recording'}.wav", language=language)
+
+
+def recording_stats():
+    """Download / trimming / transcription counters and average latencies"""
+    with _lock:
+        stats = dict(_stats)
+    download_seconds, transcribe_seconds = stats.pop("download_seconds"), stats.pop("transcribe_seconds")
+    stats["download_ms_avg"] = round(download_seconds * 1000 / stats["downloads"], 1) if stats["downloads"] else 0.0
+    stats["transcribe_ms_avg"] = round(transcribe_seconds * 1000 / stats["transcriptions"], 1) if stats["transcriptions"] else 0.0
+    return stats
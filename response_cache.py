@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Response cache in front of the LLM providers
+Menu turns ("El visitante pidió información…", "Usuario quiere hablar
+directamente", the fixed recording instruction) send the same prompt on every
+call. Answers are cached by (provider, model, system prompt, messages,
+temperature) with TTL and LRU eviction. With RESPONSE_CACHE_VARIANTS > 1 a key
+collects that many different answers before serving them at random, so callers
+do not always hear the exact same sentence.
+
+Only fixed menu / instruction prompts are cached: call sites mark them
+explicitly and pass None as the key for everything else (lookup and store
+skip it). make_key also returns None for a request carrying the call's earlier
+turns, which is never the same twice.
+
+Environment:
+    RESPONSE_CACHE_ENABLED   "0" to disable (default "1")
+    RESPONSE_CACHE_SIZE      keys kept (default 512)
+    RESPONSE_CACHE_TTL       seconds an answer stays valid (default 3600)
+    RESPONSE_CACHE_VARIANTS  answers collected per key (default 1)
+"""
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', '1') == '1'
+CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 512))
+CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', 3600))
+CACHE_VARIANTS = int(os.getenv('RESPONSE_CACHE_VARIANTS', 1))
+
+
+def cacheable(messages):
+    """False for requests that carry conversation history"""
+    roles = [message.get('role') for message in messages]
+    return 'assistant' not in roles and roles.count('user') <= 1
+
+
+def make_key(provider, model, system, messages, temperature=None):
+    """Stable digest of everything that determines the provider's answer, or None if it should not be cached"""
+    if not cacheable(messages):
+        return None
+    raw = json.dumps([provider, model, system, messages, temperature], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """LRU + TTL map from prompt key to a small pool of answers"""
+
+    def __init__(self, max_entries=CACHE_SIZE, ttl=CACHE_TTL, variants=CACHE_VARIANTS, enabled=CACHE_ENABLED):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.variants = max(1, variants)
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "uncacheable": 0}
+
+    def lookup(self, key):
+        """Cached answer for key, or None when the pool is missing, expired or still filling"""
+        if not self.enabled:
+            return None
+        if key is None:
+            with self._lock:
+                self._stats["uncacheable"] += 1
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.time():
+                del self._entries[key]
+                entry = None
+            if entry is None or len(entry[1]) < self.variants:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return random.choice(entry[1])
+
+    def store(self, key, response):
+        if not self.enabled or key is None or not response:
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                entry = (time.time() + self.ttl, [])
+                self._entries[key] = entry
+            if response not in entry[1] and len(entry[1]) < self.variants:
+                entry[1].append(response)
+            self._entries.move_to_end(key)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def get_or_compute(self, key, compute):
+        """Return a cached answer or call compute() and cache its result"""
+        cached = self.lookup(key)
+        if cached is not None:
+            return cached
+        response = compute()
+        self.store(key, response)
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries))
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
+
+
+cache = ResponseCache()
+
+
+def cache_stats():
+    return cache.stats()
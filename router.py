@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+LLM provider routing: latency budgets, hedged requests and circuit breakers
+Each provider call gets a read timeout of its budget, so a hung request fails
+instead of keeping the caller on silence. The preferred provider is called
+first; if it has not answered by its recent p95 latency, the same turn is sent
+to the next provider as well and whichever answers first wins. A provider that
+fails ROUTER_BREAKER_FAILURES times in a row is skipped for
+ROUTER_BREAKER_RESET seconds, then a single probe decides whether it is back.
+Whatever happens, the local responder answers once ROUTER_DEADLINE has passed,
+well inside Twilio's 15 s webhook timeout.
+
+Environment:
+    ROUTER_DEADLINE          seconds before the local responder answers (default 8)
+    OPENAI_BUDGET            read timeout of one OpenAI call in seconds (default 6)
+    CLAUDE_BUDGET            read timeout of one Claude call in seconds (default 6)
+    ROUTER_HEDGE_PERCENTILE  latency percentile after which the next provider is asked too (default 95)
+    ROUTER_HEDGE_DELAY       hedge delay until enough latencies are known (default 2.5)
+    ROUTER_HEDGE_MIN_DELAY   never hedge earlier than this (default 0.5)
+    ROUTER_LATENCY_WINDOW    recent successful calls kept per provider (default 200)
+    ROUTER_BREAKER_FAILURES  consecutive failures that open a breaker (default 5)
+    ROUTER_BREAKER_RESET     seconds an open breaker skips its provider (default 30)
+    ROUTER_WORKERS           threads running provider calls (default 32)
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import http_client
+import metrics
+
+DEADLINE = float(os.getenv('ROUTER_DEADLINE', 8))
+BUDGETS = {
+    'openai': float(os.getenv('OPENAI_BUDGET', 6)),
+    'claude': float(os.getenv('CLAUDE_BUDGET', 6)),
+}
+HEDGE_PERCENTILE = float(os.getenv('ROUTER_HEDGE_PERCENTILE', 95))
+HEDGE_DELAY = float(os.getenv('ROUTER_HEDGE_DELAY', 2.5))
+HEDGE_MIN_DELAY = float(os.getenv('ROUTER_HEDGE_MIN_DELAY', 0.5))
+LATENCY_WINDOW = int(os.getenv('ROUTER_LATENCY_WINDOW', 200))
+BREAKER_FAILURES = int(os.getenv('ROUTER_BREAKER_FAILURES', 5))
+BREAKER_RESET = float(os.getenv('ROUTER_BREAKER_RESET', 30))
+WORKERS = int(os.getenv('ROUTER_WORKERS', 32))
+
+# Latencies needed before the percentile replaces ROUTER_HEDGE_DELAY
+MIN_SAMPLES = 20
+
+
+class CircuitBreaker:
+    """closed → open after `failures` consecutive failures → half-open probe after reset_after seconds"""
+
+    def __init__(self, failures=BREAKER_FAILURES, reset_after=BREAKER_RESET):
+        self.failure_threshold = failures
+        self.reset_after = reset_after
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go out now; in half-open only one probe is let through"""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_after:
+                self.state = 'half_open'
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or (self.state == 'closed' and self.failures >= self.failure_threshold):
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self.opened += 1
+
+
+class Provider:
+    """One LLM backend: call(message, call_sid, timeout) and/or an async acall with the same arguments"""
+
+    def __init__(self, name, call=None, acall=None, budget=None):
+        self.name = name
+        self.call = call
+        self.acall = acall
+        self.budget = budget if budget is not None else BUDGETS.get(name, DEADLINE)
+        self.breaker = CircuitBreaker()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "successes": 0, "failures": 0, "timeouts": 0, "skipped": 0}
+
+    @property
+    def timeout(self):
+        return (http_client.CONNECT_TIMEOUT, self.budget)
+
+    def hedge_delay(self):
+        """Seconds to wait for this provider before asking the next one"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < MIN_SAMPLES:
+            return min(HEDGE_DELAY, self.budget)
+        percentile = latencies[min(len(latencies) - 1, int(len(latencies) * HEDGE_PERCENTILE / 100))]
+        return min(max(percentile, HEDGE_MIN_DELAY), self.budget)
+
+    def record(self, seconds, error=None):
+        metrics.observe('provider_seconds', seconds, provider=self.name, outcome='ok' if error is None else 'error')
+        with self._lock:
+            self.stats["calls"] += 1
+            if error is None:
+                self.stats["successes"] += 1
+                self._latencies.append(seconds)
+            else:
+                self.stats["failures"] += 1
+                if 'timeout' in type(error).__name__.lower() or 'timed out' in str(error).lower():
+                    self.stats["timeouts"] += 1
+        if error is None:
+            self.breaker.success()
+        else:
+            self.breaker.failure()
+            print(f"⚠️ {self.name} failed after {seconds:.2f}s: {error}")
+
+    def skipped(self):
+        with self._lock:
+            self.stats["skipped"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            latencies = sorted(self._latencies)
+        stats["breaker"] = self.breaker.state
+        stats["breaker_opened"] = self.breaker.opened
+        stats["hedge_delay_ms"] = round(self.hedge_delay() * 1000, 1)
+        stats["p50_ms"] = round(latencies[len(latencies) // 2] * 1000, 1) if latencies else 0.0
+        return stats
+
+
+class Router:
+    """Answer a turn from the first healthy provider to respond, else the local fallback"""
+
+    def __init__(self, providers, fallback, primary=None, deadline=DEADLINE, workers=WORKERS):
+        self.providers = list(providers)
+        if primary:
+            self.providers.sort(key=lambda provider: provider.name != primary)
+        self.fallback = fallback
+        self.deadline = deadline
+        self._executor = None
+        self._executor_pid = None
+        self._workers = workers
+        self._lock = threading.Lock()
+        self._stats = {"turns": 0, "hedges": 0, "hedge_wins": 0, "fallbacks": 0, "deadline_fallbacks": 0}
+
+    def _count(self, **deltas):
+        with self._lock:
+            for key, value in deltas.items():
+                self._stats[key] += value
+
+    def _pool(self):
+        # Threads do not survive a fork; each worker process gets its own pool
+        if self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(self._workers, thread_name_prefix='router')
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _next_provider(self, candidates):
+        while candidates:
+            provider = candidates.pop(0)
+            if provider.breaker.allow():
+                return provider
+            provider.skipped()
+        return None
+
+    @staticmethod
+    def _attempt(provider, message, call_sid):
+        started = time.perf_counter()
+        try:
+            text = provider.call(message, call_sid, provider.timeout)
+        except Exception as e:
+            provider.record(time.perf_counter() - started, e)
+            raise
+        provider.record(time.perf_counter() - started)
+        return text
+
+    def _answer_locally(self, message, deadline_hit):
+        self._count(fallbacks=1, deadline_fallbacks=int(deadline_hit))
+        print(f"🛟 Local responder answered ({'deadline' if deadline_hit else 'no provider available'})")
+        return self.fallback(message), 'fallback'
+
+    def complete(self, message, call_sid=None):
+        """(text, provider name or "fallback") for one turn, within the deadline"""
+        self._count(turns=1)
+        deadline = time.monotonic() + self.deadline
+        candidates = [provider for provider in self.providers if provider.call]
+        pending = {}
+        hedged = set()
+
+        def launch(hedge):
+            provider = self._next_provider(candidates)
+            if provider is not None:
+                pending[self._pool().submit(self._attempt, provider, message, call_sid)] = provider
+                if hedge:
+                    hedged.add(provider.name)
+                    self._count(hedges=1)
+            return provider
+
+        current = launch(hedge=False)
+        hedge_at = time.monotonic() + current.hedge_delay() if current else deadline
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                return self._answer_locally(message, deadline_hit=True)
+            done, _ = wait(pending, timeout=max(0, min(hedge_at if candidates else deadline, deadline) - now),
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                provider = pending.pop(future)
+                if future.exception() is None:
+                    self._count(hedge_wins=int(provider.name in hedged))
+                    return future.result(), provider.name
+            if done and not pending:
+                # Every in-flight call failed: move on to the next provider right away
+                current = launch(hedge=False)
+                hedge_at = time.monotonic() + current.hedge_delay() if current else deadline
+            elif not done and candidates and time.monotonic() >= hedge_at:
+                current = launch(hedge=True) or current
+                hedge_at = time.monotonic() + current.hedge_delay()
+        return self._answer_locally(message, deadline_hit=False)
+
+    async def acomplete(self, message, call_sid=None):
+        """Async complete() over the providers' acall; losing requests are cancelled"""
+        self._count(turns=1)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        candidates = [provider for provider in self.providers if provider.acall]
+        pending = {}
+        hedged = set()
+
+        async def attempt(provider):
+            started = time.perf_counter()
+            try:
+                text = await provider.acall(message, call_sid, provider.budget)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                provider.record(time.perf_counter() - started, e)
+                raise
+            provider.record(time.perf_counter() - started)
+            return text
+
+        def launch(hedge):
+            provider = self._next_provider(candidates)
+            if provider is not None:
+                pending[asyncio.ensure_future(attempt(provider))] = provider
+                if hedge:
+                    hedged.add(provider.name)
+                    self._count(hedges=1)
+            return provider
+
+        try:
+            current = launch(hedge=False)
+            hedge_at = loop.time() + current.hedge_delay() if current else deadline
+            while pending:
+                now = loop.time()
+                if now >= deadline:
+                    return self._answer_locally(message, deadline_hit=True)
+                timeout = max(0, min(hedge_at if candidates else deadline, deadline) - now)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    provider = pending.pop(task)
+                    if task.exception() is None:
+                        self._count(hedge_wins=int(provider.name in hedged))
+                        return task.result(), provider.name
+                if done and not pending:
+                    current = launch(hedge=False)
+                    hedge_at = loop.time() + current.hedge_delay() if current else deadline
+                elif not done and candidates and loop.time() >= hedge_at:
+                    current = launch(hedge=True) or current
+                    hedge_at = loop.time() + current.hedge_delay()
+            return self._answer_locally(message, deadline_hit=False)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["providers"] = {provider.name: provider.snapshot() for provider in self.providers}
+        return stats
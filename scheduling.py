@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Appointment availability and conflict-free booking
+Each day is a bitmap with one bit per SLOT_MINUTES block: `open` comes from the
+business hours for that weekday and `busy` from appointment_slots. The blocks
+where a service of k blocks can start are open & ~busy ANDed with itself
+shifted 1..k-1 times, so "next N free slots" is a handful of integer operations
+per day. Days are loaded on first use and updated in place when this process
+books; PRAGMA data_version tells us when another process committed, and then
+the cached days are dropped.
+
+Booking inserts the appointment and one appointment_slots row per block in a
+single transaction. The (date, minute) primary key rejects an overlapping
+booking even when two workers race for the same slot.
+
+Environment:
+    BUSINESS_HOURS       open ranges per day (default 09:00-13:00,14:00-18:00)
+    BUSINESS_DAYS        weekdays open, Monday=0 (default 0,1,2,3,4)
+    SLOT_MINUTES         booking granularity (default 60)
+    SERVICE_DURATIONS    minutes per service, e.g. "Consulta=60,Seguimiento=30" (default Consulta=60)
+    DEFAULT_SERVICE_MINUTES  duration of services not listed (default 60)
+    SCHEDULE_HORIZON_DAYS    how far ahead next_free_slots looks (default 90)
+"""
+
+import datetime
+import os
+import sqlite3
+import threading
+
+import db
+
+BUSINESS_HOURS = os.getenv('BUSINESS_HOURS', '09:00-13:00,14:00-18:00')
+BUSINESS_DAYS = os.getenv('BUSINESS_DAYS', '0,1,2,3,4')
+SLOT_MINUTES = int(os.getenv('SLOT_MINUTES', 60))
+SERVICE_DURATIONS = os.getenv('SERVICE_DURATIONS', 'Consulta=60')
+DEFAULT_SERVICE_MINUTES = int(os.getenv('DEFAULT_SERVICE_MINUTES', 60))
+HORIZON_DAYS = int(os.getenv('SCHEDULE_HORIZON_DAYS', 90))
+
+
+def _minutes(hhmm):
+    hours, _, minutes = hhmm.strip().partition(':')
+    return int(hours) * 60 + int(minutes or 0)
+
+
+def _hhmm(minute):
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+class Scheduler:
+    """Per-day slot bitmaps over the appointments database"""
+
+    def __init__(self, hours=BUSINESS_HOURS, days=BUSINESS_DAYS, slot_minutes=SLOT_MINUTES,
+                 durations=SERVICE_DURATIONS, default_minutes=DEFAULT_SERVICE_MINUTES, path=None):
+        self.slot_minutes = slot_minutes
+        self.path = path
+        self.default_minutes = default_minutes
+        self.durations = {}
+        for item in durations.split(','):
+            name, _, minutes = item.partition('=')
+            if name.strip() and minutes.strip().isdigit():
+                self.durations[name.strip().lower()] = int(minutes)
+        open_mask = 0
+        for span in hours.split(','):
+            start, _, end = span.partition('-')
+            for minute in range(_minutes(start), _minutes(end), slot_minutes):
+                open_mask |= 1 << (minute // slot_minutes)
+        open_days = {int(day) for day in days.split(',') if day.strip()}
+        self.open_by_weekday = [open_mask if weekday in open_days else 0 for weekday in range(7)]
+        self._busy = {}
+        self._lock = threading.Lock()
+        self._seen = threading.local()
+
+    def blocks(self, service=None):
+        """How many consecutive blocks a service takes"""
+        minutes = self.durations.get((service or '').strip().lower(), self.default_minutes)
+        return max(1, -(-minutes // self.slot_minutes))
+
+    def _check_external_writes(self, conn):
+        version = conn.execute('PRAGMA data_version').fetchone()[0]
+        if getattr(self._seen, 'version', version) != version:
+            with self._lock:
+                self._busy.clear()
+        self._seen.version = version
+
+    def _busy_mask(self, day, conn):
+        mask = self._busy.get(day)
+        if mask is None:
+            mask = 0
+            for (minute,) in conn.execute('SELECT minute FROM appointment_slots WHERE appointment_date = ?', (day,)):
+                mask |= 1 << (minute // self.slot_minutes)
+            with self._lock:
+                self._busy[day] = mask
+        return mask
+
+    def _starts(self, day, blocks, conn):
+        """Bitmap of the blocks where `blocks` consecutive free blocks begin"""
+        weekday = datetime.date.fromisoformat(day).weekday()
+        free = self.open_by_weekday[weekday] & ~self._busy_mask(day, conn)
+        starts = free
+        for shift in range(1, blocks):
+            starts &= free >> shift
+        return starts
+
+    def _times(self, starts):
+        times = []
+        while starts:
+            low = starts & -starts
+            times.append(_hhmm((low.bit_length() - 1) * self.slot_minutes))
+            starts ^= low
+        return times
+
+    def free_times(self, day, service=None):
+        """Start times ("HH:MM") still bookable on day for service"""
+        conn = db.connection(self.path)
+        self._check_external_writes(conn)
+        return self._times(self._starts(day, self.blocks(service), conn))
+
+    def next_free_slots(self, service=None, count=3, after=None, horizon_days=HORIZON_DAYS):
+        """The next count (date, time) pairs where service fits, starting after a datetime (default now)"""
+        after = after or datetime.datetime.now()
+        conn = db.connection(self.path)
+        self._check_external_writes(conn)
+        blocks = self.blocks(service)
+        found = []
+        for offset in range(horizon_days):
+            date = after.date() + datetime.timedelta(days=offset)
+            starts = self._starts(date.isoformat(), blocks, conn)
+            if offset == 0:
+                # Drop blocks that already started today
+                first = -(-(after.hour * 60 + after.minute) // self.slot_minutes)
+                starts &= ~((1 << first) - 1)
+            for time in self._times(starts):
+                found.append((date.isoformat(), time))
+                if len(found) == count:
+                    return found
+        return found
+
+    def book(self, client_name, client_phone, service_type, day, time, notes=""):
+        """Reserve the slot and return the appointment id, or None if it is taken or closed"""
+        blocks = self.blocks(service_type)
+        start = _minutes(time)
+        if start % self.slot_minutes:
+            return None
+        first = start // self.slot_minutes
+        conn = db.connection(self.path)
+        self._check_external_writes(conn)
+        if not (self._starts(day, blocks, conn) >> first) & 1:
+            return None
+        try:
+            with db.transaction(self.path) as conn:
+                appointment_id = conn.execute(
+                    'INSERT INTO appointments (client_name, client_phone, service_type, appointment_date, '
+                    'appointment_time, notes, duration_minutes) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (client_name, client_phone, service_type, day, time, notes, blocks * self.slot_minutes)).lastrowid
+                conn.executemany(
+                    'INSERT INTO appointment_slots (appointment_date, minute, appointment_id) VALUES (?, ?, ?)',
+                    [(day, (first + block) * self.slot_minutes, appointment_id) for block in range(blocks)])
+        except sqlite3.IntegrityError:
+            # Another worker booked an overlapping slot since our bitmap was loaded
+            with self._lock:
+                self._busy.pop(day, None)
+            return None
+        with self._lock:
+            if day in self._busy:
+                self._busy[day] |= ((1 << blocks) - 1) << first
+        return appointment_id
+
+    def cancel(self, appointment_id):
+        """Mark an appointment cancelled and free its blocks; False if it was not scheduled"""
+        with db.transaction(self.path) as conn:
+            row = conn.execute("SELECT appointment_date FROM appointments WHERE id = ? AND status = 'scheduled'",
+                               (appointment_id,)).fetchone()
+            if row is None:
+                return False
+            conn.execute("UPDATE appointments SET status = 'cancelled' WHERE id = ?", (appointment_id,))
+            conn.execute('DELETE FROM appointment_slots WHERE appointment_id = ?', (appointment_id,))
+        with self._lock:
+            self._busy.pop(row[0], None)
+        return True
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = Scheduler()
+    return _scheduler
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Semantic answer cache for frequent caller questions
+Callers keep asking the same things (horario, servicios, contacto, información).
+Approved question → answer pairs are indexed as hashed character n-gram vectors
+(NumPy); when a new utterance is similar enough to an approved question the
+stored answer is served without calling the provider. Function words are left
+out and n-grams are weighted by their IDF over the approved questions, so
+"¿cuál es el precio de ...?" does not match "¿cuál es el horario de ...?" on
+the words they share. A wrong answer is worse than a provider call: the
+default threshold keeps every negative query in benchmarks/faq_corpus.tsv
+unanswered (python -m benchmarks.bench_semantic_cache checks it), and
+paraphrases it misses can be approved as extra questions with the same answer.
+
+Entries are seeded as pending and only answer callers once approved, via the
+/admin/faq endpoints in server.py (disabled unless ADMIN_TOKEN is set) or from
+the command line:
+
+    python semantic_cache.py seed "¿Cuál es el horario?" "Atendemos de lunes a viernes de 9 a 18."
+    python semantic_cache.py approve 1
+    python semantic_cache.py query "a que hora abren"
+
+Every worker keeps its own index but they share the JSON file: changes are
+made under an exclusive lock on SEMANTIC_CACHE_PATH.lock against the file as it
+is on disk, and a worker reloads it whenever its modification time changes, so
+an approval made through one worker is served (and kept) by all of them.
+
+Environment:
+    SEMANTIC_CACHE_ENABLED    "0" to disable (default "1")
+    SEMANTIC_CACHE_PATH       JSON file with the entries (default faq_cache.json)
+    SEMANTIC_CACHE_THRESHOLD  cosine similarity needed to answer (default 0.75)
+"""
+
+import contextlib
+import fcntl
+import json
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', '1') == '1'
+CACHE_PATH = os.getenv('SEMANTIC_CACHE_PATH', 'faq_cache.json')
+THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.75))
+
+DIMENSIONS = 1 << 12
+NGRAM_SIZES = (2, 3, 4)
+_PRIME = 1000003
+# Per-position multipliers for a polynomial hash over each n-gram window
+_POWERS = {n: np.array([pow(_PRIME, n - 1 - i, 1 << 64) for i in range(n)], dtype=np.uint64)
+           for n in NGRAM_SIZES}
+# Function words and request fillers; left out of the vectors (a question made only of them keeps them)
+STOPWORDS = frozenset("""
+    a al algo como con cual cuales de del donde el ella ellos en es esa ese eso esta estan este esto ha hay la
+    las le les lo los me mi mis muy necesito nos o para pero podria por puede pueden que quiero quisiera queria
+    saber se si sobre son su sus tambien te tengo tiene tienen tu tus un una uno unos unas usted ustedes y ya yo
+    hola buenas buenos dias tardes noches gracias favor disculpe oiga exactamente ahora bien
+""".split())
+_NON_WORD = re.compile(r'[^a-z0-9ñ ]+')
+_SPACES = re.compile(r'\s+')
+
+
+def normalize(text):
+    """Lowercase, fold accents (keeping ñ) and drop punctuation"""
+    text = text.lower().replace('ñ', '\0')
+    text = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    text = _NON_WORD.sub(' ', text.replace('\0', 'ñ'))
+    return _SPACES.sub(' ', text).strip()
+
+
+def content(text):
+    """Normalized text without function words, so "cual es el ..." does not make questions alike"""
+    words = normalize(text).split()
+    kept = [word for word in words if word not in STOPWORDS]
+    return ' '.join(kept or words)
+
+
+def ngram_counts(text):
+    """Hashed character n-gram counts of text's content words (DIMENSIONS long)"""
+    padded = f" {content(text)} "
+    codes = np.frombuffer(padded.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    buckets = []
+    for n in NGRAM_SIZES:
+        if len(codes) < n:
+            continue
+        windows = np.lib.stride_tricks.sliding_window_view(codes, n)
+        hashes = (windows * _POWERS[n]).sum(axis=1, dtype=np.uint64) + np.uint64(n)
+        buckets.append(hashes % np.uint64(DIMENSIONS))
+    if not buckets:
+        return np.zeros(DIMENSIONS, dtype=np.int64)
+    return np.bincount(np.concatenate(buckets).astype(np.int64), minlength=DIMENSIONS)
+
+
+def weigh(counts, idf=None):
+    """L2-normalized float32 vector of log-scaled counts, times idf when given"""
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    nonzero = counts > 0
+    vector[nonzero] = 1.0 + np.log(counts[nonzero])
+    if idf is not None:
+        vector *= idf
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector
+
+
+def vectorize(text, idf=None):
+    """L2-normalized hashed character n-gram vector (float32, DIMENSIONS long)"""
+    return weigh(ngram_counts(text), idf)
+
+
+def inverse_document_frequency(counts):
+    """Smoothed IDF per bucket over the rows of counts; n-grams every question shares weigh least"""
+    documents = len(counts)
+    frequency = (np.asarray(counts) > 0).sum(axis=0)
+    return (np.log((1 + documents) / (1 + frequency)) + 1).astype(np.float32)
+
+
+class SemanticCache:
+    """Approved Q→A pairs with a dense similarity index over their questions"""
+
+    def __init__(self, path=CACHE_PATH, threshold=THRESHOLD, enabled=CACHE_ENABLED):
+        self.path = path
+        self.threshold = threshold
+        self.enabled = enabled
+        self._lock = threading.RLock()
+        self._entries = []
+        self._matrix = np.zeros((0, DIMENSIONS), dtype=np.float32)
+        self._idf = None
+        self._approved_ids = []
+        self._version = None
+        self._stats = {"lookups": 0, "served_locally": 0}
+        with self._lock:
+            self._refresh()
+
+    def _file_version(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _refresh(self):
+        """Reload the entries if another process rewrote the file (call with _lock held)"""
+        if not self.path:
+            return
+        version = self._file_version()
+        if version is None or version == self._version:
+            return
+        with open(self.path, encoding='utf-8') as f:
+            entries = json.load(f)
+        # Hit counts are only written back on the next change; keep the ones counted here
+        hits = {entry["id"]: entry.get("hits", 0) for entry in self._entries}
+        for entry in entries:
+            entry["hits"] = max(entry.get("hits", 0), hits.get(entry["id"], 0))
+        self._entries = entries
+        self._version = version
+        self._rebuild()
+
+    @contextlib.contextmanager
+    def _changing(self):
+        """Hold _lock and the file lock, with the entries fresh from disk, and save on exit"""
+        with self._lock:
+            if not self.path:
+                yield
+                return
+            with open(f"{self.path}.lock", 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._refresh()
+                yield
+                self._save()
+
+    def _save(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+        self._version = self._file_version()
+
+    def _rebuild(self):
+        approved = [entry for entry in self._entries if entry.get("approved")]
+        self._approved_ids = [entry["id"] for entry in approved]
+        if approved:
+            counts = np.vstack([ngram_counts(entry["question"]) for entry in approved])
+            self._idf = inverse_document_frequency(counts)
+            self._matrix = np.vstack([weigh(row, self._idf) for row in counts])
+        else:
+            self._idf = None
+            self._matrix = np.zeros((0, DIMENSIONS), dtype=np.float32)
+
+    def seed(self, question, answer, approved=False):
+        """Add a candidate pair (pending unless approved=True) and return it"""
+        with self._changing():
+            entry = {
+                "id": max((e["id"] for e in self._entries), default=0) + 1,
+                "question": question,
+                "answer": answer,
+                "approved": bool(approved),
+                "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "hits": 0
+            }
+            self._entries.append(entry)
+            if approved:
+                self._rebuild()
+            return dict(entry)
+
+    def set_approved(self, entry_id, approved=True):
+        """Approve (or withdraw) an entry; returns it, or None if unknown"""
+        with self._changing():
+            for entry in self._entries:
+                if entry["id"] == entry_id:
+                    entry["approved"] = bool(approved)
+                    self._rebuild()
+                    return dict(entry)
+        return None
+
+    def delete(self, entry_id):
+        with self._changing():
+            before = len(self._entries)
+            self._entries = [entry for entry in self._entries if entry["id"] != entry_id]
+            if len(self._entries) != before:
+                self._rebuild()
+                return True
+        return False
+
+    def entries(self):
+        with self._lock:
+            self._refresh()
+            return [dict(entry) for entry in self._entries]
+
+    def search(self, text):
+        """(entry, similarity) of the closest approved question, or (None, 0.0)"""
+        with self._lock:
+            self._refresh()
+            matrix, ids, idf = self._matrix, self._approved_ids, self._idf
+        if not len(ids):
+            return None, 0.0
+        scores = matrix @ vectorize(text, idf)
+        best = int(np.argmax(scores))
+        with self._lock:
+            entry = next((e for e in self._entries if e["id"] == ids[best]), None)
+        return entry, float(scores[best])
+
+    def lookup(self, text):
+        """Approved answer for text if similar enough, else None (counted in stats)"""
+        if not self.enabled or not text:
+            return None
+        entry, score = self.search(text)
+        with self._lock:
+            self._stats["lookups"] += 1
+            if entry is None or score < self.threshold:
+                return None
+            self._stats["served_locally"] += 1
+            entry["hits"] = entry.get("hits", 0) + 1
+        print(f"💡 Semantic cache hit ({score:.2f}): {entry['question']}")
+        return entry["answer"]
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            stats = dict(self._stats, entries=len(self._entries), approved=len(self._approved_ids))
+        stats["served_locally_rate"] = round(stats["served_locally"] / stats["lookups"], 3) if stats["lookups"] else 0.0
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Process-wide semantic cache loaded from SEMANTIC_CACHE_PATH"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticCache()
+    return _cache
+
+
+def lookup(text):
+    return get_cache().lookup(text)
+
+
+def cache_stats():
+    return get_cache().stats()
+
+
+if __name__ == '__main__':
+    command, args = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 1 else ('list', [])
+    cache = get_cache()
+    if command == 'seed' and len(args) == 2:
+        print(json.dumps(cache.seed(args[0], args[1]), ensure_ascii=False))
+    elif command == 'approve' and args:
+        print(json.dumps(cache.set_approved(int(args[0])), ensure_ascii=False))
+    elif command == 'query' and args:
+        entry, score = cache.search(args[0])
+        print(f"{score:.3f}", json.dumps(entry, ensure_ascii=False))
+    else:
+        print(json.dumps(cache.entries(), ensure_ascii=False, indent=2))
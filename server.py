@@ -5,11 +5,31 @@ Handles Twilio webhooks for the AI Receptionist app
 """
 
 from flask import Flask, request, Response
+import hmac
+import hashlib
 import json
 import os
-import requests
-from datetime import datetime, timedelta
-import sqlite3
+import time
+import call_log
+import call_store
+import conversation_context
+import db
+import extraction
+import http_client
+import intents
+import io
+import jobs
+import llm_stream
+import metrics
+import notifications
+import prompt_audio
+import recordings
+import response_cache
+import router
+import scheduling
+import semantic_cache
+import twiml
+from datetime import datetime
 
 app = Flask(__name__)
 
@@ -17,42 +37,111 @@ app = Flask(__name__)
 CLAUDE_API_KEY = os.getenv('CLAUDE_API_KEY', 'YOUR_CLAUDE_API_KEY')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', 'YOUR_OPENAI_API_KEY')
 AI_PROVIDER = os.getenv('AI_PROVIDER', 'openai')
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com')
+CLAUDE_BASE_URL = os.getenv('CLAUDE_BASE_URL', 'https://api.anthropic.com')
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+OWNER_PHONE_NUMBER = os.getenv('OWNER_PHONE_NUMBER', '')
+CALL_SUMMARY_DELAY = float(os.getenv('CALL_SUMMARY_DELAY', 30))
+# Seconds /webhook/continue waits for the answer to a recording (Twilio gives up on a webhook after 15)
+RECORDING_REPLY_WAIT = float(os.getenv('RECORDING_REPLY_WAIT', 8))
+
+SYSTEM_PROMPT = """
+    Eres Jenni, una recepcionista real. Habla de manera natural y conversacional.
+
+    INSTRUCCIONES:
+    - Usa expresiones como "¡Hola!", "Perfecto", "Claro que sí", "¡Genial!"
+    - Sé empática y útil
+    - Habla como una persona real, no como un robot
+    - Mantén un tono cálido y profesional
+    - NO repitas preguntas que ya hiciste
+    - Responde específicamente a lo que dice el cliente
+    """
+
+# TwiML fragments and static documents, encoded once at import
+RECORD_REPLY = twiml.record(maxLength=30, timeout=10, action='/webhook/recording', method='POST', playBeep='false')
+RECORD_RETRY = twiml.record(maxLength=30, timeout=10, action='/webhook/recording', method='POST')
+SAY_GOODBYE = twiml.ALICE.prompt("Gracias por llamar. ¡Que tengas un buen día!")
+MENU = twiml.gather(
+    twiml.ALICE.prompt("Presiona 1 para información, 2 para hablar con alguien, o 3 para dejar un mensaje."),
+    numDigits=1, timeout=10, action='/webhook/gather', method='POST')
+MENU_MORE = twiml.gather(
+    twiml.ALICE.prompt("Presiona 1 para más información, 2 para hablar con alguien, o 3 para dejar un mensaje."),
+    numDigits=1, timeout=10, action='/webhook/gather', method='POST')
+ASK_MORE = twiml.pause(1) + twiml.ALICE.prompt("¿Hay algo más en lo que pueda ayudarte?")
+
+GREETING_TWIML = twiml.document(
+    twiml.ALICE.prompt("¡Hola! Soy Jenni, tu recepcionista virtual. ¿En qué puedo ayudarte hoy?"), RECORD_REPLY)
+FALLBACK_GREETING_TWIML = twiml.document(
+    twiml.ALICE.prompt("Hola, soy tu recepcionista virtual. ¿En qué puedo ayudarte?"), RECORD_REPLY)
+MENU_TWIML = twiml.document(
+    twiml.ALICE.prompt("Hola, soy tu recepcionista virtual. ¿En qué puedo ayudarte?"),
+    twiml.pause(1), twiml.ALICE.prompt("¿En qué puedo ayudarte hoy?"), MENU, SAY_GOODBYE, twiml.HANGUP)
+TRANSFER_TWIML = twiml.document(
+    twiml.ALICE.prompt("Perfecto, te voy a conectar con alguien que pueda ayudarte mejor."),
+    twiml.pause(2), twiml.ALICE.prompt("Por favor, espera mientras te transfiero."), twiml.HANGUP)
+LEAVE_MESSAGE_TWIML = twiml.document(
+    twiml.ALICE.prompt("Perfecto, puedes dejar tu mensaje después del tono."),
+    twiml.record(maxLength=60, timeout=10, action='/webhook/recording', method='POST'),
+    twiml.ALICE.prompt("Gracias por tu mensaje. Lo procesaré y me pondré en contacto contigo pronto."), twiml.HANGUP)
+INVALID_OPTION_TWIML = twiml.document(
+    twiml.ALICE.prompt("Lo siento, no entendí tu opción."),
+    twiml.pause(1), twiml.ALICE.prompt("¿En qué puedo ayudarte hoy?"), MENU, SAY_GOODBYE, twiml.HANGUP)
+GATHER_ERROR_TWIML = twiml.document(
+    twiml.ALICE.prompt("Lo siento, hubo un problema. ¿En qué puedo ayudarte?"), MENU, SAY_GOODBYE, twiml.HANGUP)
+SPEECH_ACK_TWIML = twiml.document(
+    twiml.ALICE.prompt("Perfecto, entiendo. ¿Hay algo más en lo que pueda ayudarte?"), RECORD_REPLY)
+SPEECH_GOODBYE_TWIML = twiml.document(
+    twiml.ALICE.prompt("Perfecto, he tomado nota de todo. ¡Que tengas un buen día!"), twiml.HANGUP)
+MESSAGE_TAKEN_TWIML = twiml.document(
+    twiml.ALICE.prompt("Gracias por tu mensaje. Lo procesaré y me pondré en contacto contigo pronto."), twiml.HANGUP)
+NO_AUDIO_TWIML = twiml.document(
+    twiml.ALICE.prompt("No pude escuchar tu mensaje. ¿Podrías repetirlo?"), RECORD_RETRY)
+GOODBYE_TWIML = twiml.document(SAY_GOODBYE, twiml.HANGUP)
+LISTEN_TWIML = twiml.document(RECORD_REPLY)
+
+
+def reply_twiml(text):
+    """Say an answer, then record the caller's next turn"""
+    with metrics.span('twiml'):
+        return twiml.document(twiml.ALICE.say(text), RECORD_REPLY)
+
+
+def info_twiml(text):
+    """Say the information answer, then offer the menu again"""
+    with metrics.span('twiml'):
+        return twiml.document(twiml.ALICE.say(text), ASK_MORE, MENU_MORE, SAY_GOODBYE, twiml.HANGUP)
 
 # Database setup for appointments
 def init_database():
-    """Initialize SQLite database for appointments"""
-    conn = sqlite3.connect('appointments.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS appointments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            client_name TEXT,
-            client_phone TEXT,
-            service_type TEXT,
-            appointment_date TEXT,
-            appointment_time TEXT,
-            status TEXT DEFAULT 'scheduled',
-            notes TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    """Initialize SQLite database for appointments (creates or migrates the schema)"""
+    db.connection()
 
 # Initialize database on startup
 init_database()
 
-def generate_ai_response(message):
-    """Generate AI response using Claude or OpenAI"""
-    try:
-        if AI_PROVIDER == 'claude':
-            return generate_claude_response(message)
-        else:
-            return generate_openai_response(message)
-    except Exception as e:
-        print(f"Error generating AI response: {e}")
-        # Fallback to simple responses when APIs are not available
-        return generate_fallback_response(message)
+def generate_ai_response(message, call_sid=None, user_message=None, cacheable=False):
+    """Generate AI response using Claude or OpenAI (see router.py)
+    
+    With a call_sid the call's earlier turns are sent as context and the new
+    turn is stored in call_store, as user_message (what the caller said) when
+    message wraps it in instructions for the model. Fixed menu / instruction
+    prompts pass cacheable=True to be answered from the response cache.
+    """
+    # Cache hits skip the router, so its latencies and breakers only see real provider calls
+    cache_key = prompt_cache_key(message, call_sid) if cacheable else None
+    cached = response_cache.cache.lookup(cache_key)
+    if cached is not None:
+        return cached
+    started = time.perf_counter()
+    # Preferred provider first, hedged to the other one when slow; simple responses past the deadline
+    with metrics.span('llm'):
+        response, provider = ROUTER.complete(message, call_sid)
+    if provider != 'fallback':
+        response_cache.cache.store(cache_key, response)
+    if call_sid:
+        call_store.append_turn(call_sid, user_message or message, response,
+                               latency_ms=round((time.perf_counter() - started) * 1000, 1))
+    return response
 
 def generate_fallback_response(message):
     """Generate simple fallback responses when APIs are not available"""
@@ -73,80 +162,139 @@ def generate_fallback_response(message):
     else:
         return "Gracias por tu mensaje. He tomado nota y me pondré en contacto contigo pronto."
 
-def generate_claude_response(message):
+def build_context(message, call_sid=None):
+    """System prompt and messages for one turn, within the context token budget"""
+    session = call_store.load_session(call_sid) if call_sid else {}
+    system, messages, updates = conversation_context.build_context(SYSTEM_PROMPT, session, message)
+    if updates:
+        call_store.update_session(call_sid, **updates)
+    return system, messages
+
+def claude_payload(message, call_sid=None):
+    """Request body for the Claude messages API"""
+    system, messages = build_context(message, call_sid)
+    return {
+        "model": "claude-3-5-sonnet-20241022",
+        "max_tokens": 150,  # Optimizado para velocidad máxima
+        "system": system,
+        "messages": messages
+    }
+
+def openai_payload(message, call_sid=None):
+    """Request body for the OpenAI chat completions API"""
+    system, messages = build_context(message, call_sid)
+    return {
+        "model": "gpt-4",
+        "messages": [{"role": "system", "content": system}] + messages,
+        "max_tokens": 200  # Optimizado para velocidad
+    }
+
+def ai_payload(message, call_sid=None):
+    """Provider name and request body for the configured AI provider"""
+    if AI_PROVIDER == 'claude':
+        return 'claude', claude_payload(message, call_sid)
+    return 'openai', openai_payload(message, call_sid)
+
+def payload_cache_key(provider, payload, call_sid=None):
+    """Response cache key for a provider request body; None for a turn of a call (its context is in the prompt)"""
+    if call_sid:
+        return None
+    return response_cache.make_key(provider, payload['model'], payload.get('system'),
+                                   payload['messages'], payload.get('temperature'))
+
+def prompt_cache_key(message, call_sid=None):
+    """Response cache key for a prompt answered through the router, whichever provider answers it"""
+    if call_sid:
+        return None
+    system, messages = build_context(message)
+    return response_cache.make_key('router', None, system, messages)
+
+def generate_claude_response(message, call_sid=None, timeout=None):
     """Generate response using Claude AI"""
-    url = "https://api.anthropic.com/v1/messages"
+    url = f"{CLAUDE_BASE_URL}/v1/messages"
     headers = {
         "x-api-key": CLAUDE_API_KEY,
         "Content-Type": "application/json",
         "anthropic-version": "2023-06-01"
     }
     
-    system_prompt = """
-    Eres Jenni, una recepcionista real. Habla de manera natural y conversacional.
-
-    INSTRUCCIONES:
-    - Usa expresiones como "¡Hola!", "Perfecto", "Claro que sí", "¡Genial!"
-    - Sé empática y útil
-    - Habla como una persona real, no como un robot
-    - Mantén un tono cálido y profesional
-    - NO repitas preguntas que ya hiciste
-    - Responde específicamente a lo que dice el cliente
-    """
-    
-    data = {
-        "model": "claude-3-5-sonnet-20241022",
-        "max_tokens": 150,  # Optimizado para velocidad máxima
-        "system": system_prompt,
-        "messages": [
-            {
-                "role": "user",
-                "content": message
-            }
-        ]
-    }
-    
-    response = requests.post(url, headers=headers, json=data)
+    payload = claude_payload(message, call_sid)
+    response = http_client.post(url, headers=headers, json=payload,
+                                timeout=timeout or (http_client.CONNECT_TIMEOUT, router.BUDGETS['claude']))
     response.raise_for_status()
     
     result = response.json()
     return result['content'][0]['text']
 
-def generate_openai_response(message):
+def generate_openai_response(message, call_sid=None, timeout=None):
     """Generate response using OpenAI"""
-    url = "https://api.openai.com/v1/chat/completions"
+    url = f"{OPENAI_BASE_URL}/v1/chat/completions"
     headers = {
         "Authorization": f"Bearer {OPENAI_API_KEY}",
         "Content-Type": "application/json"
     }
     
-    system_prompt = """
-    Eres Jenni, una recepcionista real. Habla de manera natural y conversacional.
-
-    INSTRUCCIONES:
-    - Usa expresiones como "¡Hola!", "Perfecto", "Claro que sí", "¡Genial!"
-    - Sé empática y útil
-    - Habla como una persona real, no como un robot
-    - Mantén un tono cálido y profesional
-    - NO repitas preguntas que ya hiciste
-    - Responde específicamente a lo que dice el cliente
-    """
-    
-    data = {
-        "model": "gpt-4",
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": message}
-        ],
-        "max_tokens": 200  # Optimizado para velocidad
-    }
-    
-    response = requests.post(url, headers=headers, json=data)
+    payload = openai_payload(message, call_sid)
+    response = http_client.post(url, headers=headers, json=payload,
+                                timeout=timeout or (http_client.CONNECT_TIMEOUT, router.BUDGETS['openai']))
     response.raise_for_status()
     
     result = response.json()
     return result['choices'][0]['message']['content']
 
+def routed_providers():
+    """Providers to route across: the configured one first, the other when its API key is set"""
+    configured = {'openai': OPENAI_API_KEY != 'YOUR_OPENAI_API_KEY', 'claude': CLAUDE_API_KEY != 'YOUR_CLAUDE_API_KEY'}
+    return [name for name in (AI_PROVIDER, 'claude' if AI_PROVIDER == 'openai' else 'openai')
+            if name == AI_PROVIDER or configured[name]]
+
+ROUTER = router.Router(
+    [router.Provider(name, call={'openai': generate_openai_response, 'claude': generate_claude_response}[name])
+     for name in routed_providers()],
+    fallback=generate_fallback_response, primary=AI_PROVIDER)
+
+def generate_ai_response_stream(provider, payload):
+    """Yield response text chunks from the provider's SSE stream"""
+    if provider == 'claude':
+        return llm_stream.stream_claude(f"{CLAUDE_BASE_URL}/v1/messages", CLAUDE_API_KEY, payload)
+    return llm_stream.stream_openai(f"{OPENAI_BASE_URL}/v1/chat/completions", OPENAI_API_KEY, payload)
+
+def start_streamed_response(message, call_sid=None, cacheable=False):
+    """Stream an AI answer and return (first_sentence, continue_query)
+    
+    continue_query is None when the whole answer already fits in the first <Say>.
+    """
+    provider, payload = ai_payload(message)
+    cache_key = payload_cache_key(provider, payload) if cacheable else None
+    cached = response_cache.cache.lookup(cache_key)
+    if cached is not None:
+        return cached, None
+    
+    turn = llm_stream.start_turn(generate_ai_response_stream(provider, payload),
+                                 fallback=generate_fallback_response(message),
+                                 on_complete=lambda text: response_cache.cache.store(cache_key, text),
+                                 call_sid=call_sid)
+    with metrics.span('llm'):
+        first_sentence = turn.wait_first()
+    if first_sentence is not None and turn.done and not turn.wait_rest():
+        llm_stream.take_turn(turn.token)
+        return first_sentence, None
+    return first_sentence or "Un momento, por favor.", llm_stream.continue_query(turn)
+
+@app.before_request
+def start_request_trace():
+    """Time the request; parsing the form is the first stage"""
+    request.environ['metrics.started'] = metrics.start_trace()
+    with metrics.span('parse'):
+        request.form
+
+@app.after_request
+def finish_request_trace(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.finish_trace(request.method, route, response.status_code, request.environ['metrics.started'],
+                         log=request.method == 'POST')
+    return response
+
 @app.route('/webhook/incoming', methods=['POST'])
 def handle_incoming_call():
     """Handle incoming call from Twilio"""
@@ -157,34 +305,15 @@ def handle_incoming_call():
         to_number = request.form.get('To')
         
         print(f"📞 Incoming call: {call_sid} from {from_number} to {to_number}")
+        call_store.start_call(call_sid, from_number)
         
-        # Generate human-like greeting
-        greeting = "¡Hola! Soy Jenni, tu recepcionista virtual. ¿En qué puedo ayudarte hoy?"
-        
-        # Generate TwiML response for natural conversation
-        twiml = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="alice" language="es-MX">{greeting}</Say>
-    <Record maxLength="30" timeout="10" action="/webhook/recording" method="POST" playBeep="false" />
-</Response>"""
-        
-        return Response(twiml, mimetype='text/xml')
+        # Human-like greeting followed by a natural-conversation recording
+        return Response(GREETING_TWIML, mimetype='text/xml')
         
     except Exception as e:
         print(f"Error handling incoming call: {e}")
         # Fallback response
-        twiml = """<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="alice" language="es-MX">Hola, soy tu recepcionista virtual. ¿En qué puedo ayudarte?</Say>
-    <Pause length="1"/>
-    <Say voice="alice" language="es-MX">¿En qué puedo ayudarte hoy?</Say>
-    <Gather numDigits="1" timeout="10" action="/webhook/gather" method="POST">
-        <Say voice="alice" language="es-MX">Presiona 1 para información, 2 para hablar con alguien, o 3 para dejar un mensaje.</Say>
-    </Gather>
-    <Say voice="alice" language="es-MX">Gracias por llamar. ¡Que tengas un buen día!</Say>
-    <Hangup/>
-</Response>"""
-        return Response(twiml, mimetype='text/xml')
+        return Response(MENU_TWIML, mimetype='text/xml')
 
 @app.route('/webhook/gather', methods=['POST'])
 def handle_gather():
@@ -197,67 +326,27 @@ def handle_gather():
         
         if digits == '1':
             # Information request
-            response_text = generate_ai_response("El visitante pidió información. Proporciona información útil sobre la empresa.")
-            twiml = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="alice" language="es-MX">{response_text}</Say>
-    <Pause length="1"/>
-    <Say voice="alice" language="es-MX">¿Hay algo más en lo que pueda ayudarte?</Say>
-    <Gather numDigits="1" timeout="10" action="/webhook/gather" method="POST">
-        <Say voice="alice" language="es-MX">Presiona 1 para más información, 2 para hablar con alguien, o 3 para dejar un mensaje.</Say>
-    </Gather>
-    <Say voice="alice" language="es-MX">Gracias por llamar. ¡Que tengas un buen día!</Say>
-    <Hangup/>
-</Response>"""
+            response_text = generate_ai_response("El visitante pidió información. Proporciona información útil sobre la empresa.",
+                                                 cacheable=True)
+            twiml_body = info_twiml(response_text)
         elif digits == '2':
             # Talk to someone
-            twiml = """<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="alice" language="es-MX">Perfecto, te voy a conectar con alguien que pueda ayudarte mejor.</Say>
-    <Pause length="2"/>
-    <Say voice="alice" language="es-MX">Por favor, espera mientras te transfiero.</Say>
-    <Hangup/>
-</Response>"""
+            twiml_body = TRANSFER_TWIML
         elif digits == '3':
             # Leave a message
-            twiml = """<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="alice" language="es-MX">Perfecto, puedes dejar tu mensaje después del tono.</Say>
-    <Record maxLength="60" timeout="10" action="/webhook/recording" method="POST" />
-    <Say voice="alice" language="es-MX">Gracias por tu mensaje. Lo procesaré y me pondré en contacto contigo pronto.</Say>
-    <Hangup/>
-</Response>"""
+            twiml_body = LEAVE_MESSAGE_TWIML
         else:
             # Invalid option
-            twiml = """<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="alice" language="es-MX">Lo siento, no entendí tu opción.</Say>
-    <Pause length="1"/>
-    <Say voice="alice" language="es-MX">¿En qué puedo ayudarte hoy?</Say>
-    <Gather numDigits="1" timeout="10" action="/webhook/gather" method="POST">
-        <Say voice="alice" language="es-MX">Presiona 1 para información, 2 para hablar con alguien, o 3 para dejar un mensaje.</Say>
-    </Gather>
-    <Say voice="alice" language="es-MX">Gracias por llamar. ¡Que tengas un buen día!</Say>
-    <Hangup/>
-</Response>"""
+            twiml_body = INVALID_OPTION_TWIML
         
-        return Response(twiml, mimetype='text/xml')
+        return Response(twiml_body, mimetype='text/xml')
         
     except Exception as e:
         print(f"Error handling gather: {e}")
-        twiml = """<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="alice" language="es-MX">Lo siento, hubo un problema. ¿En qué puedo ayudarte?</Say>
-    <Gather numDigits="1" timeout="10" action="/webhook/gather" method="POST">
-        <Say voice="alice" language="es-MX">Presiona 1 para información, 2 para hablar con alguien, o 3 para dejar un mensaje.</Say>
-    </Gather>
-    <Say voice="alice" language="es-MX">Gracias por llamar. ¡Que tengas un buen día!</Say>
-    <Hangup/>
-</Response>"""
-        return Response(twiml, mimetype='text/xml')
+        return Response(GATHER_ERROR_TWIML, mimetype='text/xml')
 
-@app.route('/webhook/gather', methods=['POST'])
-def handle_gather():
+@app.route('/webhook/speech', methods=['POST'])
+def handle_speech():
     """Handle speech input from Gather"""
     try:
         speech_result = request.form.get('SpeechResult', '')
@@ -265,17 +354,39 @@ def handle_gather():
         
         print(f"🎤 Speech received: {speech_result} for call {call_sid}")
         
-        # Simple response
-        twiml = """<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="alice" language="es-MX">Perfecto, entiendo. ¿Hay algo más en lo que pueda ayudarte?</Say>
-    <Record maxLength="30" timeout="10" action="/webhook/recording" method="POST" playBeep="false" />
-</Response>"""
-        
-        return Response(twiml, mimetype='text/xml')
+        if intents.is_end_of_conversation(speech_result):
+            call_store.end_call(call_sid)
+            queue_call_summary(call_sid)
+            return Response(SPEECH_GOODBYE_TWIML, mimetype='text/xml')
+        
+        # Booking turns fill the appointment slots; only missing fields are asked again
+        # A pending booking keeps the conversation only while the caller answers its questions
+        appointment = call_store.load_session(call_sid).get("appointment") if call_sid else None
+        if call_sid and (intents.is_appointment_request(speech_result)
+                         or (appointment and not appointment.get("announced")
+                             and (appointment.get("notice") or extraction.has_slot_content(speech_result, appointment)))):
+            slots = extraction.update_slots(call_sid, speech_result, caller=request.form.get('From', ''),
+                                            use_llm=False)
+            answer = appointment_reply(call_sid, slots)
+            if extraction.missing(slots):
+                # The LLM fills what the local parsers could not, before the caller's next turn;
+                # the same utterance (a Twilio retry, a repeated answer) is queued once per call
+                jobs.enqueue('extract_appointment', {"call_sid": call_sid, "message": speech_result, "use_local": False},
+                             key=f"{call_sid}:{hashlib.sha1(extraction.normalize(speech_result).encode('utf-8')).hexdigest()}")
+            call_store.append_turn(call_sid, speech_result, answer)
+            return Response(reply_twiml(answer), mimetype='text/xml')
+        
+        # Approved FAQ answer when the question is a known one, else the simple response
+        answer = semantic_cache.lookup(speech_result)
+        if answer and call_sid:
+            call_store.append_turn(call_sid, speech_result, answer)
+        if not answer:
+            return Response(SPEECH_ACK_TWIML, mimetype='text/xml')
+        
+        return Response(reply_twiml(answer), mimetype='text/xml')
         
     except Exception as e:
-        print(f"Error handling gather: {e}")
+        print(f"Error handling speech: {e}")
         return Response("Error", status=500)
 
 @app.route('/webhook/recording', methods=['POST'])
@@ -288,88 +399,175 @@ def handle_recording():
         
         print(f"🎙️ Recording received: {recording_url} for call {call_sid}, duration: {recording_duration}")
         
+        if request.form.get('CallStatus') in call_store.ENDED_STATUSES:
+            queue_call_summary(call_sid)
+        
         if recording_url and recording_duration and int(recording_duration) > 0:
-            # Process the recording
-            try:
-                print(f"Processing recording: {recording_url}, duration: {recording_duration}")
-                
-                # Generate response without transcription for now
-                ai_response = generate_ai_response("Responde como Jenni, una recepcionista real. Usa expresiones como 'Perfecto', 'Entiendo', 'Claro que sí'. Sé empática y útil.")
-                
-                twiml = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="alice" language="es-MX">{ai_response}</Say>
-    <Record maxLength="30" timeout="10" action="/webhook/recording" method="POST" playBeep="false" />
-</Response>"""
-            except Exception as e:
-                print(f"Error processing recording: {e}")
-                twiml = """<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="alice" language="es-MX">Gracias por tu mensaje. Lo procesaré y me pondré en contacto contigo pronto.</Say>
-    <Hangup/>
-</Response>"""
+            # Transcription and the answer run in the background; /webhook/continue speaks the answer
+            queue_recording(request.form)
+            recording_sid = request.form.get('RecordingSid')
+            if recording_sid:
+                twiml_body = twiml.document(twiml.redirect(f"/webhook/continue?recording={recording_sid}"))
+            else:
+                twiml_body = acknowledge_recording(call_sid)
         else:
             # No recording or empty recording
-            twiml = """<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="alice" language="es-MX">No pude escuchar tu mensaje. ¿Podrías repetirlo?</Say>
-    <Record maxLength="30" timeout="10" action="/webhook/recording" method="POST" />
-</Response>"""
+            twiml_body = NO_AUDIO_TWIML
         
-        return Response(twiml, mimetype='text/xml')
+        return Response(twiml_body, mimetype='text/xml')
         
     except Exception as e:
         print(f"Error handling recording: {e}")
-        twiml = """<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="alice" language="es-MX">Gracias por llamar. ¡Que tengas un buen día!</Say>
-    <Hangup/>
-</Response>"""
-        return Response(twiml, mimetype='text/xml')
-
-def process_recording(recording_url):
-    """Process the recording and generate AI response"""
+        return Response(GOODBYE_TWIML, mimetype='text/xml')
+
+def acknowledge_recording(call_sid=None):
+    """Generic reply to a recording whose answer is not ready (streamed when enabled)"""
     try:
-        print(f"Processing recording: {recording_url}")
-        
-        # Download the recording
-        import requests
-        response = requests.get(recording_url)
-        if response.status_code != 200:
-            print(f"Failed to download recording: {response.status_code}")
-            return "Lo siento, no pude descargar tu mensaje. ¿Podrías repetirlo?"
-        
-        # Save the recording temporarily
-        with open('/tmp/recording.wav', 'wb') as f:
-            f.write(response.content)
-        
-        # Transcribe using OpenAI Whisper
-        try:
-            import openai
-            client = openai.OpenAI(api_key=OPENAI_API_KEY)
-            
-            with open('/tmp/recording.wav', 'rb') as audio_file:
-                transcript = client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    language="es"
-                )
-            
-            user_message = transcript.text
-            print(f"Transcribed: {user_message}")
-            
-            # Generate AI response based on the transcription
-            ai_response = generate_ai_response(f"El usuario dijo: {user_message}. Responde de manera útil y profesional.")
-            
-            return ai_response
-            
-        except Exception as e:
-            print(f"Error transcribing: {e}")
-            return "Gracias por tu mensaje. He tomado nota y me pondré en contacto contigo pronto."
-        
+        prompt = "Responde como Jenni, una recepcionista real. Usa expresiones como 'Perfecto', 'Entiendo', 'Claro que sí'. Sé empática y útil."
+        
+        if llm_stream.STREAMING_ENABLED:
+            first_sentence, query = start_streamed_response(prompt, call_sid, cacheable=True)
+            if query:
+                return twiml.document(twiml.ALICE.say(first_sentence), twiml.redirect(f"/webhook/continue?{query}"))
+            return reply_twiml(first_sentence)
+        return reply_twiml(generate_ai_response(prompt, cacheable=True))
     except Exception as e:
         print(f"Error processing recording: {e}")
-        return "Lo siento, no pude procesar tu mensaje. ¿Podrías repetirlo?"
+        return MESSAGE_TAKEN_TWIML
+
+def recording_reply(call_sid, recording_sid):
+    """process_recording's answer to a recording, or None while it is still being transcribed and answered"""
+    reply = call_store.load_session(call_sid).get("reply") if call_sid else None
+    if reply and reply.get("recording_sid") == recording_sid:
+        return reply["text"]
+    return None
+
+def wait_recording_reply(call_sid, recording_sid, timeout=RECORDING_REPLY_WAIT):
+    """Poll the session (shared by all workers) for the recording's answer"""
+    deadline = time.monotonic() + timeout
+    while True:
+        answer = recording_reply(call_sid, recording_sid)
+        if answer is not None or time.monotonic() >= deadline:
+            return answer
+        time.sleep(0.1)
+
+@app.route('/webhook/continue', methods=['POST'])
+def handle_continue():
+    """Speak the answer to a recording, or the rest of a streamed answer after its first sentence"""
+    try:
+        call_sid = request.form.get('CallSid')
+        recording_sid = request.args.get('recording')
+        if recording_sid:
+            with metrics.span('recording_reply'):
+                answer = wait_recording_reply(call_sid, recording_sid)
+            if answer is None:
+                print(f"⏳ Answer to {recording_sid} not ready after {RECORDING_REPLY_WAIT:.0f}s")
+                return Response(acknowledge_recording(call_sid), mimetype='text/xml')
+            return Response(reply_twiml(answer) if answer else NO_AUDIO_TWIML, mimetype='text/xml')
+        
+        remainder = llm_stream.wait_remainder(request.args.get('turn', ''), call_sid,
+                                              whole=request.args.get('whole') == '1')
+        rest = remainder[2] if remainder else ""
+        return Response(reply_twiml(rest) if rest else LISTEN_TWIML, mimetype='text/xml')
+        
+    except Exception as e:
+        print(f"Error handling continue: {e}")
+        return Response(LISTEN_TWIML, mimetype='text/xml')
+
+def queue_recording(form):
+    """Queue transcription of a finished recording, once per RecordingSid"""
+    recording_url = form.get('RecordingUrl')
+    if not recording_url:
+        return False
+    recording_sid = form.get('RecordingSid') or recording_url
+    payload = {"recording_url": recording_url, "recording_sid": recording_sid, "call_sid": form.get('CallSid')}
+    return jobs.enqueue('process_recording', payload, key=recording_sid)
+
+def queue_call_summary(call_sid):
+    """Queue the call summary, late enough for pending recordings to be transcribed"""
+    if call_sid:
+        jobs.enqueue('call_summary', {"call_sid": call_sid}, key=call_sid, delay=CALL_SUMMARY_DELAY)
+
+def answer_transcript(user_message, call_sid=None):
+    """Approved FAQ answer for a transcribed message, else an AI follow-up; stored as the turn"""
+    local_answer = semantic_cache.lookup(user_message)
+    if local_answer:
+        if call_sid:
+            call_store.append_turn(call_sid, user_message, local_answer)
+        return local_answer
+    return generate_ai_response(f"El usuario dijo: {user_message}. Responde de manera útil y profesional.", call_sid,
+                                user_message=user_message)
+
+def process_recording(payload):
+    """Job: transcribe a recording, answer it and queue appointment extraction
+    
+    Download and Whisper errors propagate so the queue retries the job.
+    """
+    recording_url, call_sid = payload["recording_url"], payload.get("call_sid")
+    print(f"Processing recording: {recording_url}")
+    
+    # Stream the recording into a per-call temp file and upload it to Whisper from there
+    with recordings.download(recording_url, call_sid) as audio:
+        user_message = recordings.transcribe(audio, api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+    print(f"Transcribed: {user_message}")
+    if not user_message.strip():
+        if call_sid:
+            call_store.update_session(call_sid, reply={"recording_sid": payload["recording_sid"], "text": ""})
+        return
+    
+    answer = answer_transcript(user_message, call_sid)
+    if call_sid:
+        # /webhook/continue is polling the session for it
+        call_store.update_session(call_sid, reply={"recording_sid": payload["recording_sid"], "text": answer})
+    jobs.enqueue('extract_appointment', {"call_sid": call_sid, "message": user_message},
+                 key=payload["recording_sid"])
+
+def extract_appointment(payload):
+    """Job: fill the call's appointment slots from a message and book once they are complete
+    
+    Provider errors propagate so the queue retries the job.
+    """
+    call_sid = payload.get("call_sid")
+    if not call_sid:
+        return
+    slots = extraction.update_slots(call_sid, payload["message"], use_local=payload.get("use_local", True))
+    if not extraction.missing(slots) and not slots.get("booked"):
+        appointment_reply(call_sid, slots, spoken=False)
+
+def appointment_reply(call_sid, slots, spoken=True):
+    """Book when every slot is filled, else ask for the missing ones; returns what to say
+    
+    A booking made in the background (spoken=False) is confirmed on the caller's next turn;
+    if the slot was taken, the alternatives are kept as a notice and offered on that turn.
+    """
+    notice = slots.get("notice") if spoken else None
+    if notice:
+        slots = dict(slots, notice=None)
+        call_store.update_session(call_sid, appointment=slots)
+    if extraction.missing(slots):
+        return notice or extraction.follow_up(slots)
+    if slots.get("booked"):
+        call_store.update_session(call_sid, appointment=dict(slots, announced=True))
+        return extraction.confirmation(slots)
+    service_type = slots.get("service_type") or "Consulta"
+    if save_appointment(slots["client_name"], slots["client_phone"], service_type,
+                        slots["preferred_date"], slots["preferred_time"], slots.get("notes") or ""):
+        call_store.update_session(call_sid, appointment=dict(slots, booked=True, announced=spoken))
+        return extraction.confirmation(slots)
+    # Taken or closed: offer the next free slots and ask for the date and time again
+    after = max(datetime.now(), datetime.fromisoformat(f"{slots['preferred_date']}T{slots['preferred_time']}"))
+    with metrics.span('db'):
+        alternatives = scheduling.get_scheduler().next_free_slots(service_type, 3, after=after)
+    answer = extraction.unavailable(slots, alternatives)
+    call_store.update_session(call_sid, appointment=dict(slots, preferred_date=None, preferred_time=None,
+                                                         notice=None if spoken else answer))
+    return answer
+
+def deliver_call_summary(payload):
+    """Job: hand the call's summary to the notification dispatcher"""
+    session = call_store.load_session(payload["call_sid"])
+    if session["turns"]:
+        notifications.notify(OWNER_PHONE_NUMBER, notifications.format_summary(session["turns"]))
 
 @app.route('/webhook/recording-status', methods=['POST'])
 def handle_recording_status():
@@ -381,6 +579,10 @@ def handle_recording_status():
         
         print(f"📊 Recording status: {recording_status} for call {call_sid}, URL: {recording_url}")
         
+        # Same RecordingSid as /webhook/recording, so the job only runs once
+        if recording_status == 'completed':
+            queue_recording(request.form)
+        
         return "OK"
         
     except Exception as e:
@@ -390,7 +592,101 @@ def handle_recording_status():
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "http_pool": http_client.pool_stats(),
+        "streaming": llm_stream.stream_stats(),
+        "context": conversation_context.context_stats(),
+        "response_cache": response_cache.cache_stats(),
+        "semantic_cache": semantic_cache.cache_stats(),
+        "recordings": recordings.recording_stats(),
+        "jobs": jobs.job_stats(),
+        "notifications": notifications.notification_stats(),
+        "call_log": call_log.call_log_stats(),
+        "extraction": extraction.extraction_stats(),
+        "prompt_audio": prompt_audio.prompt_stats(),
+        "router": ROUTER.stats()
+    }
+
+@app.route(f"{prompt_audio.PATH}<name>", methods=['GET'])
+def prompt_audio_file(name):
+    """Pre-synthesized prompt audio played by <Play>, cacheable for a year"""
+    status, headers, body = prompt_audio.lookup(name, request.headers.get('If-None-Match'))
+    return Response(body, status=status, headers=headers)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Latency histograms and the /health counters in the Prometheus text format"""
+    return Response(metrics.render(health_check()), content_type=metrics.CONTENT_TYPE)
+
+def admin_authorized():
+    """Admin endpoints require X-Admin-Token to match ADMIN_TOKEN; without ADMIN_TOKEN they are disabled"""
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8'))
+
+@app.route('/admin/faq', methods=['GET', 'POST'])
+def admin_faq():
+    """List FAQ entries, or seed a new question/answer pair (JSON or form)"""
+    if not admin_authorized():
+        return {"error": "unauthorized"}, 401
+    cache = semantic_cache.get_cache()
+    if request.method == 'GET':
+        return {"entries": cache.entries(), "stats": cache.stats()}
+    
+    data = request.get_json(silent=True) or request.form
+    question = (data.get('question') or '').strip()
+    answer = (data.get('answer') or '').strip()
+    if not question or not answer:
+        return {"error": "question and answer are required"}, 400
+    approved = str(data.get('approved', '')).lower() in ('1', 'true', 'yes')
+    return cache.seed(question, answer, approved=approved), 201
+
+@app.route('/admin/faq/<int:entry_id>', methods=['DELETE'])
+def admin_faq_delete(entry_id):
+    """Remove an FAQ entry"""
+    if not admin_authorized():
+        return {"error": "unauthorized"}, 401
+    if not semantic_cache.get_cache().delete(entry_id):
+        return {"error": "not found"}, 404
+    return {"deleted": entry_id}
+
+@app.route('/admin/faq/<int:entry_id>/approve', methods=['POST'])
+def admin_faq_approve(entry_id):
+    """Approve an entry (or withdraw it with approved=false) so it answers callers"""
+    if not admin_authorized():
+        return {"error": "unauthorized"}, 401
+    data = request.get_json(silent=True) or request.form
+    approved = str(data.get('approved', 'true')).lower() in ('1', 'true', 'yes')
+    entry = semantic_cache.get_cache().set_approved(entry_id, approved)
+    if entry is None:
+        return {"error": "not found"}, 404
+    return entry
+
+@app.route('/admin/calls', methods=['GET'])
+def admin_calls():
+    """A caller's recent calls (?caller=+52...&limit=20) or the calls of a day (?day=YYYY-MM-DD)"""
+    if not admin_authorized():
+        return {"error": "unauthorized"}, 401
+    limit = request.args.get('limit', 20, type=int)
+    if request.args.get('caller'):
+        return {"calls": call_log.caller_history(request.args['caller'], limit)}
+    if request.args.get('day'):
+        try:
+            return {"calls": call_log.get_log().calls_on(request.args['day'], limit)}
+        except ValueError:
+            return {"error": "day must be YYYY-MM-DD"}, 400
+    return {"error": "caller or day is required"}, 400
+
+@app.route('/admin/calls/<call_sid>', methods=['GET'])
+def admin_call(call_sid):
+    """One call with all its turns"""
+    if not admin_authorized():
+        return {"error": "unauthorized"}, 401
+    call = call_log.get_log().call(call_sid)
+    if call is None:
+        return {"error": "not found"}, 404
+    return call
 
 @app.route('/', methods=['GET'])
 def home():
@@ -404,90 +700,47 @@ def home():
 
 # Appointment management functions
 def save_appointment(client_name, client_phone, service_type, appointment_date, appointment_time, notes=""):
-    """Save appointment to database"""
+    """Save appointment to database; False if the slot is taken, closed or the insert fails"""
     try:
-        conn = sqlite3.connect('appointments.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO appointments (client_name, client_phone, service_type, appointment_date, appointment_time, notes)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (client_name, client_phone, service_type, appointment_date, appointment_time, notes))
-        conn.commit()
-        conn.close()
+        with metrics.span('db'):
+            appointment_id = scheduling.get_scheduler().book(client_name, client_phone, service_type,
+                                                             appointment_date, appointment_time, notes)
+        if appointment_id is None:
+            print(f"Slot not available: {appointment_date} {appointment_time}")
+            return False
         return True
     except Exception as e:
         print(f"Error saving appointment: {e}")
         return False
 
-def get_available_times(date):
+def get_available_times(date, service_type=None):
     """Get available appointment times for a specific date"""
-    # This is a simplified version - in production you'd check against existing appointments
-    available_times = [
-        "09:00", "10:00", "11:00", "12:00", "14:00", "15:00", "16:00", "17:00"
-    ]
-    return available_times
+    with metrics.span('db'):
+        return scheduling.get_scheduler().free_times(date, service_type)
 
 def transcribe_audio(audio_data):
     """Transcribe audio using OpenAI Whisper"""
     try:
-        import base64
-        
-        # Encode audio data
-        audio_base64 = base64.b64encode(audio_data).decode('utf-8')
-        
-        # Call OpenAI Whisper API
-        url = "https://api.openai.com/v1/audio/transcriptions"
-        headers = {
-            "Authorization": f"Bearer {OPENAI_API_KEY}",
-        }
-        
-        files = {
-            'file': ('audio.wav', audio_data, 'audio/wav'),
-            'model': (None, 'whisper-1'),
-            'language': (None, 'es')
-        }
-        
-        response = requests.post(url, headers=headers, files=files)
-        response.raise_for_status()
-        
-        result = response.json()
-        return result.get('text', 'No se pudo transcribir')
+        return recordings.transcribe(io.BytesIO(audio_data), api_key=OPENAI_API_KEY,
+                                     base_url=OPENAI_BASE_URL) or 'No se pudo transcribir'
         
     except Exception as e:
         print(f"Error transcribing audio: {e}")
         return "No se pudo transcribir el audio"
 
 def extract_appointment_info(message):
-    """Extract appointment information from user message using AI"""
+    """Extract appointment information from user message (local parsers, then structured AI output)"""
     try:
-        # Use AI to extract appointment details
-        extraction_prompt = f"""
-        Extrae información de cita del siguiente mensaje del cliente:
-        "{message}"
-        
-        Responde en formato JSON con:
-        - client_name: nombre del cliente
-        - service_type: tipo de servicio solicitado
-        - preferred_date: fecha preferida (formato YYYY-MM-DD)
-        - preferred_time: hora preferida (formato HH:MM)
-        - notes: notas adicionales
-        
-        Si no hay información clara, usa "no especificado" para ese campo.
-        """
-        
-        response = generate_ai_response(extraction_prompt)
-        # In a real implementation, you'd parse the JSON response
-        return {
-            "client_name": "Cliente",
-            "service_type": "Consulta",
-            "preferred_date": (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d"),
-            "preferred_time": "10:00",
-            "notes": message
-        }
+        return extraction.extract(message)
     except Exception as e:
         print(f"Error extracting appointment info: {e}")
         return None
 
+# Background jobs; workers start with the process
+jobs.register('process_recording', process_recording, concurrency=2)
+jobs.register('extract_appointment', extract_appointment, concurrency=2)
+jobs.register('call_summary', deliver_call_summary, concurrency=1)
+
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 8080))
     app.run(host='0.0.0.0', port=port, debug=True)
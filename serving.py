@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Concurrent serving modes for the simple_server*.py WebhookHandler
+socketserver.TCPServer answers one request at a time, so a caller waiting on
+OpenAI blocks every other Twilio webhook. These servers bound the number of
+requests in flight and answer immediately with fallback TwiML when saturated.
+Every handler is wrapped by instrument(), which times each POST per route,
+answers GET /metrics with the Prometheus histograms (with prefork each worker
+process keeps and reports its own) and serves the cached prompt audio under
+PROMPT_AUDIO_PATH (see prompt_audio.py).
+
+Environment:
+    SERVER_MODE        single | thread | pool | prefork (default thread)
+    SERVER_WORKERS     pool threads, or processes for prefork (default 8)
+    MAX_IN_FLIGHT      requests handled at once per process (default 32)
+    SATURATED_STATUS   HTTP status of the busy answer; 200 plays the TwiML below,
+                       503 lets Twilio use the number's Fallback URL (default 200)
+"""
+
+import os
+import signal
+import socket
+import socketserver
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import prompt_audio
+import twiml
+
+SERVER_MODE = os.getenv('SERVER_MODE', 'thread')
+SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', 8))
+MAX_IN_FLIGHT = int(os.getenv('MAX_IN_FLIGHT', 32))
+SATURATED_STATUS = int(os.getenv('SATURATED_STATUS', 200))
+
+BUSY_TWIML = twiml.document(
+    twiml.LUPE.prompt("En este momento estamos atendiendo muchas llamadas. Por favor deja tu nombre, teléfono y el motivo de tu llamada."),
+    twiml.record(maxLength=60, action='/recording', method='POST'),
+)
+
+_REASONS = {200: 'OK', 503: 'Service Unavailable'}
+
+
+class BoundedMixin:
+    """Reject requests beyond max_in_flight with a fast busy answer"""
+
+    allow_reuse_address = True
+    request_queue_size = 128
+    max_in_flight = MAX_IN_FLIGHT
+
+    def _init_bounds(self):
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._counter_lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(blocking=False):
+            with self._counter_lock:
+                self.rejected += 1
+            self.reject_request(request)
+            return
+        with self._counter_lock:
+            self.in_flight += 1
+        try:
+            self.dispatch_request(request, client_address)
+        except Exception:
+            self.release_slot()
+            raise
+
+    def release_slot(self):
+        with self._counter_lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def finish_bounded(self, request, client_address):
+        """Run one request on the current thread and free its slot"""
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.release_slot()
+
+    def reject_request(self, request):
+        """Answer with the busy TwiML without reading the request or touching the handler
+
+        This runs on the accept thread, so nothing here may wait on the client: a
+        slow or stalled sender would hold up every other connection exactly when the
+        server is saturated. The response fits in the socket buffer, and the unread
+        request is discarded with Connection: close.
+        """
+        try:
+            request.settimeout(0.5)
+            head = (f"HTTP/1.1 {SATURATED_STATUS} {_REASONS.get(SATURATED_STATUS, 'Busy')}\r\n"
+                    f"Content-Type: {twiml.CONTENT_TYPE}\r\n"
+                    f"Content-Length: {len(BUSY_TWIML)}\r\n"
+                    "Retry-After: 1\r\n"
+                    "Connection: close\r\n\r\n").encode('ascii')
+            request.sendall(head + BUSY_TWIML)
+            request.shutdown(socket.SHUT_RD)
+            print("⚠️ Server saturated, sent busy TwiML")
+        except OSError as e:
+            print(f"❌ Error rejecting request: {e}")
+        finally:
+            self.shutdown_request(request)
+
+
+class BoundedThreadingServer(BoundedMixin, socketserver.TCPServer):
+    """One thread per request, at most max_in_flight at a time"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._init_bounds()
+
+    def dispatch_request(self, request, client_address):
+        threading.Thread(target=self.finish_bounded, args=(request, client_address), daemon=True).start()
+
+
+class BoundedPoolServer(BoundedMixin, socketserver.TCPServer):
+    """Fixed pool of worker threads; max_in_flight also caps the queue behind them"""
+
+    def __init__(self, *args, workers=SERVER_WORKERS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._init_bounds()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='webhook')
+
+    def dispatch_request(self, request, client_address):
+        self.executor.submit(self.finish_bounded, request, client_address)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+
+
+def instrument(handler_class):
+    """handler_class timing every POST into metrics and serving GET /metrics and the prompt audio"""
+
+    class Instrumented(handler_class):
+        status = 500
+
+        def send_response(self, code, message=None):
+            self.status = code
+            super().send_response(code, message)
+
+        def do_POST(self):
+            started = metrics.start_trace()
+            route = self.path.split('?', 1)[0]
+            try:
+                super().do_POST()
+            finally:
+                # Unknown paths share one label so scanners cannot grow the series without bound
+                metrics.finish_trace('POST', route if self.status != 404 else 'unmatched', self.status, started)
+
+        def do_GET(self):
+            path = self.path.split('?', 1)[0]
+            if path.startswith(prompt_audio.PATH):
+                status, headers, body = prompt_audio.lookup(path[len(prompt_audio.PATH):],
+                                                            self.headers.get('If-None-Match'))
+                self.send_response(status)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if path != '/metrics':
+                if hasattr(handler_class, 'do_GET'):
+                    return super().do_GET()
+                return self.send_error(404)
+            gauges = {"serving": {"in_flight": getattr(self.server, 'in_flight', 0),
+                                  "rejected": getattr(self.server, 'rejected', 0)}}
+            if hasattr(self, 'health'):
+                gauges.update(self.health())
+            body = metrics.render(gauges).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', metrics.CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    Instrumented.__name__ = Instrumented.__qualname__ = handler_class.__name__
+    return Instrumented
+
+
+def _serve_prefork(handler_class, port, workers):
+    """Bind once, then fork workers that each run a bounded threading server"""
+    listener = BoundedThreadingServer(("", port), handler_class, bind_and_activate=False)
+    listener.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.server_bind()
+    listener.server_activate()
+
+    children = set()
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                listener._init_bounds()
+                listener.serve_forever()
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    def stop(signum, frame):
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    for _ in range(workers):
+        spawn()
+    print(f"🚀 Prefork: {workers} workers, {listener.max_in_flight} in flight each")
+    try:
+        while True:
+            pid, _ = os.wait()
+            children.discard(pid)
+            print(f"⚠️ Worker {pid} exited, restarting")
+            spawn()
+    except KeyboardInterrupt:
+        stop(None, None)
+    finally:
+        listener.server_close()
+
+
+def serve(handler_class, port, mode=SERVER_MODE, workers=SERVER_WORKERS):
+    """Serve handler_class forever using the configured concurrency mode"""
+    print(f"🚀 Server running on port {port} (mode={mode}, max_in_flight={MAX_IN_FLIGHT})")
+    handler_class = instrument(handler_class)
+    if mode == 'prefork':
+        return _serve_prefork(handler_class, port, workers)
+    if mode == 'single':
+        server = socketserver.TCPServer(("", port), handler_class)
+    elif mode == 'pool':
+        server = BoundedPoolServer(("", port), handler_class, workers=workers)
+    else:
+        server = BoundedThreadingServer(("", port), handler_class)
+    with server as httpd:
+        httpd.serve_forever()
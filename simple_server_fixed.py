@@ -1,12 +1,53 @@
 #!/usr/bin/env python3
 import http.server
-import socketserver
-import requests
+import serving
+import twiml
+import metrics
+import call_store
+import http_client
+import intents
+import notifications
+import response_cache
+import semantic_cache
 import urllib.parse
 import json
 import os
 import datetime
 
+# Fragmentos TwiML fijos, codificados una sola vez al importar
+VOICEMAIL = twiml.record(maxLength=60, action='/recording', method='POST')
+TALK_LISTEN = (
+    twiml.gather(twiml.DIEGO.prompt("Dime, ¿en qué puedo ayudarte?"), input='speech', action='/speech', method='POST',
+                 timeout=20, speechTimeout='auto', language='es-AR', enhanced='true')
+    + twiml.DIEGO.prompt("No escuché tu respuesta. Te transfiero al buzón de voz.")
+    + VOICEMAIL
+    + twiml.DIEGO.prompt("Gracias por tu mensaje.")
+)
+LISTEN_AGAIN = (
+    twiml.gather(input='speech', action='/speech', method='POST', timeout=12, speechTimeout=6, language='es-AR')
+    + twiml.DIEGO_XFAST.prompt("Ha sido un placer atenderle. Nuestro equipo técnico está a su disposición. Que tenga un excelente día.")
+)
+FAREWELL = twiml.DIEGO_XFAST.prompt("Perfecto, ha sido un placer atenderle. Nuestro equipo técnico se encargará de todo. Que tenga un excelente día.")
+# Un saludo por franja horaria, ya renderizado
+GREETING_TWIML = {
+    greeting: twiml.document(
+        twiml.DIEGO_XFAST.prompt(f"{greeting}, gracias por llamar a AutoServicios Pro. Soy Javier, su especialista en servicios automotrices. ¿En qué puedo asistirle hoy?"),
+        twiml.gather(input='speech', action='/speech', method='POST', timeout=10, speechTimeout=5, language='es-AR'),
+        twiml.DIEGO_XFAST.prompt("No pude escucharte claramente. Por favor deja un mensaje detallado con su nombre, teléfono y el servicio que necesita."),
+        VOICEMAIL,
+        twiml.DIEGO_XFAST.prompt("Gracias por su mensaje. Nuestro equipo técnico le contactará a la brevedad."),
+    )
+    for greeting in ("Buenos días", "Buenas tardes")
+}
+LEAVE_MESSAGE_TWIML = twiml.document(
+    twiml.DIEGO.prompt("Perfecto, puedes dejar tu mensaje después del tono."), VOICEMAIL,
+    twiml.DIEGO.prompt("Gracias por tu mensaje. Javier te contactará pronto."))
+INVALID_OPTION_TWIML = twiml.document(
+    twiml.DIEGO.prompt("Opción no válida. Te transfiero al buzón de voz."), VOICEMAIL,
+    twiml.DIEGO.prompt("Gracias por tu mensaje."))
+RECORDING_THANKS_TWIML = twiml.document(twiml.DIEGO.prompt("Gracias por tu mensaje. Javier te contactará pronto."))
+
+
 class WebhookHandler(http.server.BaseHTTPRequestHandler):
     def __init__(self, *args, **kwargs):
         self.openai_api_key = os.getenv('OPENAI_API_KEY', '')
@@ -14,11 +55,13 @@ class WebhookHandler(http.server.BaseHTTPRequestHandler):
         self.twilio_auth_token = os.getenv('TWILIO_AUTH_TOKEN', '')
         self.twilio_phone_number = os.getenv('TWILIO_PHONE_NUMBER', '')
         self.owner_phone_number = os.getenv('OWNER_PHONE_NUMBER', '')
-        self.conversation_notes = []
+        self.openai_base_url = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com')
+        self.call_sid = ""
+        self.caller = ""
         super().__init__(*args, **kwargs)
     
-    def get_ai_response(self, user_message, call_context=""):
-        """Obtener respuesta de OpenAI"""
+    def get_ai_response(self, user_message, call_context="", cacheable=False):
+        """Obtener respuesta de OpenAI; cacheable=True para instrucciones fijas (se responden desde la caché)"""
         if not self.openai_api_key:
             return "Lo siento, no tengo acceso a la inteligencia artificial en este momento."
         
@@ -61,16 +104,25 @@ Responde solo lo que dirías, sin explicaciones:"""
                 "temperature": 0.5
             }
             
-            response = requests.post(
-                'https://api.openai.com/v1/chat/completions',
-                headers=headers,
-                json=data,
-                timeout=5
-            )
+            cache_key = (response_cache.make_key('openai', data['model'], None, data['messages'], data.get('temperature'))
+                         if cacheable else None)
+            cached = response_cache.cache.lookup(cache_key)
+            if cached is not None:
+                return cached
+            
+            with metrics.span('llm', provider='openai'):
+                response = http_client.post(
+                    f'{self.openai_base_url}/v1/chat/completions',
+                    headers=headers,
+                    json=data,
+                    timeout=5
+                )
             
             if response.status_code == 200:
                 result = response.json()
-                return result['choices'][0]['message']['content'].strip()
+                answer = result['choices'][0]['message']['content'].strip()
+                response_cache.cache.store(cache_key, answer)
+                return answer
             else:
                 print(f"❌ OpenAI API Error: {response.status_code} - {response.text}")
                 return "Lo siento, hay un problema técnico. ¿Podrías intentar de nuevo?"
@@ -79,51 +131,28 @@ Responde solo lo que dirías, sin explicaciones:"""
             print(f"❌ Error calling OpenAI: {e}")
             return "Lo siento, no puedo procesar tu solicitud en este momento."
     
+    @property
+    def conversation_notes(self):
+        """Notas de la llamada actual (persisten entre peticiones vía call_store)"""
+        return call_store.load_session(self.call_sid)["turns"]
+
     def add_conversation_note(self, user_message, ai_response):
         """Agregar nota de la conversación"""
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        note = {
-            "timestamp": timestamp,
-            "user": user_message,
-            "ai": ai_response
-        }
-        self.conversation_notes.append(note)
+        note = call_store.append_turn(self.call_sid, user_message, ai_response, timestamp, caller=self.caller)
         print(f"📝 Added note: {note}")
     
     def send_sms_summary(self, phone_number):
-        """Enviar resumen por SMS"""
-        if not all([self.twilio_account_sid, self.twilio_auth_token, self.twilio_phone_number]):
-            print("❌ Twilio credentials not configured")
-            return
-        
+        """Encolar el resumen por SMS; el despachador lo envía fuera del request"""
         if not self.conversation_notes:
             print("❌ No conversation notes to send")
             return
         
-        # Crear resumen
-        summary = "📞 Call Summary:\n\n"
-        for note in self.conversation_notes:
-            summary += f"⏰ {note['timestamp']}\n"
-            summary += f"👤 User: {note['user']}\n"
-            summary += f"🤖 AI: {note['ai']}\n\n"
-        
-        # Enviar SMS
-        try:
-            url = f"https://api.twilio.com/2010-04-01/Accounts/{self.twilio_account_sid}/Messages.json"
-            auth = (self.twilio_account_sid, self.twilio_auth_token)
-            data = {
-                'From': self.twilio_phone_number,
-                'To': phone_number,
-                'Body': summary
-            }
-            
-            response = requests.post(url, auth=auth, data=data)
-            if response.status_code == 201:
-                print(f"✅ SMS sent to {phone_number}")
-            else:
-                print(f"❌ SMS failed: {response.status_code} - {response.text}")
-        except Exception as e:
-            print(f"❌ Error sending SMS: {e}")
+        summary = notifications.format_summary(self.conversation_notes)
+        if notifications.notify(phone_number, summary, sinks=('sms',)):
+            print(f"📨 SMS summary queued for {phone_number}")
+        else:
+            print("❌ Twilio credentials not configured")
     
     def do_POST(self):
         try:
@@ -131,12 +160,17 @@ Responde solo lo que dirías, sin explicaciones:"""
             content_length = int(self.headers.get('Content-Length', 0))
             post_data = self.rfile.read(content_length)
             
-            print(f"📞 Received webhook: {post_data.decode('utf-8')}")
-            print(f"📞 Headers: {dict(self.headers)}")
+            print(f"📞 Webhook {self.path} ({content_length} bytes)")
             
             # Parsear los parámetros
-            params = urllib.parse.parse_qs(post_data.decode('utf-8'))
-            print(f"📞 Parsed params: {params}")
+            with metrics.span('parse'):
+                params = urllib.parse.parse_qs(post_data.decode('utf-8'))
+            
+            # El estado de la llamada se guarda por CallSid, no en el handler
+            self.call_sid = params.get('CallSid', [''])[0]
+            self.caller = params.get('From', [''])[0]
+            if params.get('CallStatus', [''])[0] in call_store.ENDED_STATUSES:
+                call_store.end_call(self.call_sid)
             
             # Verificar si es una grabación
             if self.path == '/recording':
@@ -158,29 +192,18 @@ Responde solo lo que dirías, sin explicaciones:"""
                 error_code = params['ErrorCode'][0]
                 print(f"⚠️ Twilio Error Code: {error_code}")
             
+            call_store.start_call(self.call_sid, self.caller)
+            
             # Conversación natural en español
             # Detectar hora para saludo apropiado
             import datetime
             current_hour = datetime.datetime.now().hour
             greeting = "Buenos días" if current_hour < 12 else "Buenas tardes"
-        
-        twiml_response = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="diego" language="es-AR" rate="x-fast">{greeting}, gracias por llamar a AutoServicios Pro. Soy Javier, su especialista en servicios automotrices. ¿En qué puedo asistirle hoy?</Say>
-    <Gather input="speech" action="/speech" method="POST" timeout="10" speechTimeout="5" language="es-AR">
-    </Gather>
-    <Say voice="diego" language="es-AR" rate="x-fast">No pude escucharte claramente. Por favor deja un mensaje detallado con su nombre, teléfono y el servicio que necesita.</Say>
-    <Record maxLength="60" action="/recording" method="POST" />
-    <Say voice="diego" language="es-AR" rate="x-fast">Gracias por su mensaje. Nuestro equipo técnico le contactará a la brevedad.</Say>
-</Response>"""
+            
+            twiml_response = GREETING_TWIML[greeting]
             
             # Enviar respuesta con headers correctos
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/xml; charset=utf-8')
-            self.send_header('Content-Length', str(len(twiml_response.encode('utf-8'))))
-            self.send_header('Cache-Control', 'no-cache')
-            self.end_headers()
-            self.wfile.write(twiml_response.encode('utf-8'))
+            twiml.send(self, twiml_response)
             
             print("✅ Sent TwiML response")
         except Exception as e:
@@ -199,7 +222,7 @@ Responde solo lo que dirías, sin explicaciones:"""
     def handle_gather(self, data):
         """Manejar selección del menú"""
         try:
-            print(f"🔢 Received gather: {data.decode('utf-8')}")
+            print(f"🔢 Received gather for call {self.call_sid}")
             
             # Parsear los parámetros
             params = urllib.parse.parse_qs(data.decode('utf-8'))
@@ -209,41 +232,18 @@ Responde solo lo que dirías, sin explicaciones:"""
             
             if digits == '1':
                 # Hablar con IA
-                ai_response = self.get_ai_response("Usuario quiere hablar directamente", "Conversación en vivo")
+                ai_response = self.get_ai_response("Usuario quiere hablar directamente", "Conversación en vivo",
+                                                   cacheable=True)
                 
-                twiml_response = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="diego" language="es-AR">Perfecto, estoy aquí para ayudarte. {ai_response}</Say>
-    <Gather input="speech" action="/speech" method="POST" timeout="20" speechTimeout="auto" language="es-AR" enhanced="true">
-        <Say voice="diego" language="es-AR">Dime, ¿en qué puedo ayudarte?</Say>
-    </Gather>
-    <Say voice="diego" language="es-AR">No escuché tu respuesta. Te transfiero al buzón de voz.</Say>
-    <Record maxLength="60" action="/recording" method="POST" />
-    <Say voice="diego" language="es-AR">Gracias por tu mensaje.</Say>
-</Response>"""
+                twiml_response = twiml.document(twiml.DIEGO.say(f"Perfecto, estoy aquí para ayudarte. {ai_response}"), TALK_LISTEN)
             elif digits == '2':
                 # Dejar mensaje
-                twiml_response = """<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="diego" language="es-AR">Perfecto, puedes dejar tu mensaje después del tono.</Say>
-    <Record maxLength="60" action="/recording" method="POST" />
-    <Say voice="diego" language="es-AR">Gracias por tu mensaje. Javier te contactará pronto.</Say>
-</Response>"""
+                twiml_response = LEAVE_MESSAGE_TWIML
             else:
                 # Opción inválida
-                twiml_response = """<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="diego" language="es-AR">Opción no válida. Te transfiero al buzón de voz.</Say>
-    <Record maxLength="60" action="/recording" method="POST" />
-    <Say voice="diego" language="es-AR">Gracias por tu mensaje.</Say>
-</Response>"""
-            
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/xml; charset=utf-8')
-            self.send_header('Content-Length', str(len(twiml_response.encode('utf-8'))))
-            self.send_header('Cache-Control', 'no-cache')
-            self.end_headers()
-            self.wfile.write(twiml_response.encode('utf-8'))
+                twiml_response = INVALID_OPTION_TWIML
+            
+            twiml.send(self, twiml_response)
             
             print("✅ Gather processed successfully")
         except Exception as e:
@@ -254,7 +254,7 @@ Responde solo lo que dirías, sin explicaciones:"""
     def handle_speech(self, data):
         """Manejar reconocimiento de voz"""
         try:
-            print(f"🗣️ Received speech: {data.decode('utf-8')}")
+            print(f"🗣️ Received speech for call {self.call_sid}")
             
             # Parsear los parámetros
             params = urllib.parse.parse_qs(data.decode('utf-8'))
@@ -267,17 +267,12 @@ Responde solo lo que dirías, sin explicaciones:"""
             print(f"🗣️ SpeechResult: {params.get('SpeechResult', [''])[0]}")
             print(f"🗣️ UnstableSpeechResult: {params.get('UnstableSpeechResult', [''])[0]}")
             print(f"🗣️ Final speech_result: {speech_result}")
-            print(f"🗣️ All params: {params}")
             
             # Si aún no hay speech_result, usar un mensaje por defecto
             if not speech_result:
                 speech_result = "Hola, necesito ayuda"
                 print(f"🗣️ Using default message: {speech_result}")
             
-            # Debug: mostrar exactamente qué está pasando
-            print(f"🔍 DEBUG: speech_result = '{speech_result}'")
-            print(f"🔍 DEBUG: speech_result type = {type(speech_result)}")
-            print(f"🔍 DEBUG: speech_result length = {len(speech_result) if speech_result else 0}")
             
             # Asegurar que speech_result no esté vacío
             if not speech_result or speech_result.strip() == "":
@@ -291,38 +286,24 @@ Responde solo lo que dirías, sin explicaciones:"""
             
             print(f"🎯 FINAL speech_result: '{speech_result}'")
             
-            # Obtener respuesta de IA
-            ai_response = self.get_ai_response(speech_result, "Conversación en vivo")
+            # Preguntas frecuentes aprobadas se responden sin llamar a OpenAI
+            ai_response = semantic_cache.lookup(speech_result) or self.get_ai_response(speech_result, "Conversación en vivo")
             
             # Agregar nota de la conversación
             self.add_conversation_note(speech_result, ai_response)
             
             # Si el usuario dice "bye" o "goodbye", enviar SMS y terminar
-            if any(word in speech_result.lower() for word in ['bye', 'goodbye', 'thanks', 'thank you', 'see you', 'chau', 'adiós', 'gracias', 'hasta luego', 'eso es todo', 'nada más', 'no hay más', 'ya está', 'listo', 'terminado']):
+            if intents.is_end_of_conversation(speech_result):
                 # Enviar SMS con resumen
                 if self.owner_phone_number:
                     self.send_sms_summary(self.owner_phone_number)
+                call_store.end_call(self.call_sid)
                 
-                twiml_response = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="diego" language="es-AR" rate="x-fast">{ai_response}</Say>
-    <Say voice="diego" language="es-AR" rate="x-fast">Perfecto, ha sido un placer atenderle. Nuestro equipo técnico se encargará de todo. Que tenga un excelente día.</Say>
-</Response>"""
+                twiml_response = twiml.document(twiml.DIEGO_XFAST.say(ai_response), FAREWELL)
             else:
-                twiml_response = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="diego" language="es-AR" rate="x-fast">{ai_response}</Say>
-    <Gather input="speech" action="/speech" method="POST" timeout="12" speechTimeout="6" language="es-AR">
-    </Gather>
-    <Say voice="diego" language="es-AR" rate="x-fast">Ha sido un placer atenderle. Nuestro equipo técnico está a su disposición. Que tenga un excelente día.</Say>
-</Response>"""
-            
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/xml; charset=utf-8')
-            self.send_header('Content-Length', str(len(twiml_response.encode('utf-8'))))
-            self.send_header('Cache-Control', 'no-cache')
-            self.end_headers()
-            self.wfile.write(twiml_response.encode('utf-8'))
+                twiml_response = twiml.document(twiml.DIEGO_XFAST.say(ai_response), LISTEN_AGAIN)
+            
+            twiml.send(self, twiml_response)
             
             print("✅ Speech processed successfully")
         except Exception as e:
@@ -333,25 +314,15 @@ Responde solo lo que dirías, sin explicaciones:"""
     def handle_recording(self, data):
         """Manejar grabaciones de voz"""
         try:
-            print(f"🎙️ Received recording: {data.decode('utf-8')}")
-            print(f"🎙️ Headers: {dict(self.headers)}")
+            print(f"🎙️ Received recording for call {self.call_sid}")
             
             # Parsear los parámetros de la grabación
             params = urllib.parse.parse_qs(data.decode('utf-8'))
-            print(f"🎙️ Recording params: {params}")
             
             # Respuesta de confirmación
-            twiml_response = """<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="diego" language="es-AR">Gracias por tu mensaje. Javier te contactará pronto.</Say>
-</Response>"""
-            
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/xml; charset=utf-8')
-            self.send_header('Content-Length', str(len(twiml_response.encode('utf-8'))))
-            self.send_header('Cache-Control', 'no-cache')
-            self.end_headers()
-            self.wfile.write(twiml_response.encode('utf-8'))
+            twiml_response = RECORDING_THANKS_TWIML
+            
+            twiml.send(self, twiml_response)
             
             print("✅ Recording processed successfully")
         except Exception as e:
@@ -361,6 +332,4 @@ Responde solo lo que dirías, sin explicaciones:"""
 
 if __name__ == "__main__":
     PORT = 8096
-    with socketserver.TCPServer(("", PORT), WebhookHandler) as httpd:
-        print(f"🚀 Server running on port {PORT}")
-        httpd.serve_forever()
+    serving.serve(WebhookHandler, PORT)
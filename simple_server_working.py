@@ -5,52 +5,27 @@ Handles incoming calls and provides AI-powered responses
 """
 
 import http.server
-import socketserver
+import serving
+import twiml
+import metrics
 import urllib.parse
 import json
 import os
-import requests
+import call_store
+import http_client
+import intents
+import notifications
+import prompt_audio
+import llm_stream
+import response_cache
+import semantic_cache
+import slots
+import speculation
 import datetime
+import time
+import conversation_context
 
-class WebhookHandler(http.server.BaseHTTPRequestHandler):
-    def __init__(self, *args, **kwargs):
-        # Load environment variables
-        self.openai_api_key = os.getenv('OPENAI_API_KEY')
-        self.twilio_account_sid = os.getenv('TWILIO_ACCOUNT_SID')
-        self.twilio_auth_token = os.getenv('TWILIO_AUTH_TOKEN')
-        self.twilio_phone_number = os.getenv('TWILIO_PHONE_NUMBER')
-        self.owner_phone_number = os.getenv('OWNER_PHONE_NUMBER')
-        self.conversation_notes = []
-        super().__init__(*args, **kwargs)
-
-    def get_ai_response(self, user_message, call_context=""):
-        """Obtener respuesta de OpenAI"""
-        if not self.openai_api_key:
-            return "Lo siento, no tengo acceso a la inteligencia artificial en este momento."
-        
-        try:
-            headers = {
-                'Authorization': f'Bearer {self.openai_api_key}',
-                'Content-Type': 'application/json'
-            }
-            
-            # Detectar hora actual para saludo apropiado (zona horaria del usuario)
-            import pytz
-            # Zona horaria de Argentina (Buenos Aires)
-            argentina_tz = pytz.timezone('America/Argentina/Buenos_Aires')
-            current_time = datetime.datetime.now(argentina_tz)
-            current_hour = current_time.hour
-            
-            if current_hour < 12:
-                greeting = "Buenos días"
-            elif current_hour < 18:
-                greeting = "Buenas tardes"
-            else:
-                greeting = "Buenas noches"
-            
-            prompt = f"""Eres Lindy, el mejor agente de voz de IA. Súper inteligente, empático y eficiente.
-
-Usuario dijo: {user_message}
+LINDY_SYSTEM_PROMPT = """Eres Lindy, el mejor agente de voz de IA. Súper inteligente, empático y eficiente.
 
 ANÁLISIS INTELIGENTE:
 1. ¿Tiene NOMBRE? (Juan, María, Carlos, etc.)
@@ -77,143 +52,188 @@ EJEMPLOS:
 - "Eso es todo" → "Perfecto, he tomado nota de todo. Javier se pondrá en contacto contigo pronto. ¡Que tengas un excelente día!"
 
 ANALIZA EL MENSAJE DEL USUARIO Y RESPONDE SEGÚN LAS REGLAS:"""
-            
-            data = {
-                "model": "gpt-3.5-turbo",
-                "messages": [{"role": "user", "content": prompt}],
-                "max_tokens": 50,
-                "temperature": 0.1,
-                "top_p": 0.9,
-                "frequency_penalty": 0.1,
-                "presence_penalty": 0.1
-            }
-            
-            response = requests.post(
-                'https://api.openai.com/v1/chat/completions',
-                headers=headers,
-                json=data,
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result['choices'][0]['message']['content'].strip()
-            else:
-                print(f"❌ OpenAI API Error: {response.status_code} - {response.text}")
-                return "Lo siento, hay un problema técnico. ¿Podrías intentar de nuevo?"
-                
+
+# Fragmentos TwiML fijos, codificados una sola vez al importar
+# Con la especulación activa Twilio envía resultados parciales a /partial mientras el llamante habla
+PARTIAL_RESULTS = dict(partialResultCallback='/partial', partialResultCallbackMethod='POST') if speculation.SPECULATION_ENABLED else {}
+LISTEN = twiml.gather(input='speech', action='/speech', method='POST', timeout=15, speechTimeout=8, language='es-AR',
+                      **PARTIAL_RESULTS)
+LISTEN_AGAIN = LISTEN + twiml.LUPE.prompt("No pude escucharte bien. Por favor, repite tu mensaje o di 'eso es todo' si ya terminaste.")
+FAREWELL = twiml.LUPE.prompt(slots.GOODBYE_REPLY)
+GREETING_TWIML = twiml.document(
+    twiml.LUPE.prompt("Hola, soy Lindy, tu asistente de voz inteligente. ¿En qué puedo ayudarte hoy?"),
+    LISTEN,
+    twiml.LUPE.prompt("No pude escucharte claramente. Por favor deja un mensaje detallado con su nombre, teléfono y el motivo de su llamada."),
+    twiml.record(maxLength=60, action='/recording', method='POST'),
+    twiml.LUPE.prompt("Gracias por su mensaje. Javier le contactará a la brevedad."),
+)
+
+class OpenAIError(Exception):
+    """OpenAI no respondió con una respuesta utilizable"""
+
+
+class WebhookHandler(http.server.BaseHTTPRequestHandler):
+    def __init__(self, *args, **kwargs):
+        # Load environment variables
+        self.openai_api_key = os.getenv('OPENAI_API_KEY')
+        self.twilio_account_sid = os.getenv('TWILIO_ACCOUNT_SID')
+        self.twilio_auth_token = os.getenv('TWILIO_AUTH_TOKEN')
+        self.twilio_phone_number = os.getenv('TWILIO_PHONE_NUMBER')
+        self.owner_phone_number = os.getenv('OWNER_PHONE_NUMBER')
+        self.openai_base_url = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com')
+        self.call_sid = ""
+        self.caller = ""
+        super().__init__(*args, **kwargs)
+
+    def build_ai_request(self, user_message):
+        """Construir el cuerpo de la petición a OpenAI con el historial de la llamada"""
+        session = call_store.load_session(self.call_sid)
+        system, messages, updates = conversation_context.build_context(LINDY_SYSTEM_PROMPT, session, user_message)
+        if updates and self.call_sid:
+            call_store.update_session(self.call_sid, **updates)
+        
+        data = {
+            "model": "gpt-3.5-turbo",
+            "messages": [{"role": "system", "content": system}] + messages,
+            "max_tokens": 50,
+            "temperature": 0.1,
+            "top_p": 0.9,
+            "frequency_penalty": 0.1,
+            "presence_penalty": 0.1
+        }
+        return data
+
+    def get_ai_response(self, user_message, call_context=""):
+        """Obtener respuesta de OpenAI"""
+        if not self.openai_api_key:
+            return "Lo siento, no tengo acceso a la inteligencia artificial en este momento."
+        
+        try:
+            return self.request_ai_response(user_message)
+        except OpenAIError as e:
+            print(f"❌ OpenAI API Error: {e}")
+            return "Lo siento, hay un problema técnico. ¿Podrías intentar de nuevo?"
         except Exception as e:
             print(f"❌ Error getting AI response: {e}")
             # Respuesta más natural cuando hay problemas técnicos
             return "Disculpa, no pude procesar tu mensaje. ¿Podrías repetir tu información?"
 
+    def request_ai_response(self, user_message, cacheable=False):
+        """Pedir la respuesta a OpenAI; los errores se lanzan (las respuestas adelantadas no deben disculparse)
+
+        Solo las instrucciones fijas (cacheable=True) se responden desde la caché; los turnos de la llamada no.
+        """
+        if not self.openai_api_key:
+            raise OpenAIError("OPENAI_API_KEY is not set")
+        
+        headers = {
+            'Authorization': f'Bearer {self.openai_api_key}',
+            'Content-Type': 'application/json'
+        }
+        
+        data = self.build_ai_request(user_message)
+        
+        cache_key = (response_cache.make_key('openai', data['model'], None, data['messages'], data.get('temperature'))
+                     if cacheable else None)
+        cached = response_cache.cache.lookup(cache_key)
+        if cached is not None:
+            return cached
+        
+        with metrics.span('llm', provider='openai'):
+            response = http_client.post(
+                f'{self.openai_base_url}/v1/chat/completions',
+                headers=headers,
+                json=data,
+                timeout=10
+            )
+        
+        if response.status_code != 200:
+            raise OpenAIError(f"{response.status_code} - {response.text}")
+        result = response.json()
+        answer = result['choices'][0]['message']['content'].strip()
+        response_cache.cache.store(cache_key, answer)
+        return answer
+
+    def stream_ai_response(self, user_message):
+        """Obtener respuesta de OpenAI en streaming (fragmentos de texto)"""
+        if not self.openai_api_key:
+            return iter(["Lo siento, no tengo acceso a la inteligencia artificial en este momento."])
+        return llm_stream.stream_openai(f'{self.openai_base_url}/v1/chat/completions',
+                                        self.openai_api_key, self.build_ai_request(user_message))
+
+    @property
+    def conversation_notes(self):
+        """Notas de la llamada actual (persisten entre peticiones vía call_store)"""
+        return call_store.load_session(self.call_sid)["turns"]
+
     def add_conversation_note(self, user_message, ai_response):
         """Agregar nota de la conversación"""
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        note = {
-            "timestamp": timestamp,
-            "user": user_message,
-            "ai": ai_response
-        }
-        self.conversation_notes.append(note)
+        note = call_store.append_turn(self.call_sid, user_message, ai_response, timestamp, caller=self.caller)
         print(f"📝 Added note: {note}")
 
     def send_sms_summary(self, phone_number):
-        """Enviar resumen por SMS"""
-        print(f"📱 Attempting to send SMS to {phone_number}")
-        print(f"📱 Twilio credentials check:")
-        print(f"📱 Account SID: {self.twilio_account_sid}")
-        print(f"📱 Auth Token: {self.twilio_auth_token[:10]}...")
-        print(f"📱 Phone Number: {self.twilio_phone_number}")
-        print(f"📱 Conversation notes count: {len(self.conversation_notes)}")
-        
-        if not all([self.twilio_account_sid, self.twilio_auth_token, self.twilio_phone_number]):
-            print("❌ Twilio credentials not configured")
-            return
-
+        """Encolar el resumen por SMS; el despachador lo envía fuera del request"""
         if not self.conversation_notes:
             print("❌ No conversation notes to send")
             return
-
-        # Crear resumen
-        summary = "📞 Call Summary:\n\n"
-        for note in self.conversation_notes:
-            summary += f"⏰ {note['timestamp']}\n"
-            summary += f"👤 User: {note['user']}\n"
-            summary += f"🤖 AI: {note['ai']}\n\n"
-
-        print(f"📱 SMS Summary: {summary}")
-
-        # Enviar SMS
-        try:
-            url = f"https://api.twilio.com/2010-04-01/Accounts/{self.twilio_account_sid}/Messages.json"
-            auth = (self.twilio_account_sid, self.twilio_auth_token)
-            data = {
-                'From': self.twilio_phone_number,
-                'To': phone_number,
-                'Body': summary
-            }
-            
-            print(f"📱 Sending SMS to {phone_number} from {self.twilio_phone_number}")
-            print(f"📱 SMS URL: {url}")
-            print(f"📱 SMS Data: {data}")
-
-            response = requests.post(url, auth=auth, data=data)
-            print(f"📱 SMS Response Status: {response.status_code}")
-            print(f"📱 SMS Response Text: {response.text}")
-            
-            if response.status_code == 201:
-                print(f"✅ SMS sent to {phone_number}")
-            else:
-                print(f"❌ SMS failed: {response.status_code} - {response.text}")
-        except Exception as e:
-            print(f"❌ Error sending SMS: {e}")
+        
+        summary = notifications.format_summary(self.conversation_notes)
+        if notifications.notify(phone_number, summary, sinks=('sms',)):
+            print(f"📨 SMS summary queued for {phone_number}")
+        else:
+            print("❌ Twilio credentials not configured")
 
     def send_email_summary(self):
-        """Send email summary of the conversation"""
-        try:
-            print("📧 Attempting to send email summary")
-            
-            # Create summary
-            summary = "📞 Call Summary:\n\n"
-            for note in self.conversation_notes:
-                summary += f"⏰ {note['timestamp']}\n"
-                summary += f"👤 User: {note['user']}\n"
-                summary += f"🤖 AI: {note['ai']}\n\n"
-            
-            print(f"📧 Email Summary: {summary}")
-            print("📧 Email notification logged (implement email service as needed)")
-            
-            # TODO: Implement actual email sending
-            # For now, just log the summary
-            with open("call_summaries.txt", "a", encoding="utf-8") as f:
-                f.write(f"\n=== NEW CALL SUMMARY ===\n{summary}\n")
-            
-            print("✅ Email summary saved to call_summaries.txt")
-                
-        except Exception as e:
-            print(f"❌ Error sending email: {e}")
-            import traceback
-            traceback.print_exc()
+        """Queue the conversation summary for e-mail (or call_summaries.txt) delivery"""
+        summary = notifications.format_summary(self.conversation_notes)
+        if notifications.notify(self.owner_phone_number, summary, sinks=('email', 'file')):
+            print("📧 Email summary queued")
+        else:
+            print("❌ No email or file notification sink configured")
+
+    def health(self):
+        """Contadores que GET /metrics publica como gauges"""
+        return {
+            "http_pool": http_client.pool_stats(),
+            "streaming": llm_stream.stream_stats(),
+            "context": conversation_context.context_stats(),
+            "response_cache": response_cache.cache_stats(),
+            "semantic_cache": semantic_cache.cache_stats(),
+            "notifications": notifications.notification_stats(),
+            "slots": slots.slot_stats(),
+            "prompt_audio": prompt_audio.prompt_stats(),
+            "speculation": speculation.speculation_stats(),
+        }
 
     def do_POST(self):
         """Handle POST requests from Twilio"""
         content_length = int(self.headers['Content-Length'])
         post_data = self.rfile.read(content_length)
         
-        print(f"📞 Received webhook: {post_data.decode('utf-8')}")
-        print(f"📞 Headers: {dict(self.headers)}")
+        print(f"📞 Webhook {self.path} ({content_length} bytes)")
         
         # Parse parameters
-        params = urllib.parse.parse_qs(post_data.decode('utf-8'))
-        print(f"📞 Parsed params: {params}")
+        with metrics.span('parse'):
+            params = urllib.parse.parse_qs(post_data.decode('utf-8'))
+        
+        # El estado de la llamada se guarda por CallSid, no en el handler
+        self.call_sid = params.get('CallSid', [''])[0]
+        self.caller = params.get('From', [''])[0]
+        if params.get('CallStatus', [''])[0] in call_store.ENDED_STATUSES:
+            call_store.end_call(self.call_sid)
+            speculation.discard(self.call_sid)
         
         if self.path == '/':
             self.handle_initial_call(params)
         elif self.path == '/speech':
             self.handle_speech(post_data)
+        elif self.path == '/partial':
+            self.handle_partial(params)
         elif self.path == '/recording':
             self.handle_recording(params)
+        elif self.path.startswith('/continue'):
+            self.handle_continue()
         else:
             self.send_response(404)
             self.end_headers()
@@ -239,29 +259,31 @@ ANALIZA EL MENSAJE DEL USUARIO Y RESPONDE SEGÚN LAS REGLAS:"""
         else:
             greeting = "Buenas noches"
         
-        twiml_response = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="Polly.Lupe" language="es-ES" rate="fast">Hola, soy Lindy, tu asistente de voz inteligente. ¿En qué puedo ayudarte hoy?</Say>
-    <Gather input="speech" action="/speech" method="POST" timeout="15" speechTimeout="8" language="es-AR">
-    </Gather>
-    <Say voice="Polly.Lupe" language="es-ES" rate="fast">No pude escucharte claramente. Por favor deja un mensaje detallado con su nombre, teléfono y el motivo de su llamada.</Say>
-    <Record maxLength="60" action="/recording" method="POST" />
-    <Say voice="Polly.Lupe" language="es-ES" rate="fast">Gracias por su mensaje. Javier le contactará a la brevedad.</Say>
-</Response>"""
+        call_store.start_call(self.call_sid, self.caller)
         
         # Enviar respuesta con headers correctos
+        twiml.send(self, GREETING_TWIML)
+        print("✅ Sent TwiML response")
+
+    def handle_partial(self, params):
+        """Resultado parcial del <Gather>: adelantar la respuesta de OpenAI mientras el llamante sigue hablando"""
+        # Twilio marca como estable la parte del texto que ya no va a cambiar
+        text = params.get('StableSpeechResult', [''])[0]
+        stability = None
+        if not text:
+            text = params.get('UnstableSpeechResult', [''])[0]
+            stability = float(params.get('Stability', ['0'])[0] or 0)
+        sequence = params.get('SequenceNumber', [''])[0]
+        speculation.partial(self.call_sid, text, stability, int(sequence) if sequence.isdigit() else None,
+                            compute=self.request_ai_response)
         self.send_response(200)
-        self.send_header('Content-Type', 'text/xml; charset=utf-8')
-        self.send_header('Content-Length', str(len(twiml_response.encode('utf-8'))))
-        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Content-Length', '0')
         self.end_headers()
-        self.wfile.write(twiml_response.encode('utf-8'))
-        print("✅ Sent TwiML response")
 
     def handle_speech(self, data):
         """Handle speech input"""
         try:
-            print(f"🗣️ Received speech: {data.decode('utf-8')}")
+            print(f"🗣️ Received speech for call {self.call_sid}")
             
             # Parsear los parámetros
             params = urllib.parse.parse_qs(data.decode('utf-8'))
@@ -274,17 +296,12 @@ ANALIZA EL MENSAJE DEL USUARIO Y RESPONDE SEGÚN LAS REGLAS:"""
             print(f"🗣️ SpeechResult: {params.get('SpeechResult', [''])[0]}")
             print(f"🗣️ UnstableSpeechResult: {params.get('UnstableSpeechResult', [''])[0]}")
             print(f"🗣️ Final speech_result: {speech_result}")
-            print(f"🗣️ All params: {params}")
             
             # Si aún no hay speech_result, usar un mensaje por defecto
             if not speech_result:
                 speech_result = "Hola, necesito ayuda"
                 print(f"🗣️ Using default message: {speech_result}")
             
-            # Debug: mostrar exactamente qué está pasando
-            print(f"🔍 DEBUG: speech_result = '{speech_result}'")
-            print(f"🔍 DEBUG: speech_result type = {type(speech_result)}")
-            print(f"🔍 DEBUG: speech_result length = {len(speech_result) if speech_result else 0}")
             
             # Asegurar que speech_result no esté vacío
             if not speech_result or speech_result.strip() == "":
@@ -293,40 +310,75 @@ ANALIZA EL MENSAJE DEL USUARIO Y RESPONDE SEGÚN LAS REGLAS:"""
             
             print(f"🎯 FINAL speech_result: '{speech_result}'")
             
-            # Obtener respuesta de IA
-            ai_response = self.get_ai_response(speech_result, "Conversación en vivo")
+            # Solo terminar si el usuario dice explícitamente que quiere terminar
+            started = time.perf_counter()
+            ends_call = intents.is_end_of_conversation(speech_result)
+            
+            # Nombre, teléfono y motivo se extraen localmente; con los tres (o una despedida)
+            # la respuesta es la plantilla de Lindy, sin llamar a OpenAI
+            filled = slots.update(self.call_sid, speech_result)
+            ai_response = slots.local_reply(filled, ends_call)
+            ends_call = ai_response is not None
+            
+            # Preguntas frecuentes aprobadas se responden sin llamar a OpenAI
+            local_answer = None if ends_call else semantic_cache.lookup(speech_result)
+            
+            # Respuesta adelantada desde un resultado parcial, si el texto final casi no cambió
+            if ai_response or local_answer:
+                speculation.discard(self.call_sid)
+                speculated = None
+            else:
+                speculated = speculation.take(self.call_sid, speech_result)
+            
+            # En modo streaming se envía la primera oración y el resto llega vía /continue
+            if ai_response:
+                source = "template"
+            elif local_answer:
+                ai_response, source = local_answer, "faq"
+            elif speculated:
+                ai_response, source = speculated, "llm"
+            elif llm_stream.STREAMING_ENABLED:
+                turn = llm_stream.start_turn(
+                    self.stream_ai_response(speech_result),
+                    fallback="Disculpa, no pude procesar tu mensaje. ¿Podrías repetir tu información?",
+                    call_sid=self.call_sid,
+                    user_message=speech_result,
+                )
+                first_sentence = turn.wait_first()
+                if first_sentence is None or not turn.done:
+                    slots.record_turn("llm", time.perf_counter() - started)
+                    self.send_streamed_first_sentence(first_sentence or "Un momento, por favor.",
+                                                      llm_stream.continue_query(turn))
+                    return
+                llm_stream.take_turn(turn.token)
+                ai_response, source = turn.full_text(), "llm"
+            else:
+                # Obtener respuesta de IA
+                ai_response, source = self.get_ai_response(speech_result, "Conversación en vivo"), "llm"
+            elapsed = time.perf_counter() - started
+            slots.record_turn(source, elapsed)
+            if source != "llm":
+                print(f"⚡ Answered locally ({source}) in {elapsed * 1000:.1f} ms, "
+                      f"{slots.slot_stats()['local_fraction']:.0%} of turns without OpenAI")
             
             # Agregar nota de la conversación
             self.add_conversation_note(speech_result, ai_response)
             
-            # Si el usuario dice "bye" o "goodbye", enviar SMS y terminar
-            # Solo terminar si el usuario dice explícitamente que quiere terminar
-            if any(word in speech_result.lower() for word in ['bye', 'goodbye', 'thanks', 'thank you', 'see you', 'chau', 'adiós', 'gracias', 'hasta luego', 'eso es todo', 'nada más', 'no hay más', 'ya está', 'listo', 'terminado', 'no necesito nada más', 'ya terminé', 'eso es', 'listo gracias', 'perfecto gracias', 'no', 'no gracias', 'no necesito', 'no hay nada más', 'no hay más', 'nada', 'ya está bien', 'perfecto', 'listo gracias', 'no más', 'no necesito más', 'eso es todo', 'eso es', 'ya terminé', 'listo', 'perfecto', 'no hay nada más', 'no necesito nada', 'ya está todo', 'terminé', 'listo gracias', 'perfecto gracias', 'no hay nada', 'no necesito nada más', 'ya está todo', 'terminé', 'listo', 'perfecto', 'no hay nada', 'no necesito nada más', 'ya está todo', 'terminé', 'listo', 'perfecto']):
+            # Despedida o mensaje completo: enviar el resumen y terminar
+            if ends_call:
                 # Enviar notificación por email en lugar de SMS
                 if self.owner_phone_number:
                     self.send_email_summary()
-                print("📧 Notificación por email enviada")
-                
-                twiml_response = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="Polly.Lupe" language="es-ES" rate="fast">{ai_response}</Say>
-    <Say voice="Polly.Lupe" language="es-ES" rate="fast">Perfecto, he tomado nota de todo. Javier se pondrá en contacto contigo pronto. ¡Que tengas un excelente día!</Say>
-</Response>"""
-            else:
-                twiml_response = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="Polly.Lupe" language="es-ES" rate="fast">{ai_response}</Say>
-    <Gather input="speech" action="/speech" method="POST" timeout="15" speechTimeout="8" language="es-AR">
-    </Gather>
-    <Say voice="Polly.Lupe" language="es-ES" rate="fast">No pude escucharte bien. Por favor, repite tu mensaje o di 'eso es todo' si ya terminaste.</Say>
-</Response>"""
+                call_store.end_call(self.call_sid)
             
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/xml; charset=utf-8')
-            self.send_header('Content-Length', str(len(twiml_response.encode('utf-8'))))
-            self.send_header('Cache-Control', 'no-cache')
-            self.end_headers()
-            self.wfile.write(twiml_response.encode('utf-8'))
+            with metrics.span('twiml'):
+                if ends_call:
+                    twiml_response = twiml.document(FAREWELL if ai_response == slots.GOODBYE_REPLY
+                                                    else twiml.LUPE.say(ai_response))
+                else:
+                    twiml_response = twiml.document(twiml.LUPE.say(ai_response), LISTEN_AGAIN)
+            
+            twiml.send(self, twiml_response)
             
             print("✅ Speech processed successfully")
         except Exception as e:
@@ -334,6 +386,32 @@ ANALIZA EL MENSAJE DEL USUARIO Y RESPONDE SEGÚN LAS REGLAS:"""
             self.send_response(500)
             self.end_headers()
 
+    def send_streamed_first_sentence(self, first_sentence, query):
+        """Enviar la primera oración y redirigir a /continue para el resto"""
+        twiml.send(self, twiml.document(twiml.LUPE.say(first_sentence), twiml.redirect(f"/continue?{query}")))
+        print("⚡ Sent first sentence, remainder via /continue")
+
+    def handle_continue(self):
+        """Enviar el resto de una respuesta en streaming"""
+        try:
+            query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+            # El resto puede haberse generado en otro worker; se espera como máximo STREAM_REST_WAIT
+            remainder = llm_stream.wait_remainder(query.get('turn', [''])[0], self.call_sid,
+                                                  whole=query.get('whole', [''])[0] == '1')
+            rest = ""
+            if remainder:
+                user_message, full_text, rest = remainder
+                self.add_conversation_note(user_message, full_text)
+            say = twiml.LUPE.say(rest) if rest else b""
+            
+            twiml.send(self, twiml.document(say, LISTEN_AGAIN))
+            
+            print("✅ Continue processed successfully")
+        except Exception as e:
+            print(f"❌ Error processing continue: {e}")
+            self.send_response(500)
+            self.end_headers()
+
     def handle_recording(self, params):
         """Handle call recording"""
         print("📹 Recording received")
@@ -342,8 +420,4 @@ ANALIZA EL MENSAJE DEL USUARIO Y RESPONDE SEGÚN LAS REGLAS:"""
 
 if __name__ == "__main__":
     PORT = 8103
-    
-    print(f"🚀 Server running on port {PORT}")
-    
-    with socketserver.TCPServer(("", PORT), WebhookHandler) as httpd:
-        httpd.serve_forever()
+    serving.serve(WebhookHandler, PORT)
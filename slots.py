@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Rule-based name / phone / reason extraction for the Lindy message-taking flow
+The Lindy prompt in simple_server_working.py only asks the model whether the
+caller gave NAME, TELEFONO and MOTIVO and then to answer from a fixed template.
+Those three slots are filled here instead: number words are turned into digits
+("ocho cero cinco cero cero cero" → 805000) before the phone regex runs, names
+come from "me llamo ..." phrases or a first-name gazetteer, and reasons from
+keyword phrases. A gazetteer name only counts when the caller leads with it
+("Juan, ...", "Pedro González"): many first names are also everyday words
+(julio, marco, tomás) or name someone else ("quiero hablar con Mario"), and a
+wrong name can complete the slots and end the call. When every slot is filled, or the caller says goodbye, the
+template answer is rendered locally and no provider is called.
+
+Slots are kept in the call session's "slots" (name / phone / reason), the same
+keys conversation_context folds into its running summary.
+"""
+
+import re
+import threading
+
+import call_store
+import extraction
+import intents
+
+REQUIRED = ("name", "phone", "reason")
+
+COMPLETE_REPLY = ("Perfecto {name}, he tomado nota de tu mensaje. Javier se pondrá en contacto contigo pronto "
+                  "al {phone}. ¡Que tengas un excelente día!")
+GOODBYE_REPLY = ("Perfecto, he tomado nota de todo. Javier se pondrá en contacto contigo pronto. "
+                 "¡Que tengas un excelente día!")
+
+# Common first names; everyday words (Rosa, Luz, Paz, Sol, Cruz...) and Javier, whom callers ask for, are left out
+FIRST_NAMES = {intents.fold(name): name for name in """
+    Adriana Agustín Agustina Alberto Alejandra Alejandro Alicia Álvaro Ana Andrea Andrés Antonio Armando Beatriz
+    Benjamín Camila Carla Carlos Carmen Carolina Catalina Cecilia Claudia Cristian Cristina Daniel Daniela David
+    Diana Diego Eduardo Elena Emilio Enrique Ernesto Esteban Eugenia Fabián Federico Felipe Fernanda Fernando
+    Florencia Francisco Gabriel Gabriela Gerardo Germán Gonzalo Graciela Guadalupe Guillermo Gustavo Héctor
+    Hernán Hugo Ignacio Inés Isabel Ismael Iván Jimena Joaquín Jorge José Josefina Juan Juana Julia Julián
+    Juliana Julio Laura Leonardo Leticia Lorena Lucas Lucía Luis Luisa Manuel Marcela Marcelo Marco Marcos
+    Margarita María Mariana Mario Marta Martín Martina Mateo Matías Mauricio Micaela Miguel Mónica Natalia
+    Nicolás Noelia Norma Omar Oscar Pablo Patricia Paula Pedro Rafael Ramiro Ramón Raúl Ricardo Roberto Rodrigo
+    Rubén Santiago Sara Sebastián Sergio Silvia Sofía Susana Teresa Tomás Valentina Valeria Verónica Vicente
+    Ximena Yolanda
+""".split()}
+
+REASONS = intents.PhraseMatcher(phrases=[
+    'me llame', 'me llamen', 'regrese la llamada', 'devuelva la llamada', 'devolver la llamada',
+    'regresar la llamada', 'se comunique', 'me contacte', 'dejar un mensaje',
+    'consulta', 'cita', 'turno', 'presupuesto', 'cotización', 'precio', 'información', 'pedido', 'factura',
+    'pago', 'reclamo', 'queja', 'urgente', 'urgencia', 'entrega', 'reparación', 'trabajo', 'proyecto',
+])
+
+# Greetings and fillers a caller may say before their name
+LEADING_FILLERS = {'hola', 'si', 'bueno', 'buenas', 'buenos', 'dias', 'tardes', 'noches', 'ok', 'eh', 'este'}
+_CLAUSE_BREAK = re.compile(r'[,.;:!?¿¡]')
+
+_lock = threading.Lock()
+_stats = {"turns": 0, "template": 0, "faq": 0, "llm": 0,
+          "template_seconds": 0.0, "faq_seconds": 0.0, "llm_seconds": 0.0}
+
+
+def find_name(message):
+    """Introduced name, else a gazetteer first name the message leads with
+
+    The name has to open the first clause past any greeting and be followed
+    by nothing but up to two capitalized words (a surname).
+    """
+    name = extraction.find_name(message)
+    if name:
+        return name
+    for clause in _CLAUSE_BREAK.split(message):
+        words = clause.split()
+        while words and intents.fold(words[0]) in LEADING_FILLERS:
+            words.pop(0)
+        if not words:
+            continue
+        first = intents.fold(words[0])
+        if first in FIRST_NAMES and len(words) <= 3 and all(word[:1].isupper() for word in words[1:]):
+            return FIRST_NAMES[first]
+        return None
+    return None
+
+
+def extract(message, slots=None):
+    """Fill name / phone / reason from message; values already known are kept"""
+    slots = dict(slots or {})
+    if not slots.get("phone"):
+        phone = extraction.parse_local(message).get("client_phone")
+        if phone:
+            slots["phone"] = phone
+    if not slots.get("name"):
+        name = find_name(message)
+        if name:
+            slots["name"] = name
+    if not slots.get("reason"):
+        reason = REASONS.match(message)
+        if reason:
+            slots["reason"] = reason
+    return slots
+
+
+def update(call_sid, message):
+    """Merge message into the call's stored slots and return them"""
+    session = call_store.load_session(call_sid)
+    slots = extract(message, session.get("slots"))
+    if call_sid and slots != session.get("slots"):
+        call_store.update_session(call_sid, slots=slots)
+    return slots
+
+
+def missing(slots):
+    return [slot for slot in REQUIRED if not slots.get(slot)]
+
+
+def local_reply(slots, ends_call=False):
+    """Template answer when the call can be closed without the LLM, else None"""
+    if ends_call:
+        return GOODBYE_REPLY
+    if not missing(slots):
+        return COMPLETE_REPLY.format(name=slots["name"], phone=slots["phone"])
+    return None
+
+
+def record_turn(source, seconds):
+    """Count a turn answered by "template", "faq" or "llm" and how long the answer took"""
+    with _lock:
+        _stats["turns"] += 1
+        _stats[source] += 1
+        _stats[f"{source}_seconds"] += seconds
+
+
+def slot_stats():
+    """Turns by answer source, fraction answered without the LLM and average latency per source"""
+    with _lock:
+        stats = dict(_stats)
+    for source in ("template", "faq", "llm"):
+        seconds = stats.pop(f"{source}_seconds")
+        stats[f"{source}_ms_avg"] = round(seconds * 1000 / stats[source], 1) if stats[source] else 0.0
+    stats["local_fraction"] = round((stats["template"] + stats["faq"]) / stats["turns"], 3) if stats["turns"] else 0.0
+    return stats
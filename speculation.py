@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Speculative LLM turns started from Twilio's partial speech results
+A speech <Gather> with partialResultCallback posts the transcript so far
+(UnstableSpeechResult, with a Stability score) while the caller is still
+talking, but the answer is normally only requested once the final SpeechResult
+arrives, after speechTimeout of silence. Here a stable enough partial starts
+the LLM request at once, on a bounded pool of threads. A later partial whose
+text differs supersedes it: a request that has not started yet is cancelled,
+one already running is left to finish and its answer is dropped. When the
+final result arrives, the speculated answer is used if the final text matches
+the speculated one closely enough (word-level similarity after folding case,
+accents and punctuation), waiting for it if it is still running; otherwise the
+turn goes to the LLM as usual.
+
+Each call keeps at most one live speculation; calls that never send a final
+result are forgotten after SPECULATION_TTL. speculation_stats() reports how
+many partials were speculated on, superseded, used (hits) or wasted (misses),
+and the LLM time the hits saved.
+
+Environment:
+    SPECULATION_ENABLED        "1" to ask Twilio for partial results and speculate on them (default 0)
+    SPECULATION_MIN_STABILITY  Stability a partial needs to be speculated on (default 0.7)
+    SPECULATION_MIN_WORDS      words a partial needs to be speculated on (default 3)
+    SPECULATION_MATCH          word similarity between final and speculated text to use the answer (default 0.9)
+    SPECULATION_WAIT           seconds a matching final result waits for a running speculation (default 10)
+    SPECULATION_WORKERS        threads running speculative requests (default 8)
+    SPECULATION_TTL            seconds an unclaimed speculation is kept (default 60)
+"""
+
+import difflib
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import intents
+import metrics
+
+SPECULATION_ENABLED = os.getenv('SPECULATION_ENABLED', '0') == '1'
+MIN_STABILITY = float(os.getenv('SPECULATION_MIN_STABILITY', 0.7))
+MIN_WORDS = int(os.getenv('SPECULATION_MIN_WORDS', 3))
+MATCH = float(os.getenv('SPECULATION_MATCH', 0.9))
+WAIT = float(os.getenv('SPECULATION_WAIT', 10))
+WORKERS = int(os.getenv('SPECULATION_WORKERS', 8))
+TTL = float(os.getenv('SPECULATION_TTL', 60))
+
+_lock = threading.Lock()
+_calls = {}
+_executor = None
+_executor_pid = None
+_stats = {"partials": 0, "speculated": 0, "superseded": 0, "cancelled": 0, "hits": 0, "misses": 0,
+          "no_speculation": 0, "timeouts": 0, "saved_seconds": 0.0}
+
+
+def _record(**deltas):
+    with _lock:
+        for key, value in deltas.items():
+            _stats[key] += value
+
+
+def _get_executor():
+    # Forked workers (SERVER_MODE=prefork) cannot use threads created in the parent
+    global _executor, _executor_pid
+    with _lock:
+        if _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(WORKERS, thread_name_prefix='speculation')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def similarity(a, b):
+    """Word-level similarity of two folded transcripts, 0..1"""
+    a, b = a.split(), b.split()
+    if not a and not b:
+        return 1.0
+    return difflib.SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+
+class Speculation:
+    """One LLM request started from a partial transcript"""
+
+    def __init__(self, text, folded, sequence, future):
+        self.text = text
+        self.folded = folded
+        self.sequence = sequence
+        self.future = future
+        self.created = time.monotonic()
+        self.finished = None
+
+    def _done(self, future):
+        self.finished = time.monotonic()
+
+
+def _supersede(speculation):
+    if speculation.future.cancel():
+        _record(cancelled=1)
+    else:
+        _record(superseded=1)
+
+
+def partial(call_sid, text, stability=None, sequence=None, compute=None):
+    """Speculate on a partial result: compute(text) runs in the background unless the same text is in flight
+
+    compute must raise when the provider fails (not return an apology), so take()
+    falls through to the normal path. Returns True when a new speculative request
+    was started.
+    """
+    _record(partials=1)
+    folded = intents.fold(text or '')
+    if not call_sid or compute is None or len(folded.split()) < MIN_WORDS:
+        return False
+    if stability is not None and stability < MIN_STABILITY:
+        return False
+    now = time.monotonic()
+    expired = []
+    # Check, supersede and reserve the slot in one step so concurrent partials cannot both win
+    with _lock:
+        for sid in [sid for sid, old in _calls.items() if now - old.created > TTL]:
+            expired.append(_calls.pop(sid))
+        current = _calls.get(call_sid)
+        # Partials can arrive out of order; the transcript only grows, so an older one is stale
+        stale = current is not None and sequence is not None and current.sequence is not None \
+            and sequence <= current.sequence
+        if stale:
+            speculation = None
+        elif current is not None and current.folded == folded:
+            current.sequence = sequence
+            speculation = None
+        else:
+            speculation = Speculation(text, folded, sequence, Future())
+            _calls[call_sid] = speculation
+    for old in expired:
+        old.future.cancel()
+    if speculation is None:
+        return False
+    if current is not None:
+        _supersede(current)
+    speculation.future.add_done_callback(speculation._done)
+    _get_executor().submit(_compute, speculation.future, compute, text)
+    _record(speculated=1)
+    print(f"🔮 Speculating on «{text}» for call {call_sid}")
+    return True
+
+
+def _compute(future, compute, text):
+    # A speculation superseded before its turn on the pool is already cancelled
+    if not future.set_running_or_notify_cancel():
+        return
+    try:
+        future.set_result(compute(text))
+    except Exception as e:
+        future.set_exception(e)
+
+
+def take(call_sid, final_text, wait=WAIT):
+    """The speculated answer for the final transcript, or None to answer it as usual"""
+    with _lock:
+        speculation = _calls.pop(call_sid, None)
+    if speculation is None:
+        _record(no_speculation=1)
+        return None
+    score = similarity(intents.fold(final_text or ''), speculation.folded)
+    if score < MATCH:
+        _supersede(speculation)
+        _record(misses=1)
+        print(f"🔮 Speculation missed ({score:.2f}): «{speculation.text}» vs «{final_text}»")
+        return None
+    arrived = time.monotonic()
+    try:
+        with metrics.span('speculation_wait'):
+            answer = speculation.future.result(timeout=wait)
+    except FutureTimeout:
+        _record(timeouts=1, misses=1)
+        return None
+    except Exception as e:
+        print(f"❌ Speculative request failed: {e}")
+        _record(misses=1)
+        return None
+    # The request would have started when the final result arrived; it had been running since created
+    finished = speculation.finished or time.monotonic()
+    saved = (finished - speculation.created) - max(0.0, finished - arrived)
+    _record(hits=1, saved_seconds=saved)
+    metrics.observe('stage_seconds', saved, stage='speculation_saved')
+    print(f"🔮 Speculation hit ({score:.2f}), saved {saved * 1000:.0f} ms")
+    return answer
+
+
+def discard(call_sid):
+    """Forget the call's speculation (call ended)"""
+    with _lock:
+        speculation = _calls.pop(call_sid, None)
+    if speculation is not None:
+        _supersede(speculation)
+
+
+def speculation_stats():
+    """Partials seen, speculations started / superseded / cancelled, hit rate and average LLM time saved per hit"""
+    with _lock:
+        stats = dict(_stats)
+        stats["in_flight"] = len(_calls)
+    saved = stats.pop("saved_seconds")
+    claimed = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / claimed, 3) if claimed else 0.0
+    stats["saved_ms_avg"] = round(saved * 1000 / stats["hits"], 1) if stats["hits"] else 0.0
+    stats["saved_ms_total"] = round(saved * 1000, 1)
+    return stats
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+TwiML builder shared by server.py, asgi_server.py and the simple_server*.py handlers
+Documents are assembled as bytes: verbs and static sentences are encoded once
+(at import, by the modules that define them), and only dynamic text such as an
+LLM answer is escaped and encoded per response. An answer containing "&" or "<"
+therefore no longer breaks the document.
+
+    GOODBYE = twiml.document(twiml.ALICE.prompt("Gracias por llamar."), twiml.HANGUP)   # bytes, built once
+    body = twiml.document(twiml.ALICE.say(ai_response), RECORD_REPLY)
+
+Static phrases use Voice.prompt(), which plays pre-synthesized audio from
+prompt_audio.py when that cache is enabled and falls back to <Say> otherwise.
+"""
+
+import prompt_audio
+
+_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;'})
+
+XML_DECLARATION = b'<?xml version="1.0" encoding="UTF-8"?>\n'
+CONTENT_TYPE = 'text/xml; charset=utf-8'
+INDENT = b'\n    '
+
+
+def escape(text):
+    """Escape text for an XML element body or a double-quoted attribute"""
+    text = str(text)
+    if '&' in text or '<' in text or '>' in text or '"' in text:
+        return text.translate(_ESCAPES)
+    return text
+
+
+def _attributes(attributes):
+    return ''.join(f' {name}="{escape(value)}"' for name, value in attributes.items() if value is not None)
+
+
+def verb(name, text=None, **attributes):
+    """One TwiML element as an indented byte fragment, e.g. verb('Pause', length=1)"""
+    attrs = _attributes(attributes)
+    if text is None:
+        tag = f"<{name}{attrs} />" if attrs else f"<{name}/>"
+        return INDENT + tag.encode('utf-8')
+    return INDENT + f"<{name}{attrs}>{escape(text)}</{name}>".encode('utf-8')
+
+
+def record(**attributes):
+    return verb('Record', **attributes)
+
+
+def pause(length=1):
+    return verb('Pause', length=length)
+
+
+def redirect(url, method='POST'):
+    return verb('Redirect', url, method=method)
+
+
+def play(url):
+    return verb('Play', url)
+
+
+def connect_stream(url, **parameters):
+    """<Connect><Stream> to a media stream websocket; parameters arrive in the stream's start message"""
+    children = b''.join(INDENT + f"<Parameter{_attributes({'name': name, 'value': value})} />".encode('utf-8')
+                        for name, value in parameters.items() if value is not None)
+    stream = INDENT + f"<Stream{_attributes({'url': url})}>".encode('utf-8') + children.replace(INDENT, INDENT + b'    ')
+    body = stream + INDENT + b'</Stream>'
+    return INDENT + b'<Connect>' + body.replace(INDENT, INDENT + b'    ') + INDENT + b'</Connect>'
+
+
+def gather(*children, **attributes):
+    """<Gather> with nested (already rendered) fragments"""
+    body = b''.join(children).replace(b'\n', INDENT)
+    return INDENT + f"<Gather{_attributes(attributes)}>".encode('utf-8') + body + INDENT + b'</Gather>'
+
+
+class Voice:
+    """<Say> with fixed voice attributes; the opening tag is encoded once"""
+
+    def __init__(self, voice, language, rate=None):
+        self.voice = voice
+        self.language = language
+        self.rate = rate
+        self._open = INDENT + f"<Say{_attributes({'voice': voice, 'language': language, 'rate': rate})}>".encode('utf-8')
+
+    def say(self, text):
+        return self._open + escape(text).encode('utf-8') + b'</Say>'
+
+    def prompt(self, text):
+        """say() for a fixed phrase: <Play> of its cached audio when prompt_audio has it, else <Say>"""
+        url = prompt_audio.url(text, self.voice, self.language, self.rate)
+        return play(url) if url else self.say(text)
+
+
+ALICE = Voice('alice', 'es-MX')
+LUPE = Voice('Polly.Lupe', 'es-ES', rate='fast')
+DIEGO = Voice('diego', 'es-AR')
+DIEGO_FAST = Voice('diego', 'es-AR', rate='fast')
+DIEGO_XFAST = Voice('diego', 'es-AR', rate='x-fast')
+
+HANGUP = verb('Hangup')
+
+
+def document(*fragments):
+    """Complete <Response> document from byte fragments"""
+    return b''.join((XML_DECLARATION, b'<Response>', *fragments, b'\n</Response>'))
+
+
+def send(handler, body, status=200):
+    """Write a TwiML document from a BaseHTTPRequestHandler"""
+    handler.send_response(status)
+    handler.send_header('Content-Type', CONTENT_TYPE)
+    handler.send_header('Content-Length', str(len(body)))
+    handler.send_header('Cache-Control', 'no-cache')
+    handler.end_headers()
+    handler.wfile.write(body)